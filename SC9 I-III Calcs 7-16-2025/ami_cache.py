@@ -0,0 +1,215 @@
+"""
+On-disk cache of AMI intervals, one directory per account and unit with one
+memory-mappable NumPy file per month.
+
+Layout::
+
+    <cache_dir>/<AccountID>/<unit>/2025-04.npy   structured array, sorted by StartDate
+    <cache_dir>/<AccountID>/<unit>/meta.json     committed months, max EndDate and AMI import id
+
+A refresh asks the fetcher only for intervals ending after the cached max
+``EndDate`` and rewrites just the months those intervals fall in. Reads map
+the month files and slice them by date without copying.
+
+The fetcher is any callable ``fetch(account_id, unit, since)`` returning a
+frame with ``StartDate``, ``EndDate`` and ``Usage``; ``since`` is None for a
+full pull. ``fetch_accconv`` is the live one, and ``frame_fetcher`` serves a
+local fixture frame for offline use and tests. Without a fetcher the cache is
+read-only.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+INTERVAL_DTYPE = np.dtype([
+    ('StartDate', 'datetime64[ns]'),
+    ('EndDate', 'datetime64[ns]'),
+    ('Usage', 'float64'),
+])
+META_FILE = 'meta.json'
+
+
+def fetch_accconv(account_id, unit, since=None):
+    '''
+    Live intervals from ``AccConv.AMIData``. That call has no date filter,
+    so newer intervals are selected here after the pull.
+    '''
+    import AccConv as ac
+
+    ami = ac.AMIData(account_id, unit)
+    if since is not None and len(ami):
+        ami = ami[pd.to_datetime(ami['EndDate']) > pd.Timestamp(since)]
+    return ami
+
+
+def frame_fetcher(ami):
+    '''Fetcher over a local AMI frame (a fixture), filtered like a live pull.'''
+    ami = ami.copy()
+    ami['StartDate'] = pd.to_datetime(ami['StartDate'])
+    ami['EndDate'] = pd.to_datetime(ami['EndDate'])
+
+    def fetch(account_id, unit, since=None):
+        rows = ami
+        if 'AccountID' in rows:
+            rows = rows[rows['AccountID'] == account_id]
+        if 'UsageUnit' in rows:
+            rows = rows[rows['UsageUnit'] == unit]
+        if since is not None:
+            rows = rows[rows['EndDate'] > pd.Timestamp(since)]
+        return rows
+
+    return fetch
+
+
+def _to_records(ami):
+    records = np.empty(len(ami), dtype=INTERVAL_DTYPE)
+    if len(ami) == 0:
+        return records
+    records['StartDate'] = pd.to_datetime(ami['StartDate']).to_numpy(dtype='datetime64[ns]')
+    records['EndDate'] = pd.to_datetime(ami['EndDate']).to_numpy(dtype='datetime64[ns]')
+    records['Usage'] = pd.to_numeric(ami['Usage']).to_numpy(dtype='float64')
+    return records[np.argsort(records['StartDate'], kind='stable')]
+
+
+def _month_key(start):
+    return np.datetime_as_string(start.astype('datetime64[M]'), unit='M')
+
+
+def _to_ns(value):
+    return None if value is None else np.datetime64(pd.Timestamp(value), 'ns')
+
+
+class AMICache:
+    """
+    AMI intervals per account and unit, cached on disk by month.
+
+    Parameters:
+    - cache_dir (str): Root directory of the cache
+    - fetch (callable, optional): ``fetch(account_id, unit, since)``; without
+      one the cache only serves what is already on disk
+    """
+
+    def __init__(self, cache_dir, fetch=None):
+        self.cache_dir = cache_dir
+        self.fetch = fetch
+
+    def _dir(self, account_id, unit):
+        return os.path.join(self.cache_dir, str(int(account_id)), unit)
+
+    def _meta(self, account_id, unit):
+        path = os.path.join(self._dir(account_id, unit), META_FILE)
+        if not os.path.exists(path):
+            return {'months': [], 'max_end': None, 'rows': 0, 'import_id': None}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _write_atomic(self, path, write):
+        with open(path + '.tmp', 'wb') as f:
+            write(f)
+        os.replace(path + '.tmp', path)
+
+    def _month_path(self, account_id, unit, month):
+        return os.path.join(self._dir(account_id, unit), f'{month}.npy')
+
+    def refresh(self, account_id, unit='KWH', full=False, latest=None, import_id=None):
+        """
+        Pull intervals ending after the cached max EndDate (everything with
+        ``full``, which also rebuilds the cache) and merge them in by month.
+        ``latest`` and ``import_id`` are the server's latest AMI EndDate and
+        newest import Id for the account (from ``GetAMIHeaders``). When the
+        cache already reaches ``latest`` under the same import, nothing is
+        fetched; a newer import that does not reach past the cache re-imported
+        intervals already cached, so the account is rebuilt.
+
+        Returns:
+        - int: Number of new intervals cached
+        """
+        if self.fetch is None:
+            raise LookupError("AMICache has no fetcher to refresh from")
+
+        import_id = None if import_id is None or pd.isna(import_id) else int(import_id)
+        if not full and latest is not None and not pd.isna(latest):
+            cached = self._meta(account_id, unit)
+            if cached['max_end'] is not None and pd.Timestamp(cached['max_end']) >= pd.Timestamp(latest):
+                if import_id is None or cached.get('import_id') == import_id:
+                    return 0
+                full = True
+
+        directory = self._dir(account_id, unit)
+        os.makedirs(directory, exist_ok=True)
+        previous_months = self._meta(account_id, unit)['months']
+        meta = {'months': [], 'max_end': None, 'rows': 0, 'import_id': None} if full else self._meta(account_id, unit)
+        if import_id is not None:
+            meta['import_id'] = import_id
+
+        since = meta['max_end']
+        new = _to_records(self.fetch(account_id, unit, since))
+        if len(new) == 0:
+            self._write_atomic(os.path.join(directory, META_FILE), lambda f: f.write(json.dumps(meta).encode()))
+            return 0
+
+        committed_end = _to_ns(since)
+        months = _month_key(new['StartDate'])
+        for month in np.unique(months):
+            rows = new[months == month]
+            if month in meta['months']:
+                old = np.load(self._month_path(account_id, unit, month))
+                # Rows past the committed max EndDate come from a refresh that
+                # never reached its meta write; this pull brings them again.
+                old = old[old['EndDate'] <= committed_end]
+                rows = np.concatenate([old, rows])
+                rows = rows[np.argsort(rows['StartDate'], kind='stable')]
+            self._write_atomic(self._month_path(account_id, unit, month), lambda f: np.save(f, rows))
+
+        meta['months'] = sorted(set(meta['months']) | set(np.unique(months)))
+        meta['max_end'] = str(pd.Timestamp(new['EndDate'].max()))
+        meta['rows'] += len(new)
+        self._write_atomic(os.path.join(directory, META_FILE), lambda f: f.write(json.dumps(meta).encode()))
+
+        for month in set(previous_months) - set(meta['months']):
+            os.remove(self._month_path(account_id, unit, month))
+        return len(new)
+
+    def slices(self, account_id, unit='KWH', start=None, end=None):
+        """
+        Yield memory-mapped structured-array slices, one per cached month, of
+        the intervals with ``start <= StartDate < end``. The slices are views
+        of the files and must not be written to.
+        """
+        start, end = _to_ns(start), _to_ns(end)
+        for month in self._meta(account_id, unit)['months']:
+            month_start = np.datetime64(month, 'M').astype('datetime64[ns]')
+            month_end = (np.datetime64(month, 'M') + 1).astype('datetime64[ns]')
+            if (end is not None and month_start >= end) or (start is not None and month_end <= start):
+                continue
+
+            records = np.load(self._month_path(account_id, unit, month), mmap_mode='r')
+            lo = 0 if start is None else np.searchsorted(records['StartDate'], start, side='left')
+            hi = len(records) if end is None else np.searchsorted(records['StartDate'], end, side='left')
+            if hi > lo:
+                yield records[lo:hi]
+
+    def _frame(self, records, unit):
+        ami = pd.DataFrame({name: records[name] for name in INTERVAL_DTYPE.names})
+        ami['UsageUnit'] = unit
+        return ami
+
+    def chunks(self, account_id, unit='KWH', start=None, end=None):
+        '''Yield one AMI frame per cached month, e.g. for streaming into ``CalcCoinDemand``.'''
+        for records in self.slices(account_id, unit, start, end):
+            yield self._frame(records, unit)
+
+    def read(self, account_id, unit='KWH', start=None, end=None):
+        '''AMI frame (StartDate, EndDate, Usage, UsageUnit) for a date range.'''
+        parts = list(self.slices(account_id, unit, start, end))
+        records = np.concatenate(parts) if parts else np.empty(0, dtype=INTERVAL_DTYPE)
+        return self._frame(records, unit)
+
+    def AMIData(self, account_id, unit='KWH', latest=None, import_id=None):
+        '''Refresh (when there is a fetcher) and return every cached interval, like ``ac.AMIData``.'''
+        if self.fetch is not None:
+            self.refresh(account_id, unit, latest=latest, import_id=import_id)
+        return self.read(account_id, unit)
@@ -1,28 +1,157 @@
+import os
+import sqlite3
+from contextlib import closing
+from functools import lru_cache
+
 import pandas as pd
 
-tax_df = pd.read_excel(r"Q:\AUDITORS\EGOS Shared Folder\Development\Nick's pythons\SC9 IV Calcs 5-20-2025\SalesGRTax.xlsx")
+TAX_TABLE_PATH = r"Q:\AUDITORS\EGOS Shared Folder\Development\Nick's pythons\SC9 IV Calcs 5-20-2025\SalesGRTax.xlsx"
+
+TAX_KEY = ['AccountID', 'DateFrom', 'DateTo']
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+@lru_cache(maxsize=None)
+def load_tax_table(path=TAX_TABLE_PATH):
+    '''
+    The ``SalesGRTax.xlsx`` tax table, read on first use and cached per path.
+    A ``.csv`` or ``.parquet`` copy, or a SQLite database holding a
+    ``SalesGRTax`` table, is read the same way.
+    '''
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return pd.read_csv(path, parse_dates=['DateFrom', 'DateTo'])
+    if extension == '.parquet':
+        return pd.read_parquet(path)
+    if extension in SQLITE_EXTENSIONS:
+        with closing(sqlite3.connect(path)) as conn:
+            return pd.read_sql('SELECT * FROM SalesGRTax', conn, parse_dates=['DateFrom', 'DateTo'])
+    return pd.read_excel(path)
+
+@lru_cache(maxsize=None)
+def load_tax_index(path=TAX_TABLE_PATH):
+    '''``TaxIndex`` over ``load_tax_table(path)``, built on first use and cached per path.'''
+    return TaxIndex(load_tax_table(path))
+
+def __getattr__(name):
+    # ``apply_tax.tax_df`` still works, but only reads the workbook when asked for
+    if name == 'tax_df':
+        return load_tax_table()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _normalize_dates(values):
+    '''Dates (strings such as ``'04-16-2025'``, datetimes or Timestamps) as midnight Timestamps.'''
+    values = pd.Series(values)
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        values = pd.to_datetime(values, format='mixed')
+    return values.dt.normalize().to_numpy()
+
+def _clean_rate(rate):
+    return rate if rate > 0 else 0
+
+def _tax_rates(tax_df):
+    '''
+    One row of tax rates per (AccountID, DateFrom, DateTo), first row winning
+    as before, with non-positive or missing rates as 0.
+
+    Returns:
+    - DataFrame: AccountID, DateFrom, DateTo, SalesTaxRate (fraction) and GRTRate
+    '''
+    rates = pd.DataFrame({
+        'AccountID': tax_df['AccountID'].astype('int64').to_numpy(),
+        'DateFrom': _normalize_dates(tax_df['DateFrom']),
+        'DateTo': _normalize_dates(tax_df['DateTo']),
+        'SalesTaxRate': (tax_df['SalesTaxRate'] / 100).to_numpy(),
+        'GRTRate': tax_df['GRTRate'].to_numpy(),
+    })
+    for col in ('SalesTaxRate', 'GRTRate'):
+        rates[col] = rates[col].where(rates[col] > 0, 0.0)
+    return rates.drop_duplicates(subset=TAX_KEY, keep='first').reset_index(drop=True)
+
+class TaxIndex:
+    """
+    Tax rates from ``SalesGRTax.xlsx``, prepared once for taxing many bills.
+
+    Lookups are keyed on (AccountID, DateFrom, DateTo) with dates normalized
+    to the day, so ``'04-16-2025'`` and ``Timestamp('2025-04-16')`` match.
+    """
+
+    def __init__(self, tax_df: pd.DataFrame):
+        self.table = _tax_rates(tax_df)
+        self._rates = dict(zip(
+            zip(
+                self.table['AccountID'].tolist(),
+                self.table['DateFrom'].to_numpy().astype('int64').tolist(),
+                self.table['DateTo'].to_numpy().astype('int64').tolist(),
+            ),
+            zip(self.table['SalesTaxRate'].tolist(), self.table['GRTRate'].tolist()),
+        ))
+
+    def rates(self, account_id, date_from, date_to):
+        """``(sales_tax_rate, grt_rate)`` for one bill, or None when the bill has no tax row."""
+        key = (int(account_id), pd.Timestamp(date_from).normalize().value, pd.Timestamp(date_to).normalize().value)
+        return self._rates.get(key)
 
 def apply_grt_salestax(bill, tax_df):
-    sub_tax_df = tax_df[
-        (tax_df['AccountID'] == bill['AccountID']) &
-        (tax_df['DateFrom'] == bill['DateFrom']) & 
-        (tax_df['DateTo'] == bill['DateTo'])
-    ]
-    if len(sub_tax_df) > 0:
-        sub_tax_df = sub_tax_df.iloc[0]
-        sales_tax_rate = sub_tax_df['SalesTaxRate'] / 100
-        if not sales_tax_rate > 0:
-            sales_tax_rate = 0
-        grt_rate = sub_tax_df['GRTRate']
-        if not grt_rate > 0:
-            grt_rate = 0
-
-        print(grt_rate)
+    '''
+    Apply GRT and sales tax to one itemized bill's total.
+
+    Parameters:
+    - bill (dict): Bill with AccountID, DateFrom, DateTo and total
+    - tax_df (pd.DataFrame or TaxIndex): Tax rates; a DataFrame is scanned on
+      every call, a ``TaxIndex`` is the cheap way to tax many bills
+
+    Returns:
+    - dict: The bill, with a numeric taxed ``total`` when it has a tax row
+    '''
+    if isinstance(tax_df, TaxIndex):
+        rates = tax_df.rates(bill['AccountID'], bill['DateFrom'], bill['DateTo'])
+    else:
+        account_df = tax_df[tax_df['AccountID'] == bill['AccountID']]
+        date_from, date_to = _normalize_dates([bill['DateFrom'], bill['DateTo']])
+        sub_tax_df = account_df[
+            (_normalize_dates(account_df['DateFrom']) == date_from) &
+            (_normalize_dates(account_df['DateTo']) == date_to)
+        ]
+        rates = None
+        if len(sub_tax_df) > 0:
+            sub_tax_df = sub_tax_df.iloc[0]
+            rates = (_clean_rate(sub_tax_df['SalesTaxRate'] / 100), _clean_rate(sub_tax_df['GRTRate']))
+
+    if rates is not None:
+        sales_tax_rate, grt_rate = rates
         total = float(bill['total']) * (1 + grt_rate)
         total = total * (1 + sales_tax_rate)
-        bill['total'] = str(total)
-        
-        return bill 
-    else:
-        return bill
- 
\ No newline at end of file
+        bill['total'] = total
+
+    return bill
+
+def apply_taxes(results, tax_df):
+    '''
+    Apply GRT and sales tax to a whole frame of bill results in one merge.
+
+    Parameters:
+    - results (pd.DataFrame): Bills with AccountID, DateFrom, DateTo and
+      total, e.g. from ``calculate_bills`` or ``ResultSink.read``
+    - tax_df (pd.DataFrame or TaxIndex): Tax rates
+
+    Returns:
+    - pd.DataFrame: Copy of ``results`` with taxed numeric totals; bills
+      without a tax row keep their total
+    '''
+    rates = tax_df.table if isinstance(tax_df, TaxIndex) else _tax_rates(tax_df)
+
+    keys = pd.DataFrame({
+        'AccountID': results['AccountID'].astype('int64').to_numpy(),
+        'DateFrom': _normalize_dates(results['DateFrom']),
+        'DateTo': _normalize_dates(results['DateTo']),
+    })
+    matched = keys.merge(rates, on=TAX_KEY, how='left')
+
+    taxed = results.copy()
+    taxed['total'] = (
+        pd.to_numeric(results['total']).to_numpy()
+        * (1 + matched['GRTRate'].fillna(0).to_numpy())
+        * (1 + matched['SalesTaxRate'].fillna(0).to_numpy())
+    )
+    return taxed
@@ -0,0 +1,90 @@
+"""
+Daily as-used demand from AMI intervals, the ``daily_demand_df`` that
+``calculate_bill`` and ``DailyDemandIndex`` price.
+
+Intervals are summed into clock half-hours (30-minute demand, kW = kWh x 2)
+and each half-hour gets a window code from its start time:
+
+- mid-peak: 8:00-17:59, priced at ``midpeak_rate_summer`` (DemandTime 800-1759)
+- peak only: 18:00-21:59 (the peak window is 8:00-21:59, priced at
+  ``peak_rate_summer`` (DemandTime 800-2159), so it also takes the
+  mid-peak half-hours)
+
+One group-by over (day, window code) gives each weekday's maximum per code.
+Every weekday gets both columns; the summer/non-summer split (summer
+midpeak and peak, non-summer daily max of the two) is applied at pricing.
+"""
+
+import numpy as np
+import pandas as pd
+
+import sys
+import os
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+from calc_demand import _aggregate_intervals
+
+MIDPEAK_HOURS = (8, 18)   # 8:00-17:59, DemandTime 800-1759
+PEAK_HOURS = (8, 22)      # 8:00-21:59, DemandTime 800-2159
+BLOCK_MINUTES = 30
+
+OFF_WINDOW, MIDPEAK_WINDOW, PEAK_ONLY_WINDOW = 0, 1, 2
+
+
+def _window_codes(hours):
+    codes = np.full(len(hours), OFF_WINDOW, dtype=np.int8)
+    codes[(hours >= PEAK_HOURS[0]) & (hours < PEAK_HOURS[1])] = PEAK_ONLY_WINDOW
+    codes[(hours >= MIDPEAK_HOURS[0]) & (hours < MIDPEAK_HOURS[1])] = MIDPEAK_WINDOW
+    return codes
+
+
+def _is_weekday(days):
+    # 1970-01-01 was a Thursday (weekday 3)
+    return (days.astype('int64') + 3) % 7 < 5
+
+
+def CalcStandByDemand(bills, ami):
+    """
+    Daily as-used demand for every weekday with AMI data in the bills' span.
+
+    Parameters:
+    - bills (DataFrame): Bills with DateFrom and DateTo; days outside
+      ``[min DateFrom, max DateTo]`` are dropped. Empty or None keeps every day.
+    - ami (DataFrame): AMI intervals with StartDate, EndDate, Usage and UsageUnit
+
+    Returns:
+    - DataFrame: ``Date``, ``MidPeakDemand_kW`` and ``PeakDemand_kW``, one row
+      per weekday, sorted by date (NaN where a window has no data)
+    """
+    start, _, usage = _aggregate_intervals(ami)
+
+    block_ns = np.int64(BLOCK_MINUTES * 60 * 10**9)
+    blocks = start.astype('int64') // block_ns
+    firsts = np.flatnonzero(np.r_[True, blocks[1:] != blocks[:-1]]) if len(blocks) else np.array([], dtype=int)
+    block_start = (blocks[firsts] * block_ns).astype('datetime64[ns]')
+    block_kW = np.add.reduceat(usage, firsts) * (60 / BLOCK_MINUTES) if len(firsts) else usage[:0]
+
+    days = block_start.astype('datetime64[D]')
+    hours = (block_start - days).astype('timedelta64[h]').astype('int64')
+    codes = _window_codes(hours)
+
+    keep = (codes != OFF_WINDOW) & _is_weekday(days)
+    if bills is not None and len(bills):
+        first_day = np.datetime64(pd.to_datetime(bills['DateFrom']).min(), 'D')
+        last_day = np.datetime64(pd.to_datetime(bills['DateTo']).max(), 'D')
+        keep &= (days >= first_day) & (days <= last_day)
+
+    maxima = (
+        pd.DataFrame({'Date': days[keep].astype('datetime64[ns]'), 'Window': codes[keep], 'kW': block_kW[keep]})
+        .groupby(['Date', 'Window'])['kW'].max()
+        .unstack('Window')
+        .reindex(columns=[MIDPEAK_WINDOW, PEAK_ONLY_WINDOW])
+    )
+
+    midpeak = maxima[MIDPEAK_WINDOW].to_numpy()
+    return pd.DataFrame({
+        'Date': maxima.index,
+        'MidPeakDemand_kW': midpeak,
+        'PeakDemand_kW': np.fmax(midpeak, maxima[PEAK_ONLY_WINDOW].to_numpy()),
+    })
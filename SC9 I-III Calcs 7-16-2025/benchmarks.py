@@ -0,0 +1,352 @@
+"""
+Timing harness for the bill-calculation hot paths.
+
+Run from this directory:
+
+    python benchmarks.py                      # everything, printed
+    python benchmarks.py --accounts 1 100     # smaller end-to-end runs
+    python benchmarks.py --save-baseline      # write benchmark_baseline.json
+    python benchmarks.py --compare            # flag regressions against it
+
+Each benchmark reports the best wall-clock time over a few repeats. The
+hot-path and end-to-end benchmarks also report throughput (``*_per_s``) and
+peak traced memory (``*_mb``, from ``tracemalloc`` in a separate run so
+tracing does not skew the timings). Inputs are the bundled
+``charge_history.json`` / ``charge_config.csv`` plus seeded synthetic bills,
+AMI intervals and tax rows, so results are reproducible offline.
+"""
+
+import argparse
+import ast
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import sys
+import os
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.abspath(os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+from rate_index import compile_rate_history, compile_rate_index, parse_rate_history
+from as_used_daily_demand import CalcStandByDemand
+from bill_calc import DailyDemandIndex, calculate_bill, extract_rate_data
+from calc_demand import CalcCoinDemand
+from apply_tax import TaxIndex, apply_grt_salestax
+from ami_cache import AMICache, frame_fetcher
+from data_sources import synthetic_bills, synthetic_intervals, synthetic_tax_table
+from pipeline import StageTimer
+from portfolio_runner import run_portfolio
+from result_sink import ResultSink, charge_config_version, rate_history_version
+
+BASELINE_PATH = os.path.join(HERE, 'benchmark_baseline.json')
+END_TO_END_ACCOUNTS = (1, 100, 1000)
+# A timing or memory figure this many times its baseline counts as a regression
+REGRESSION_TOLERANCE = 1.25
+
+
+def best_of(fn, repeat=5, number=1):
+    """Best per-call time in seconds over ``repeat`` rounds of ``number`` calls."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def peak_memory_mb(fn):
+    """Peak memory traced by ``tracemalloc`` during one call of ``fn``, in MB."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def measure(name, fn, items, repeat=5, number=1):
+    """Best time, throughput (``items`` per second) and peak memory of ``fn`` under ``name``."""
+    seconds = best_of(fn, repeat, number)
+    return {
+        name: seconds,
+        f'{name}_per_s': items / seconds,
+        f'{name}_mb': peak_memory_mb(fn),
+    }
+
+
+def load_history():
+    with open(os.path.join(BASE_DIR, 'charge_history.json'), 'r') as f:
+        return json.load(f)
+
+
+def load_charges():
+    return pd.read_csv(os.path.join(BASE_DIR, 'charge_config.csv'))
+
+
+def rate_source():
+    """A ``RateCache``-style rate source built from the bundled files."""
+    history, charges = load_history(), load_charges()
+    return {
+        'index': compile_rate_index(history),
+        'charges': charges,
+        'version': {'rates': rate_history_version(history), 'charges': charge_config_version(charges)},
+    }
+
+
+def bench_rate_history_parse(repeat=5, number=20):
+    """
+    ``RateHistory`` parsing: the old ``ast.literal_eval`` path against
+    ``parse_rate_history`` for JSON and Python-literal payloads, plus going
+    straight to a compiled ``RateIndex``.
+    """
+    history = load_history()
+    json_payload = json.dumps([history])
+    literal_payload = repr([history])
+
+    timings = {
+        'payload_size': f"{len(json_payload) / 1024:.1f} KB",
+        'literal_eval': best_of(lambda: ast.literal_eval(literal_payload), repeat, number),
+        'parse_json': best_of(lambda: parse_rate_history(json_payload), repeat, number),
+        'parse_literal_fallback': best_of(lambda: parse_rate_history(literal_payload), repeat, number),
+        'literal_eval_then_compile': best_of(
+            lambda: compile_rate_index(ast.literal_eval(literal_payload)[0]), repeat, number
+        ),
+        'compile_rate_history': best_of(lambda: compile_rate_history(json_payload), repeat, number),
+    }
+    return timings
+
+
+def bench_daily_demand(repeat=5, number=1):
+    """``CalcStandByDemand`` over a synthetic year of 5-minute data."""
+    ami = synthetic_intervals('2024-01-01', '2025-01-01')
+    bills = pd.DataFrame({'DateFrom': [pd.Timestamp('2024-01-01')], 'DateTo': [pd.Timestamp('2024-12-31')]})
+    return {
+        'intervals': f"{len(ami):,}",
+        'weekdays': f"{len(CalcStandByDemand(bills, ami)):,}",
+        'CalcStandByDemand': best_of(lambda: CalcStandByDemand(bills, ami), repeat, number),
+    }
+
+
+def bench_hot_paths(repeat=5):
+    """
+    The per-bill building blocks on a year of one account's data:
+    ``extract_rate_data``, ``calculate_bill``, ``CalcCoinDemand`` and
+    ``apply_grt_salestax``.
+    """
+    source = rate_source()
+    bills = synthetic_bills([1])[1]
+    ami = synthetic_intervals(bills['DateFrom'].min(), bills['DateTo'].max())
+    demand_index = DailyDemandIndex(CalcStandByDemand(bills, ami))
+    periods = [(row.DateFrom.strftime('%m-%d-%Y'), row.DateTo.strftime('%m-%d-%Y')) for row in bills.itertuples()]
+    rates = [extract_rate_data(source['index'], source['charges'], start, end) for start, end in periods]
+
+    tax_bills = synthetic_bills(range(4000), seed=1)
+    tax_index = TaxIndex(synthetic_tax_table(tax_bills))
+    taxed = [{'AccountID': 1, 'DateFrom': start, 'DateTo': end, 'total': 17230.93} for start, end in periods]
+
+    def rate_all():
+        for start, end in periods:
+            extract_rate_data(source['index'], source['charges'], start, end)
+
+    def price_all():
+        for (start, end), rate_data, usage, contract in zip(periods, rates, bills['Usage'], bills['Demand']):
+            calculate_bill(demand_index, usage, start, end, rate_data, contract_demand_kW=contract)
+
+    def tax_all():
+        for bill in taxed:
+            apply_grt_salestax(dict(bill), tax_index)
+
+    timings = {'bills': len(periods), 'intervals': f"{len(ami):,}", 'tax_rows': f"{len(tax_index.table):,}"}
+    timings.update(measure('extract_rate_data', rate_all, len(periods), repeat))
+    timings.update(measure('calculate_bill', price_all, len(periods), repeat))
+    timings.update(measure('CalcCoinDemand', lambda: CalcCoinDemand(bills.copy(), ami), len(periods), repeat))
+    timings.update(measure('apply_grt_salestax', tax_all, len(periods), repeat))
+    return timings
+
+
+def _end_to_end_inputs(directory, accounts, months):
+    bills_by_account = synthetic_bills(range(1, accounts + 1), months=months)
+    cache = AMICache(os.path.join(directory, 'ami'))
+    # The server's latest AMI EndDate and import per account, as GetTargetAccs reports them
+    ami_latest = {}
+    for account_id, bills in bills_by_account.items():
+        intervals = synthetic_intervals(bills['DateFrom'].min(), bills['DateTo'].max(), account_id)
+        ami_latest[account_id] = (intervals['EndDate'].max(), months)
+        cache.fetch = frame_fetcher(intervals)
+        cache.refresh(account_id, latest=ami_latest[account_id][0], import_id=months)
+    tax_path = os.path.join(directory, 'SalesGRTax.xlsx')
+    synthetic_tax_table(bills_by_account).to_excel(tax_path, index=False)
+    return bills_by_account, ami_latest, tax_path
+
+
+def _run_main_flow(directory, bills_by_account, ami_latest, tax_path, run_name, workers, prefetch):
+    # main.py after the DB fetches: price, append to the sink, export the workbook
+    timer = StageTimer()
+    sink = ResultSink(os.path.join(directory, run_name))
+    account_ids = list(bills_by_account)
+    results = run_portfolio(
+        account_ids, tax_path, {'Standard': rate_source()}, workers=workers, bills_by_account=bills_by_account,
+        ami_cache_dir=os.path.join(directory, 'ami'), ami_latest=ami_latest, prefetch=prefetch, timer=timer
+    )
+    for result in results:
+        if result['error'] is not None:
+            raise RuntimeError(f"Account {result['AccountID']} failed:\n{result['error']}")
+        with timer.measure('write'):
+            sink.append(result['AccountID'], result['bills'], status=result['status'],
+                        fingerprint=result['fingerprint'], schedule=result['schedule'])
+    with timer.measure('write'):
+        sink.close()
+    with timer.measure('export'):
+        sink.read().to_excel(os.path.join(directory, f'{run_name}.xlsx'), index=False)
+    return timer
+
+
+def bench_end_to_end(accounts=END_TO_END_ACCOUNTS, months=3, workers=1, prefetch=8):
+    """
+    The offline ``main.py`` flow (bills prefetched, AMI from a warm cache):
+    ``run_portfolio`` with prefetching, the result sink and the Excel export,
+    at each portfolio size. Reports wall time, accounts and bills per second,
+    peak memory and seconds per pipeline stage.
+    """
+    timings = {}
+    for count in accounts:
+        directory = tempfile.mkdtemp(prefix='sc9_bench_')
+        try:
+            bills_by_account, ami_latest, tax_path = _end_to_end_inputs(directory, count, months)
+            start = time.perf_counter()
+            timer = _run_main_flow(directory, bills_by_account, ami_latest, tax_path, 'timed', workers, prefetch)
+            seconds = time.perf_counter() - start
+            memory = peak_memory_mb(
+                lambda: _run_main_flow(directory, bills_by_account, ami_latest, tax_path, 'traced', workers, prefetch)
+            )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        prefix = f'{count}_accounts'
+        timings[prefix] = seconds
+        timings[f'{prefix}_per_s'] = count / seconds
+        timings[f'{prefix}_bills_per_s'] = count * months / seconds
+        timings[f'{prefix}_mb'] = memory
+        for stage, entry in timer.summary().items():
+            timings[f'{prefix}.{stage}'] = entry['seconds']
+    return timings
+
+
+IMPORT_MODULES = [
+    'rate_index', 'bill_calc', 'calc_demand', 'as_used_daily_demand', 'apply_tax', 'config',
+    'target_accounts', 'result_sink', 'rate_cache', 'ami_cache', 'db_pool', 'pipeline', 'portfolio_runner',
+    'data_sources',
+]
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, {here!r})
+import numpy, pandas
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [name for name in ('pyodbc', 'AccConv') if name in sys.modules]
+print(elapsed, ','.join(loaded))
+"""
+
+
+def bench_import_time(modules=IMPORT_MODULES, repeat=3):
+    """
+    Cold import time of each module in a fresh interpreter, with numpy and
+    pandas already imported so only the module's own cost is counted.
+    Fails if an import pulls in pyodbc or AccConv.
+    """
+    timings = {}
+    for module in modules:
+        best = float('inf')
+        for _ in range(repeat):
+            out = subprocess.run(
+                [sys.executable, '-c', IMPORT_SCRIPT.format(here=HERE, module=module)],
+                capture_output=True, text=True, check=True, cwd=HERE,
+            ).stdout.split()
+            if len(out) > 1:
+                raise RuntimeError(f"Importing {module} loaded {out[1]}")
+            best = min(best, float(out[0]))
+        timings[module] = best
+    return timings
+
+
+def print_timings(name, timings):
+    print(f"{name}:")
+    for key, value in timings.items():
+        if not isinstance(value, float):
+            print(f"  {key:<36} {value:>12}")
+        elif key.endswith('_per_s'):
+            print(f"  {key:<36} {value:>12,.1f} /s")
+        elif key.endswith('_mb'):
+            print(f"  {key:<36} {value:>12.1f} MB")
+        else:
+            print(f"  {key:<36} {value * 1000:>12.3f} ms")
+
+
+def compare_to_baseline(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Timings and memory figures more than ``tolerance`` times their baseline.
+
+    Returns:
+    - list: ``(benchmark, key, baseline, current)`` for every regression
+    """
+    regressions = []
+    for name, timings in results.items():
+        for key, value in timings.items():
+            reference = baseline.get(name, {}).get(key)
+            if not isinstance(value, float) or not isinstance(reference, float) or key.endswith('_per_s'):
+                continue
+            if value > reference * tolerance:
+                regressions.append((name, key, reference, value))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the bill-calculation hot paths.')
+    parser.add_argument('--accounts', type=int, nargs='+', default=list(END_TO_END_ACCOUNTS),
+                        help='Portfolio sizes for the end-to-end run (default: 1 100 1000)')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for the end-to-end run')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Write these results as the baseline')
+    parser.add_argument('--compare', action='store_true',
+                        help='Compare against the baseline and exit non-zero on a regression')
+    args = parser.parse_args()
+
+    results = {
+        'RateHistory parsing': bench_rate_history_parse(),
+        'Daily as-used demand': bench_daily_demand(),
+        'Hot paths': bench_hot_paths(),
+        'End to end': bench_end_to_end(args.accounts, workers=args.workers),
+        'Import time (numpy/pandas preloaded)': bench_import_time(),
+    }
+    for name, timings in results.items():
+        print_timings(name, timings)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                                'pandas': pd.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count()},
+                'results': results,
+            }, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+
+    if args.compare:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare_to_baseline(results, baseline)
+        for name, key, reference, value in regressions:
+            print(f"REGRESSION {name} / {key}: {reference:.4g} -> {value:.4g}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {REGRESSION_TOLERANCE}x the baseline")
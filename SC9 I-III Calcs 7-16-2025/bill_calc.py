@@ -1,7 +1,5 @@
 import pandas as pd 
 import numpy as np 
-import pyodbc
-import ast
 from datetime import datetime
 import json
 import re
@@ -11,17 +9,78 @@ import os
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, BASE_DIR)
 
+from rate_index import RateHistoryParseError, RateIndex, compile_rate_index, parse_rate_history
+from db_pool import read_sql
+
+SUMMER_MONTHS = [6, 7, 8, 9]  # June through Sept
+DEFAULT_RATE_ID = 22  # RateAcuityRateId of SC9 Rate IV
+
+# Comparison -> RateAcuityRateId of the new rate and the SC9 subrates priced under it.
+# The Rate V id is not known here; set it (or pass --large-rate-id to main.py)
+# before pricing the Large comparison.
+RATE_SCHEDULES = {
+    'Standard': {'rate_id': DEFAULT_RATE_ID, 'subrates': ['I', 'III']},  # 9-I/III -> 9-IV
+    'Large': {'rate_id': None, 'subrates': ['II']},                      # 9-II -> 9-V
+}
+
+def schedule_for_subrate(subrate):
+    '''Comparison an SC9 subrate is priced under; anything other than II is Standard.'''
+    if str(subrate).strip() in RATE_SCHEDULES['Large']['subrates']:
+        return 'Large'
+    return 'Standard'
+
 def string_to_list(s):
     try:
-        result = ast.literal_eval(s)
-        if isinstance(result, list):
-            return result
-        else:
-            raise ValueError("The string does not represent a list.")
-    except Exception as e:
+        return parse_rate_history(s)
+    except RateHistoryParseError as e:
         print(f"Error: {e}")
         return None
 
+def _daily_demand_determinants(daily_demand_df):
+    """Per-day summer midpeak/peak kW and non-summer daily max kW (NaN as 0)."""
+    midpeak = daily_demand_df['MidPeakDemand_kW'].fillna(0).to_numpy(dtype=float)
+    peak = daily_demand_df['PeakDemand_kW'].fillna(0).to_numpy(dtype=float)
+    summer = pd.DatetimeIndex(daily_demand_df['Date']).month.isin(SUMMER_MONTHS)
+    return {
+        'midpeak_kWh_sum': np.where(summer, midpeak, 0.0),
+        'peak_kWh_sum': np.where(summer, peak, 0.0),
+        'sum_daily_max_kW': np.where(summer, 0.0, np.maximum(midpeak, peak)),
+    }
+
+class DailyDemandIndex:
+    """
+    One account's as-used daily demand, prepared once for pricing many bills.
+
+    Days are sorted by date and reduced to per-day billing determinants up
+    front, so each bill only binary-searches its ``(start_date, end_date)``
+    bounds and sums zero-copy slices. The source frame is not modified.
+
+    A bill covers the days strictly between its two reads, DateFrom + 1
+    through DateTo - 1: the same days whose intervals ``CalcCoinDemand``
+    takes (StartDate from DateFrom + 1 day, EndDate by DateTo 00:00) for the
+    kW and kWh determinants.
+    """
+
+    def __init__(self, daily_demand_df: pd.DataFrame):
+        frame = daily_demand_df.sort_values('Date', kind='stable')
+        self.dates = pd.to_datetime(frame['Date']).values.astype('datetime64[D]')
+        self.daily = _daily_demand_determinants(frame)
+
+    def period(self, start_date, end_date):
+        """Slice of the sorted days falling in ``(start_date, end_date)``."""
+        lo = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start_date), 'D'), side='right')
+        hi = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end_date), 'D'), side='left')
+        return slice(lo, max(lo, hi))
+
+    def determinants(self, start_date, end_date):
+        """Summer midpeak kW, summer peak kW and non-summer daily-max kW sums."""
+        days = self.period(start_date, end_date)
+        return (
+            self.daily['midpeak_kWh_sum'][days].sum(),
+            self.daily['peak_kWh_sum'][days].sum(),
+            self.daily['sum_daily_max_kW'][days].sum(),
+        )
+
 def calculate_bill(
     billing_df: pd.DataFrame,
     usage_kwh: float,
@@ -35,8 +94,10 @@ def calculate_bill(
     Calculate a detailed electric delivery bill based on as-used demand and energy usage.
 
     Parameters:
-    - billing_df (pd.DataFrame): DataFrame containing as-used demand data with
-      ``Date`` and demand columns.
+    - billing_df (pd.DataFrame or DailyDemandIndex): As-used demand data with
+      ``Date`` and demand columns. A DataFrame is charged in full; a
+      ``DailyDemandIndex`` is sliced to the days in ``(start_date, end_date)``,
+      which is the cheap way to price every bill of an account.
     - usage_kwh (float): Total energy usage during billing period
     - start_date (str or datetime): Billing period start date
     - end_date (str or datetime): Billing period end date
@@ -52,19 +113,44 @@ def calculate_bill(
     start_date = pd.to_datetime(start_date)
     end_date = pd.to_datetime(end_date)
 
-    # --- Seasonal Masks ---
-    billing_df['Month'] = billing_df['Date'].dt.month
-    summer_mask = billing_df['Month'].isin([6, 7, 8, 9])  # June through Sept
+    if isinstance(billing_df, DailyDemandIndex):
+        midpeak_kW_summer, peak_kW_summer, nonsummer_daily_max = billing_df.determinants(start_date, end_date)
+    else:
+        # --- Seasonal Masks ---
+        summer_mask = billing_df['Date'].dt.month.isin(SUMMER_MONTHS)
+
+        # --- Summer As-Used Demand ---
+        summer_df = billing_df[summer_mask]
+        midpeak_kW_summer = summer_df['MidPeakDemand_kW'].fillna(0).sum()
+        peak_kW_summer = summer_df['PeakDemand_kW'].fillna(0).sum()
+
+        # --- Non-Summer As-Used Demand ---
+        nonsummer_df = billing_df[~summer_mask][['MidPeakDemand_kW', 'PeakDemand_kW']].fillna(0)
+        # Use highest daily kW of either midpeak or peak per day
+        nonsummer_daily_max = nonsummer_df.max(axis=1).sum()
+
+    return bill_breakdown(
+        usage_kwh, rate_data, contract_demand_kW,
+        midpeak_kW_summer, peak_kW_summer, nonsummer_daily_max
+    )
 
+def bill_breakdown(
+    usage_kwh: float,
+    rate_data: dict,
+    contract_demand_kW: float,
+    midpeak_kW_summer: float,
+    peak_kW_summer: float,
+    nonsummer_daily_max: float,
+):
+    """
+    Build the itemized bill dict returned by ``calculate_bill`` from the
+    billing determinants of one period.
+    """
     # --- Contract Demand Charge ---
     contract_demand_rate = rate_data.get('contract_demand_rate', 0.0)
     contract_demand_charge = contract_demand_kW * contract_demand_rate
 
     # --- Summer As-Used Demand ---
-    summer_df = billing_df[summer_mask]
-    midpeak_kW_summer = summer_df['MidPeakDemand_kW'].fillna(0).sum()
-    peak_kW_summer = summer_df['PeakDemand_kW'].fillna(0).sum()
-
     midpeak_rate = rate_data.get('midpeak_rate_summer', 0.0)
     peak_rate = rate_data.get('peak_rate_summer', 0.0)
     demand_charge_summer = (
@@ -73,10 +159,6 @@ def calculate_bill(
     )
 
     # --- Non-Summer As-Used Demand ---
-    nonsummer_df = billing_df[~summer_mask][['MidPeakDemand_kW', 'PeakDemand_kW']].fillna(0)
-    # Use highest daily kW of either midpeak or peak per day
-    nonsummer_daily_max = nonsummer_df.max(axis=1).sum()
-
     as_used_rate_nonsummer = rate_data.get('as_used_rate_nonsummer', 0.0)
     demand_charge_nonsummer = nonsummer_daily_max * as_used_rate_nonsummer
 
@@ -146,66 +228,164 @@ def calculate_bill(
         'total': round(total, 2)
     }
 
+def _bill_determinants(bills_df: pd.DataFrame, daily_demand_df: pd.DataFrame):
+    """Summer midpeak/peak kW and non-summer daily-max kW sums per bill, from prefix sums."""
+    accounts, _ = pd.factorize(pd.concat([bills_df['AccountID'], daily_demand_df['AccountID']], ignore_index=True))
+    bill_accounts = accounts[:len(bills_df)].astype(np.int64)
+    day_accounts = accounts[len(bills_df):].astype(np.int64)
+
+    starts = pd.to_datetime(bills_df['DateFrom']).values.astype('datetime64[D]').astype(np.int64)
+    ends = pd.to_datetime(bills_df['DateTo']).values.astype('datetime64[D]').astype(np.int64)
+    days = pd.to_datetime(daily_demand_df['Date']).values.astype('datetime64[D]').astype(np.int64)
+
+    # (account, day) packed into one sortable key
+    all_days = np.concatenate((starts, days))
+    offset = all_days.min() if len(all_days) else 0
+    day_keys = (day_accounts << 32) + (days - offset)
+    order = np.argsort(day_keys, kind='stable')
+    day_keys = day_keys[order]
+    lo = np.searchsorted(day_keys, (bill_accounts << 32) + (starts - offset), side='right')
+    hi = np.searchsorted(day_keys, (bill_accounts << 32) + (ends - offset), side='left')
+    hi = np.maximum(hi, lo)
+
+    determinants = {}
+    for name, values in _daily_demand_determinants(daily_demand_df).items():
+        prefix = np.concatenate(([0.0], np.cumsum(values[order])))
+        determinants[name] = prefix[hi] - prefix[lo]
+    return determinants
+
+def _priced_bills(bills_df: pd.DataFrame, determinants: dict, rate_matrix: pd.DataFrame):
+    """``calculate_bills`` output from per-bill determinants and a rate matrix aligned with ``bills_df``."""
+    usage = bills_df['Usage'].to_numpy(dtype=float)
+    if 'Contract Demand' in bills_df:
+        contract_kW = bills_df['Contract Demand'].to_numpy(dtype=float)
+    else:
+        contract_kW = np.zeros(len(bills_df))
+
+    def rate(column):
+        return rate_matrix[column].to_numpy(dtype=float)
+
+    customer_charge = rate('customer_charge')
+    processing_charge = rate('processing_charge')
+    surcharge_charge = usage * rate('surcharge_rate')
+    demand_charge_summer = (
+        determinants['midpeak_kWh_sum'] * rate('midpeak_rate_summer') +
+        determinants['peak_kWh_sum'] * rate('peak_rate_summer')
+    )
+    demand_charge_nonsummer = determinants['sum_daily_max_kW'] * rate('as_used_rate_nonsummer')
+    contract_demand_charge = contract_kW * rate('contract_demand_rate')
+
+    total = (
+        customer_charge + processing_charge +
+        contract_demand_charge +
+        demand_charge_summer +
+        demand_charge_nonsummer +
+        surcharge_charge
+    )
+
+    return pd.DataFrame({
+        'AccountID': bills_df['AccountID'],
+        'DateFrom': bills_df['DateFrom'],
+        'DateTo': bills_df['DateTo'],
+        'Usage': usage,
+        'Contract Demand': contract_kW,
+        'midpeak_kWh_sum': determinants['midpeak_kWh_sum'],
+        'peak_kWh_sum': determinants['peak_kWh_sum'],
+        'sum_daily_max_kW': determinants['sum_daily_max_kW'],
+        'customer_charge': customer_charge.round(2),
+        'processing_charge': processing_charge.round(2),
+        'energy_surcharge': surcharge_charge.round(2),
+        'demand_charge_summer': demand_charge_summer.round(2),
+        'demand_charge_nonsummer': demand_charge_nonsummer.round(2),
+        'contract_demand_charge': contract_demand_charge.round(2),
+        'total': total.round(2),
+    }, index=bills_df.index)
+
+def calculate_bills(bills_df: pd.DataFrame, daily_demand_df: pd.DataFrame, rate_matrix: pd.DataFrame):
+    """
+    Calculate many bills at once as whole-column operations.
+
+    Parameters:
+    - bills_df (pd.DataFrame): One row per bill with ``AccountID``,
+      ``DateFrom``, ``DateTo``, ``Usage`` and optionally ``Contract Demand``
+    - daily_demand_df (pd.DataFrame): As-used daily demand for all accounts with
+      ``AccountID``, ``Date``, ``MidPeakDemand_kW`` and ``PeakDemand_kW``
+    - rate_matrix (pd.DataFrame): Rates per bill from ``extract_rate_matrix``,
+      indexed like ``bills_df``
+
+    Each bill is charged for the demand days of its own account in
+    ``(DateFrom, DateTo)``, as ``DailyDemandIndex``. Days are summed per (AccountID, period) with prefix
+    sums over the demand table sorted by account and date, so the cost is one
+    sort of the demand table plus a binary search per bill.
+
+    Returns:
+    - pd.DataFrame: One row per bill (same index as ``bills_df``) with the
+      charge amounts, their billing determinants and ``total``. Use
+      ``itemize_bill`` for the nested ``calculate_bill`` dict of a single bill.
+    """
+    rate_matrix = rate_matrix.loc[bills_df.index]
+    return _priced_bills(bills_df, _bill_determinants(bills_df, daily_demand_df), rate_matrix)
+
+def calculate_scenarios(bills_df: pd.DataFrame, daily_demand_df: pd.DataFrame, scenario_rates: dict):
+    """
+    Calculate many bills under several charge-type scenarios at once.
+
+    The billing determinants (demand sums per bill) are computed once and
+    shared; each scenario only adds its own whole-column charge arithmetic.
+
+    Parameters:
+    - bills_df (pd.DataFrame): Bills, as for ``calculate_bills``
+    - daily_demand_df (pd.DataFrame): As-used daily demand, as for ``calculate_bills``
+    - scenario_rates (dict): Scenario name -> rate matrix, from ``extract_scenario_rates``
+
+    Returns:
+    - dict: Scenario name -> ``calculate_bills`` frame for that scenario
+    """
+    determinants = _bill_determinants(bills_df, daily_demand_df)
+    return {
+        name: _priced_bills(bills_df, determinants, rate_matrix.loc[bills_df.index])
+        for name, rate_matrix in scenario_rates.items()
+    }
+
+def itemize_bill(bill_results: pd.DataFrame, rate_matrix: pd.DataFrame, row):
+    """Nested ``calculate_bill`` dict for one row label of ``calculate_bills`` output."""
+    bill = bill_results.loc[row]
+    return bill_breakdown(
+        bill['Usage'], rate_data_from_matrix(rate_matrix, row), bill['Contract Demand'],
+        bill['midpeak_kWh_sum'], bill['peak_kWh_sum'], bill['sum_daily_max_kW']
+    )
+
+KWH_CHARGE_PREFIX = 'kwh:'
+
+def _charge_key(desc):
+    return desc.lower().strip().replace(" ", "_").replace("-", "").replace("/", "").replace(":", "")
+
 def extract_rate_data(rates, charges_df, start_date, end_date, city="New York City", charge_types=[0, 2]):
+    """
+    Resolve the rates in effect for one billing period.
+
+    ``rates`` may be the raw rate history dict (``GetChargeHistory`` /
+    ``charge_history.json``) or a ``RateIndex`` from ``compile_rate_index``.
+    Pass the compiled index when pricing many bills so the history tables are
+    only parsed and sorted once.
+    """
     if isinstance(start_date, str): start_date = pd.to_datetime(start_date)
     if isinstance(end_date, str): end_date = pd.to_datetime(end_date)
     billing_days = (end_date - start_date).days
 
-    def get_effective_rate(entries, field, date_col='EffectiveDate'):
-        df = pd.DataFrame(entries)
-        df[date_col] = pd.to_datetime(df[date_col])
-        df = df[df[date_col] <= end_date]
-        if df.empty:
-            return 0.0
-        return float(df.sort_values(date_col).iloc[-1][field])
-
-    def extract_summer_demand_rate(entries, start_time, end_time):
-        df = pd.DataFrame(entries)
-        df['EffectiveDate'] = pd.to_datetime(df['EffectiveDate'])
-        df = df[
-            (df['StartTime'] == start_time) &
-            (df['EndTime'] == end_time) &
-            (df['Season'].str.strip().str.lower() == 'june-sept') &
-            (df['EffectiveDate'] <= end_date)
-        ]
-        if df.empty:
-            return 0.0
-        return float(df.sort_values('EffectiveDate').iloc[-1]['RatekW'])
-
-    def get_weighted_average(entries, field):
-        df = pd.DataFrame(entries)
-        df['EffectiveDate'] = pd.to_datetime(df['EffectiveDate'])
-        df = df[df['EffectiveDate'] <= end_date]
-        df = df.sort_values('EffectiveDate')
-        if df.empty:
-            return 0.0
-
-        weights, rates = [], []
-        for i, row in df.iterrows():
-            eff_date = max(row['EffectiveDate'], start_date)
-            if i + 1 < len(df):
-                next_date = min(end_date, df.iloc[i + 1]['EffectiveDate'] )#- pd.Timedelta(days=1))
-            else:
-                next_date = end_date
-            days = (next_date - eff_date).days #+ 1
-            if days < 0:
-                continue
-            weights.append(days)
-            rates.append(float(row[field]))
-
-        total_days = sum(weights)
-        return sum(w * r for w, r in zip(weights, rates)) / total_days if total_days > 0 else 0.0
-
-    def extract(table_key, field_name, desc_match, charge_meta):
-        entries = [e for e in rates.get(table_key, []) if desc_match.lower() in e['Description'].lower()]
+    index = rates if isinstance(rates, RateIndex) else compile_rate_index(rates)
 
-        if not entries:
-            return 0.0
+    def extract_summer_demand_rate(start_time, end_time):
+        return index.effective_rate(
+            'DemandTime_Table', 'RatekW', '', end_date,
+            StartTime=start_time, EndTime=end_time, Season='june-sept'
+        )
 
+    def extract(table_key, field_name, desc_match, charge_meta):
         if charge_meta.get('Weighted', False):
-            rate = get_weighted_average(entries, field_name)
+            rate = index.weighted_average(table_key, field_name, desc_match, start_date, end_date)
         else:
-            rate = get_effective_rate(entries, field_name)
+            rate = index.effective_rate(table_key, field_name, desc_match, end_date)
 
         if charge_meta.get('Prorated', False):
             rate *= billing_days / 30
@@ -217,7 +397,7 @@ def extract_rate_data(rates, charges_df, start_date, end_date, city="New York Ci
 
     for _, row in charges_df.iterrows():
         desc = row['Description']
-        key = desc.lower().strip().replace(" ", "_").replace("-", "").replace("/", "").replace(":", "")
+        key = _charge_key(desc)
 
         if row['Unit'] == 'kWh' and row['ServiceTypeId'] in charge_types:
             rate = extract('Energy_Table', 'RatekWh', desc, row)
@@ -239,8 +419,8 @@ def extract_rate_data(rates, charges_df, start_date, end_date, city="New York Ci
         rate_data[key] = round(rate, 10)
 
     rate_data_mapped = {
-        'midpeak_rate_summer': extract_summer_demand_rate(rates["DemandTime_Table"], "800", "1759"),
-        'peak_rate_summer': extract_summer_demand_rate(rates["DemandTime_Table"], "800", "2159"),
+        'midpeak_rate_summer': extract_summer_demand_rate("800", "1759"),
+        'peak_rate_summer': extract_summer_demand_rate("800", "2159"),
         'as_used_rate_nonsummer': extract(
             'DemandTime_Table', 'RatekW',
             'As-used Daily Demand Delivery Charge',
@@ -260,8 +440,200 @@ def extract_rate_data(rates, charges_df, start_date, end_date, city="New York Ci
 
     return rate_data_mapped
 
-def GetChargeHistory(conn1):
-    sql1 = """SELECT TOP (1000) [Id]
+def _period_bounds(periods):
+    if isinstance(periods, pd.DataFrame):
+        starts, ends = periods['DateFrom'], periods['DateTo']
+    else:
+        periods = list(periods)
+        starts = [p[0] for p in periods]
+        ends = [p[1] for p in periods]
+    starts = pd.to_datetime(pd.Series(starts)).values.astype('datetime64[D]')
+    ends = pd.to_datetime(pd.Series(ends)).values.astype('datetime64[D]')
+    return starts, ends
+
+def _extract_many(index, starts, ends, table_key, field_name, desc_match, charge_meta):
+    if charge_meta.get('Weighted', False):
+        rate = index.weighted_averages(table_key, field_name, desc_match, starts, ends)
+    else:
+        rate = index.effective_rates(table_key, field_name, desc_match, ends)
+
+    if charge_meta.get('Prorated', False):
+        rate = rate * (ends - starts).astype(np.int64) / 30
+
+    return rate
+
+def _kwh_charge_rates(index, charges_df, starts, ends, charge_types):
+    """``(key, ServiceTypeId, rates)`` for each kWh charge of ``charge_types``, in configuration order."""
+    kwh_rates = []
+    for row in charges_df.to_dict('records'):
+        if row['Unit'] == 'kWh' and row['ServiceTypeId'] in charge_types:
+            desc = row['Description']
+            rate = np.round(_extract_many(index, starts, ends, 'Energy_Table', 'RatekWh', desc, row), 10)
+            kwh_rates.append((_charge_key(desc), row['ServiceTypeId'], rate))
+    return kwh_rates
+
+def _rate_columns(index, charges_df, starts, ends):
+    """The rate matrix columns that do not depend on the charge types, with a zero ``surcharge_rate``."""
+    # Only these keys of the per-charge rates feed the mapped output
+    mapped_keys = ('customer_charge', 'billing_and_payment_processing_ch')
+    rate_data = {}
+
+    for row in charges_df.to_dict('records'):
+        desc = row['Description']
+        key = _charge_key(desc)
+
+        if key not in mapped_keys:
+            continue
+
+        if 'Customer Charge' in desc:
+            rate = _extract_many(index, starts, ends, 'ServiceCharge_Table', 'Rate', desc, row)
+        else:
+            rate = _extract_many(index, starts, ends, 'OtherCharges_Table', 'ChargeType', desc, row)
+
+        rate_data[key] = np.round(rate, 10)
+
+    zeros = np.zeros(len(starts))
+
+    def summer_demand_rate(start_time, end_time):
+        return index.effective_rates(
+            'DemandTime_Table', 'RatekW', '', ends,
+            StartTime=start_time, EndTime=end_time, Season='june-sept'
+        )
+
+    return {
+        'midpeak_rate_summer': summer_demand_rate("800", "1759"),
+        'peak_rate_summer': summer_demand_rate("800", "2159"),
+        'as_used_rate_nonsummer': _extract_many(
+            index, starts, ends,
+            'DemandTime_Table', 'RatekW',
+            'As-used Daily Demand Delivery Charge',
+            {'Weighted': False, 'Prorated': False}
+        ),
+        'surcharge_rate': zeros,
+        'customer_charge': rate_data.get('customer_charge', zeros),
+        'processing_charge': rate_data.get('billing_and_payment_processing_ch', zeros),
+        'contract_demand_rate': _extract_many(
+            index, starts, ends,
+            'Demand_Table', 'RatekW',
+            'Contract Demand Delivery Charge',
+            {'Weighted': False, 'Prorated': True}
+        ),
+        'delivery_tax_rate': zeros,  # not implemented
+    }
+
+def extract_rate_matrix(rates, charges_df, periods, city="New York City", charge_types=[0, 2]):
+    """
+    Resolve rates for many billing periods in one vectorized pass.
+
+    Parameters:
+    - rates (dict or RateIndex): Rate history or its compiled index
+    - charges_df (pd.DataFrame): Charge configuration (``GetChargeConfig``)
+    - periods: Sequence of ``(start_date, end_date)`` pairs, or a DataFrame
+      with ``DateFrom``/``DateTo`` columns
+    - charge_types (list, optional): ServiceTypeIds included in the kWh surcharge
+
+    Returns:
+    - pd.DataFrame: One row per period (in input order) with the scalar keys of
+      ``extract_rate_data`` as columns, plus one ``kwh:<charge_key>`` column per
+      kWh charge in the surcharge breakdown. Values match ``extract_rate_data``
+      for the same period.
+    """
+    index = rates if isinstance(rates, RateIndex) else compile_rate_index(rates)
+    starts, ends = _period_bounds(periods)
+
+    columns = _rate_columns(index, charges_df, starts, ends)
+    kwh_charges = {key: rate for key, _, rate in _kwh_charge_rates(index, charges_df, starts, ends, charge_types)}
+
+    surcharge = np.zeros(len(starts))
+    for rate in kwh_charges.values():
+        surcharge = surcharge + rate
+    columns['surcharge_rate'] = surcharge
+    for key, rate in kwh_charges.items():
+        columns[KWH_CHARGE_PREFIX + key] = rate
+
+    frame_index = periods.index if isinstance(periods, pd.DataFrame) else None
+    return pd.DataFrame(columns, index=frame_index)
+
+def _scenario_mask(kwh_rates, charge_types):
+    # A kWh charge counts once per key, the last one in configuration order
+    # winning, as in the ``kwh_charge_breakdown`` dict of ``extract_rate_data``
+    mask = np.zeros(len(kwh_rates), dtype=bool)
+    last = {}
+    for position, (key, service_type, _) in enumerate(kwh_rates):
+        if service_type in charge_types:
+            last[key] = position
+    mask[list(last.values())] = True
+    return mask
+
+def extract_scenario_rates(rates, charges_df, periods, scenarios, city="New York City"):
+    """
+    Resolve rates for many billing periods under several charge-type scenarios in one pass.
+
+    Only the kWh surcharge depends on the charge types. Every other rate is
+    resolved once, every kWh charge of the union of the scenarios' types is
+    resolved once into a period-by-charge matrix, and each scenario's
+    surcharge is a masked sum over its columns, so extra scenarios cost a
+    matrix product rather than another full rate resolution.
+
+    Parameters:
+    - rates (dict or RateIndex): Rate history or its compiled index
+    - charges_df (pd.DataFrame): Charge configuration (``GetChargeConfig``)
+    - periods: As for ``extract_rate_matrix``
+    - scenarios (dict): Scenario name -> ServiceTypeIds, e.g.
+      ``{'transmission_delivery': [0, 2], 'transmission_supply': [0, 1]}``
+
+    Returns:
+    - dict: Scenario name -> rate matrix, as ``extract_rate_matrix`` returns
+      for that scenario's ``charge_types``
+    """
+    index = rates if isinstance(rates, RateIndex) else compile_rate_index(rates)
+    starts, ends = _period_bounds(periods)
+    frame_index = periods.index if isinstance(periods, pd.DataFrame) else None
+
+    columns = _rate_columns(index, charges_df, starts, ends)
+    union = sorted(set().union(*(set(types) for types in scenarios.values())))
+    kwh_rates = _kwh_charge_rates(index, charges_df, starts, ends, union)
+
+    charge_matrix = np.column_stack([rate for _, _, rate in kwh_rates]) if kwh_rates else np.zeros((len(starts), 0))
+    masks = np.zeros((len(kwh_rates), len(scenarios)), dtype=bool)
+    for column, charge_types in enumerate(scenarios.values()):
+        masks[:, column] = _scenario_mask(kwh_rates, charge_types)
+    surcharges = charge_matrix @ masks
+
+    scenario_rates = {}
+    for column, name in enumerate(scenarios):
+        scenario_columns = dict(columns, surcharge_rate=surcharges[:, column])
+        for (key, _, rate), included in zip(kwh_rates, masks[:, column]):
+            if included:
+                scenario_columns[KWH_CHARGE_PREFIX + key] = rate
+        scenario_rates[name] = pd.DataFrame(scenario_columns, index=frame_index)
+    return scenario_rates
+
+def rate_data_from_matrix(rate_matrix, row):
+    """Rebuild the ``extract_rate_data`` dict for one row label of a rate matrix."""
+    values = rate_matrix.loc[row]
+    rate_data = {}
+    kwh_charges = {}
+    for column, value in values.items():
+        if column.startswith(KWH_CHARGE_PREFIX):
+            kwh_charges[column[len(KWH_CHARGE_PREFIX):]] = float(value)
+        else:
+            rate_data[column] = float(value)
+    rate_data['kwh_charge_breakdown'] = kwh_charges
+    return rate_data
+
+def _in_clause(values):
+    return ','.join('?' * len(values))
+
+def GetChargeHistories(conn1, rate_ids):
+    '''
+    RateHistory of several rates in one query.
+
+    Returns:
+    - dict: RateAcuityRateId -> parsed rate history dict
+    '''
+    rate_ids = [int(r) for r in rate_ids]
+    sql1 = f"""SELECT [Id]
         ,[RateAcuityRateId]
         ,[EffectiveDate]
         ,[RateHistory]
@@ -270,16 +642,34 @@ def GetChargeHistory(conn1):
         ,[ModifiedBy]
         ,[ModifiedDate]
     FROM [ExternalData].[dbo].[RateAcuityRateHistory]
-    WHERE RateAcuityRateId = 22
+    WHERE RateAcuityRateId IN ({_in_clause(rate_ids)})
     """
-    return string_to_list(pd.read_sql(sql1,conn1)['RateHistory'][0])[0]
+    history = read_sql(conn1, sql1, rate_ids, label='GetChargeHistories')
+
+    histories = {}
+    for rate_id in rate_ids:
+        rows = history.loc[history['RateAcuityRateId'] == rate_id, 'RateHistory']
+        if rows.empty:
+            raise LookupError(f"No RateHistory found for RateAcuityRateId {rate_id}")
+        histories[rate_id] = parse_rate_history(rows.iloc[0])[0]
+    return histories
 
-def GetChargeConfig(conn1, charge_types=[0, 2]):
+def GetChargeHistory(conn1, rate_id=DEFAULT_RATE_ID):
+    return GetChargeHistories(conn1, [rate_id])[int(rate_id)]
+
+def GetChargeConfigs(conn1, rate_ids, charge_types=[0, 2]):
+    '''
+    ChargeConfiguration of several rates in one query.
+
+    Returns:
+    - dict: RateAcuityRateId -> charge configuration DataFrame
+    '''
+    rate_ids = [int(r) for r in rate_ids]
     # Convert charge_types list to comma-separated string for SQL IN clause
     charge_types_str = ','.join(map(str, charge_types))
     
     sql1 = f"""
-    SELECT TOP (1000) [Id]
+    SELECT [Id]
         ,[RateAcuityRateId]
         ,[RateAcuityChargeId]
         ,[RateAcuityChargeDescription] AS 'Description'
@@ -304,8 +694,15 @@ def GetChargeConfig(conn1, charge_types=[0, 2]):
         ,[ModifiedBy]
         ,[ModifiedDate]
     FROM [ExternalData].[dbo].[ChargeConfiguration]
-    WHERE RateAcuityRateId = 22
+    WHERE RateAcuityRateId IN ({_in_clause(rate_ids)})
     AND RateAcuityChargeDescription NOT LIKE '%Average Supply Charge%'
     AND [ChargeTypeId] IN ({charge_types_str})
     """
-    return pd.read_sql(sql1,conn1)
\ No newline at end of file
+    charges = read_sql(conn1, sql1, rate_ids, label='GetChargeConfigs')
+    return {
+        rate_id: charges[charges['RateAcuityRateId'] == rate_id].reset_index(drop=True)
+        for rate_id in rate_ids
+    }
+
+def GetChargeConfig(conn1, charge_types=[0, 2], rate_id=DEFAULT_RATE_ID):
+    return GetChargeConfigs(conn1, [rate_id], charge_types)[int(rate_id)]
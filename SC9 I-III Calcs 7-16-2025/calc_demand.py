@@ -1,15 +1,15 @@
 import pandas as pd 
 import numpy as np 
-import pyodbc
-import ast
-from datetime import timedelta
+from numpy.lib.stride_tricks import sliding_window_view
 
 
 import sys
 import os
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, BASE_DIR)
-import AccConv as ac
+
+INTERVAL_MINUTES = 5
+DEMAND_WINDOW = 6  # 5-minute intervals in the 30-minute demand window
 
 def add_peak_columns(ami):
     on_peak_start = 8   
@@ -31,23 +31,91 @@ def add_peak_columns(ami):
 
     return ami
 
+def _aggregate_intervals(ami):
+    '''
+    Total usage per 5-minute KWH interval, sorted by time.
+
+    Returns:
+    - tuple: ``(start, end, usage)`` numpy arrays (datetime64[ns], datetime64[ns], float)
+    '''
+    start = pd.to_datetime(ami['StartDate'])
+    end = pd.to_datetime(ami['EndDate'])
+    keep = ((end - start).dt.total_seconds() / 60 == INTERVAL_MINUTES) & (ami['UsageUnit'] == 'KWH')
+
+    # Every kept interval is exactly 5 minutes, so StartDate alone identifies it
+    start = start[keep].to_numpy(dtype='datetime64[ns]')
+    usage = ami['Usage'][keep].to_numpy(dtype='float')
+    order = np.argsort(start, kind='stable')
+    start, usage = start[order], np.nan_to_num(usage[order])
+
+    firsts = np.flatnonzero(np.r_[True, start[1:] != start[:-1]]) if len(start) else np.array([], dtype=int)
+    start = start[firsts]
+    usage = np.add.reduceat(usage, firsts) if len(firsts) else usage[:0]
+    return start, start + np.timedelta64(INTERVAL_MINUTES, 'm'), usage
+
+
 def CalcCoinDemand(bills, ami):
-    bills['AMI Demand'] = np.nan
-    bills['AMI Usage'] = np.nan
-
-    ami['StartDate'] = pd.to_datetime(ami['StartDate'])
-    ami['EndDate'] = pd.to_datetime(ami['EndDate'])
-    ami = ami[(ami['EndDate'] - ami['StartDate']).dt.total_seconds() / 60 == 5]
-    ami = ami[(ami['UsageUnit'] == 'KWH')]
-
-    for i in bills.index:
-        rel_ami = ami[(ami['StartDate'] >= bills['DateFrom'][i] + timedelta(days=1)) & 
-                      (ami['EndDate'] <= bills['DateTo'][i])]
-        
-        if rel_ami.shape[0] > 0:
-            rel_ami = pd.DataFrame(rel_ami.groupby(['StartDate', 'EndDate'])['Usage'].sum()).reset_index()
-
-            bills['AMI Demand'][i] = rel_ami['Usage'].rolling(6).sum().max() * 2
-            bills['AMI Usage'][i] = rel_ami['Usage'].sum()
+    '''
+    Coincident 30-minute peak demand and total usage from AMI for every bill.
+
+    The intervals are aggregated and sorted once, and each bill's intervals
+    (starting the day after DateFrom, ending by DateTo) are found with
+    ``searchsorted``. The peak is the largest sum of 6 consecutive intervals
+    within the bill, times 2.
+
+    Parameters:
+    - bills (DataFrame): Bills with DateFrom and DateTo
+    - ami (DataFrame or iterable of DataFrames): AMI intervals with StartDate,
+      EndDate, Usage and UsageUnit. An iterable is read chunk by chunk in
+      date order (chunks must not overlap), so only one chunk is held at a time.
+
+    Returns:
+    - DataFrame: bills with ``AMI Demand`` and ``AMI Usage`` added (NaN where a
+      bill has no intervals; demand is also NaN with fewer than 6 intervals)
+    '''
+    chunks = [ami] if isinstance(ami, pd.DataFrame) else ami
+
+    period_start = (pd.to_datetime(bills['DateFrom']) + pd.Timedelta(days=1)).to_numpy(dtype='datetime64[ns]')
+    period_end = pd.to_datetime(bills['DateTo']).to_numpy(dtype='datetime64[ns]')
+
+    n_bills = len(bills)
+    usage_total = np.zeros(n_bills)
+    interval_count = np.zeros(n_bills, dtype=int)
+    peak = np.full(n_bills, np.nan)
+
+    # The last DEMAND_WINDOW - 1 intervals of the previous chunk, so windows
+    # spanning a chunk boundary are still seen
+    carry = (np.array([], dtype='datetime64[ns]'), np.array([], dtype='datetime64[ns]'), np.array([]))
+
+    for chunk in chunks:
+        start, end, usage = _aggregate_intervals(chunk)
+        if len(start) == 0:
+            continue
+        if len(carry[0]) and start[0] <= carry[0][-1]:
+            raise ValueError("AMI chunks must be in date order and must not overlap")
+
+        n_carry = len(carry[0])
+        start = np.concatenate([carry[0], start])
+        end = np.concatenate([carry[1], end])
+        usage = np.concatenate([carry[2], usage])
+
+        lo = np.searchsorted(start, period_start, side='left')
+        hi = np.searchsorted(end, period_end, side='right')
+        new_lo = np.maximum(lo, n_carry)
+
+        cumulative = np.concatenate([[0.0], np.cumsum(usage)])
+        usage_total += np.where(hi > new_lo, cumulative[np.maximum(hi, new_lo)] - cumulative[new_lo], 0.0)
+        interval_count += np.maximum(hi - new_lo, 0)
+
+        if len(usage) >= DEMAND_WINDOW:
+            windows = sliding_window_view(usage, DEMAND_WINDOW).sum(axis=1)
+            for b in np.flatnonzero(hi - lo >= DEMAND_WINDOW):
+                peak[b] = np.fmax(peak[b], windows[lo[b]:hi[b] - DEMAND_WINDOW + 1].max())
+
+        carry = (start[-(DEMAND_WINDOW - 1):], end[-(DEMAND_WINDOW - 1):], usage[-(DEMAND_WINDOW - 1):])
+
+    has_intervals = interval_count > 0
+    bills['AMI Demand'] = np.where(has_intervals, peak * 2, np.nan)
+    bills['AMI Usage'] = np.where(has_intervals, usage_total, np.nan)
 
     return bills
@@ -4,6 +4,21 @@ Helper functions for working with different charge type combinations in the bill
 
 import pandas as pd
 import json
+import os
+
+from bill_calc import (
+    BASE_DIR,
+    calculate_bill,
+    calculate_bills,
+    calculate_scenarios,
+    compile_rate_index,
+    extract_rate_matrix,
+    extract_scenario_rates,
+)
+from rate_cache import RateDataMemo
+
+CHARGE_CONFIG_PATH = os.path.join(BASE_DIR, 'charge_config.csv')
+CHARGE_HISTORY_PATH = os.path.join(BASE_DIR, 'charge_history.json')
 
 def get_charge_types_info():
     """Return information about available charge type combinations."""
@@ -35,6 +50,11 @@ def get_charge_types_info():
         }
     }
 
+def charge_scenarios(names=None):
+    """Scenario name -> charge types, for ``bill_calc.extract_scenario_rates``; all combinations by default."""
+    info = get_charge_types_info()
+    return {name: info[name]['types'] for name in (names or info)}
+
 def filter_charges_by_type(charges_df, charge_types):
     """Filter charge configuration DataFrame by service type IDs."""
     return charges_df[charges_df['ServiceTypeId'].isin(charge_types)]
@@ -100,69 +120,124 @@ def print_charge_comparison():
     if len(unique_to_td) > 10:
         print(f"  ... and {len(unique_to_td) - 10} more")
 
-def create_bill_calculator_wrapper():
-    """Create a wrapper function that makes it easy to calculate bills with different charge types."""
-    
-    wrapper_code = '''
-def calculate_bill_with_charge_types(
-    billing_df, usage_kwh, start_date, end_date, 
-    contract_demand_kW=0.0, charge_combination='transmission_delivery'
-):
+class BillCalculator:
     """
-    Calculate electric bill with specified charge type combination.
-    
+    Bill calculator for any charge type combination, loaded once and reused.
+
+    The charge configuration and rate history are read and compiled when the
+    calculator is created, and ``extract_rate_data`` results are memoized per
+    (period, charge types) in a bounded LRU, so pricing many bills costs no
+    file reads and no repeated rate resolution.
+
+    A combination's ServiceTypeIds select the kWh charges that make up the
+    energy surcharge, as ``charge_types`` does for ``extract_rate_data``;
+    customer, processing and demand charges apply under every combination.
+
     Parameters:
-    - billing_df: DataFrame with demand data
-    - usage_kwh: Total energy usage
-    - start_date, end_date: Billing period
-    - contract_demand_kW: Contract demand
-    - charge_combination: One of:
-        - 'transmission_delivery' (types [0,2]) - Default
-        - 'transmission_supply' (types [0,1])
-        - 'transmission_only' (types [0])
-        - 'supply_only' (types [1])
-        - 'delivery_only' (types [2])
-    
-    Returns:
-    - Dictionary with bill breakdown and total
+    - charges_df (pd.DataFrame, optional): Charge configuration; read from
+      ``config_path`` when omitted
+    - rates (dict or RateIndex, optional): Rate history; read from
+      ``history_path`` when omitted
+    - config_path, history_path (str, optional): Files to load from
+    - cache_size (int, optional): Most rate lookups kept in the LRU
     """
-    
-    # Load data
-    charges_df = pd.read_csv('../charge_config.csv')
-    with open('../charge_history.json', 'r') as f:
-        rates = json.load(f)
-    
-    # Get charge types for the specified combination
-    charge_info = get_charge_types_info()
-    if charge_combination not in charge_info:
-        raise ValueError(f"Invalid combination. Choose from: {list(charge_info.keys())}")
-    
-    charge_types = charge_info[charge_combination]['types']
-    
-    # Filter charges
-    filtered_charges = filter_charges_by_type(charges_df, charge_types)
-    
-    # Extract rate data
-    rate_data = extract_rate_data(
-        rates, filtered_charges, start_date, end_date, 
-        charge_types=charge_types
-    )
-    
-    # Calculate bill
-    bill = calculate_bill(
-        billing_df, usage_kwh, start_date, end_date,
-        rate_data, contract_demand_kW, charge_types
-    )
-    
-    # Add metadata
-    bill['charge_combination'] = charge_combination
-    bill['charge_types'] = charge_types
-    bill['rate_data'] = rate_data
-    
-    return bill
-'''
-    
-    return wrapper_code
+
+    def __init__(self, charges_df=None, rates=None, config_path=CHARGE_CONFIG_PATH,
+                 history_path=CHARGE_HISTORY_PATH, cache_size=1024):
+        if charges_df is None:
+            charges_df = pd.read_csv(config_path)
+        if rates is None:
+            with open(history_path, 'r') as f:
+                rates = json.load(f)
+        self.charges_df = charges_df
+        self.index = compile_rate_index(rates)
+        self.memo = RateDataMemo(maxsize=cache_size)
+
+    @staticmethod
+    def charge_types(charge_combination):
+        """ServiceTypeIds of a combination name (see ``get_charge_types_info``) or of a list of ids."""
+        if isinstance(charge_combination, str):
+            charge_info = get_charge_types_info()
+            if charge_combination not in charge_info:
+                raise ValueError(f"Invalid combination. Choose from: {list(charge_info.keys())}")
+            return tuple(charge_info[charge_combination]['types'])
+        return tuple(charge_combination)
+
+    def rate_data(self, start_date, end_date, charge_combination='transmission_delivery'):
+        """
+        ``extract_rate_data`` for one period, memoized per (period, charge types).
+
+        The returned dict is shared with later calls for the same period; do not modify it.
+        """
+        charge_types = self.charge_types(charge_combination)
+        return self.memo.rate_data(self.index, self.charges_df, start_date, end_date, charge_types)
+
+    @property
+    def hits(self):
+        return self.memo.hits
+
+    @property
+    def misses(self):
+        return self.memo.misses
+
+    def calculate(self, billing_df, usage_kwh, start_date, end_date, contract_demand_kW=0.0,
+                  charge_combination='transmission_delivery'):
+        """
+        Calculate one electric bill with the given charge type combination.
+
+        Parameters:
+        - billing_df: DataFrame or ``DailyDemandIndex`` with demand data
+        - usage_kwh: Total energy usage
+        - start_date, end_date: Billing period
+        - contract_demand_kW: Contract demand
+        - charge_combination: A name from ``get_charge_types_info``
+          (default ``'transmission_delivery'``, types [0,2]) or a list of
+          ServiceTypeIds
+
+        Returns:
+        - Dictionary with bill breakdown and total, plus ``charge_combination``,
+          ``charge_types`` and the ``rate_data`` used
+        """
+        charge_types = self.charge_types(charge_combination)
+        rate_data = self.rate_data(start_date, end_date, charge_types)
+
+        bill = calculate_bill(
+            billing_df, usage_kwh, start_date, end_date,
+            rate_data, contract_demand_kW, list(charge_types)
+        )
+
+        bill['charge_combination'] = charge_combination
+        bill['charge_types'] = list(charge_types)
+        bill['rate_data'] = rate_data
+
+        return bill
+
+    def calculate_many(self, bills_df, daily_demand_df, charge_combination='transmission_delivery'):
+        """
+        Calculate many bills at once with ``calculate_bills``.
+
+        Parameters:
+        - bills_df, daily_demand_df: As for ``bill_calc.calculate_bills``
+        - charge_combination: One combination (name or list of ids), or a
+          list of combination names; their rates are then resolved in one
+          ``extract_scenario_rates`` pass and the demand determinants
+          computed once for all of them
+
+        Returns:
+        - pd.DataFrame: ``calculate_bills`` output for one combination, or a
+          dict of them keyed by combination name
+        """
+        if isinstance(charge_combination, (list, tuple)) and all(isinstance(c, str) for c in charge_combination):
+            scenarios = {name: list(self.charge_types(name)) for name in charge_combination}
+            scenario_rates = extract_scenario_rates(self.index, self.charges_df, bills_df, scenarios)
+            return calculate_scenarios(bills_df, daily_demand_df, scenario_rates)
+
+        return calculate_bills(bills_df, daily_demand_df, self.rate_matrix(bills_df, charge_combination))
+
+    def rate_matrix(self, periods, charge_combination='transmission_delivery'):
+        """``extract_rate_matrix`` for many periods under one combination."""
+        charge_types = list(self.charge_types(charge_combination))
+        return extract_rate_matrix(self.index, self.charges_df, periods, charge_types=charge_types)
 
 if __name__ == "__main__":
     print_charge_comparison()
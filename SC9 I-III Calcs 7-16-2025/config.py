@@ -1,14 +1,42 @@
-import pyodbc
 import pandas as pd
+import numpy as np
 
-conn1 = pyodbc.connect('Driver={SQL Server};'
-                              'Server=UTIL-PROD-DB;'
-                              'Database=NewClientInfo;')
+from db_pool import DEFAULT_POOL_SIZE, ConnectionPool, fetch_all
 
-def GetElecBills(Anumber, conn1):
-    '''Takes account number, not account ID'''
+CONNECTION_STRING = ('Driver={SQL Server};'
+                     'Server=UTIL-PROD-DB;'
+                     'Database=NewClientInfo;')
 
-    sql1 = """SELECT distinct Bill.[AccountID] as AccountID
+# Shared per-process connection and pool, created on first use
+_shared = {}
+
+def connect():
+    '''Open a new connection to UTIL-PROD-DB.'''
+    import pyodbc
+    return pyodbc.connect(CONNECTION_STRING)
+
+def get_connection():
+    '''This process's shared UTIL-PROD-DB connection, opened on first use.'''
+    if 'conn' not in _shared:
+        _shared['conn'] = connect()
+    return _shared['conn']
+
+def get_pool(size=DEFAULT_POOL_SIZE):
+    '''
+    This process's shared ``ConnectionPool`` to UTIL-PROD-DB. ``size`` only
+    applies to the first call, which creates the pool.
+    '''
+    if 'pool' not in _shared:
+        _shared['pool'] = ConnectionPool(connect, size=size)
+    return _shared['pool']
+
+def __getattr__(name):
+    # ``from config import conn1`` still works, but only connects when asked for
+    if name == 'conn1':
+        return get_connection()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+ELEC_BILLS_SQL = """SELECT distinct Bill.[AccountID] as AccountID
                                 ,Acc.[AccountNumber] as AccountNumber
                     ,Client.[CompanyName] as Client
                     ,CONVERT(datetime,Bill.[DateFrom], 1) As DateFrom
@@ -22,28 +50,79 @@ def GetElecBills(Anumber, conn1):
                 FROM [NewClientInfo].[dbo].[EGOS_BillingDetails] Bill
                 JOIN [NewClientInfo].[dbo].[Accounts] Acc on Acc.[AccountID]=Bill.[AccountID]
                 JOIN [NewClientInfo].[dbo].[Client] on [NewClientInfo].[dbo].[Client].[ClientID]=Acc.[AccountClientID]
-                WHERE Bill.[Revised] = 0 and Acc.[AccountInvoicePrefix] = 'E' and Acc.[AccountID] = ?
-                ORDER BY [DateTo] desc"""
-    bills = pd.read_sql(sql1, conn1, params = [Anumber])
-    
+                WHERE Bill.[Revised] = 0 and Acc.[AccountInvoicePrefix] = 'E' and Acc.[AccountID] IN ({accounts})
+                ORDER BY [AccountID], [DateTo] desc"""
+
+# SQL Server allows 2100 parameters per statement
+BILLS_CHUNK_SIZE = 1000
+
+def _add_bill_metrics(bills):
+    '''
+    Add ``Days`` and ``Load Factor`` to a bills frame of one or many accounts.
+    Zero-demand bills get a load factor of 0.
+    '''
     bills['DateFrom'] = bills['DateFrom'].astype('datetime64[ns]')
     bills['DateTo'] = bills['DateTo'].astype('datetime64[ns]')
-    
 
-    bills['Days'] = (bills['DateTo']-bills['DateFrom'])
-    
-    for i in bills.index:
-        bills['Days'][i]=bills['Days'][i].days
-    bills['Load Factor'] = float(0)
-    for i in bills.index:
-        if bills['Demand'][i] != 0:
-            bills['Load Factor'][i] = bills['Usage'][i] / (bills['Demand'][i]*bills['Days'][i]*24)
-    bills['Load Factor'] = bills['Load Factor'].astype('float')
-    bills['Load Factor'] = bills['Load Factor'].round(2)
-        
+    bills['Days'] = (bills['DateTo'] - bills['DateFrom']).dt.days
+
+    demand = bills['Demand'].astype('float')
+    usage = bills['Usage'].astype('float')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        load_factor = np.where(demand != 0, usage / (demand * bills['Days'] * 24), 0.0)
+    bills['Load Factor'] = pd.Series(load_factor, index=bills.index, dtype='float').round(2)
 
     return bills
 
+def GetElecBillsBulk(account_ids, conn1, chunk_size=BILLS_CHUNK_SIZE):
+    '''
+    Electric bills of many accounts, fetched in chunks of ``chunk_size``
+    AccountIDs per query instead of one query per account. With a
+    ``ConnectionPool`` the chunks are fetched side by side.
+
+    Parameters:
+    - account_ids (list): AccountIDs
+    - conn1: DB connection or ``ConnectionPool``
+    - chunk_size (int, optional): AccountIDs per query
+
+    Returns:
+    - dict: AccountID -> bills DataFrame (newest first, same columns as
+      ``GetElecBills``); accounts without bills map to an empty frame
+    '''
+    account_ids = list(dict.fromkeys(int(a) for a in account_ids))
+
+    queries = []
+    for i in range(0, len(account_ids), chunk_size):
+        chunk = account_ids[i:i + chunk_size]
+        queries.append((ELEC_BILLS_SQL.format(accounts=','.join('?' * len(chunk))), chunk))
+    chunks = fetch_all(conn1, queries, label='GetElecBillsBulk')
+    return group_bills(pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(), account_ids)
+
+def group_bills(bills, account_ids):
+    '''
+    Split a bills frame of many accounts (``ELEC_BILLS_SQL`` rows, newest
+    first per account) into ``GetElecBillsBulk``'s AccountID -> bills dict,
+    adding ``Days`` and ``Load Factor``.
+    '''
+    if len(bills):
+        bills = _add_bill_metrics(bills)
+
+    by_account = {}
+    if len(bills):
+        by_account = {int(a): group.reset_index(drop=True) for a, group in bills.groupby('AccountID', sort=False)}
+    empty = bills.iloc[0:0]
+    return {int(a): by_account.get(int(a), empty) for a in account_ids}
+
+def GetElecBills(Anumber, conn1, bills_by_account=None):
+    '''Takes account number, not account ID
+
+    With ``bills_by_account`` (from ``GetElecBillsBulk``) the bills are taken
+    from that instead of querying the database.
+    '''
+    if bills_by_account is None:
+        bills_by_account = GetElecBillsBulk([Anumber], conn1)
+    return bills_by_account[int(Anumber)].copy()
+
 def print_bill_summary(bill):
     print("Itemized Bill Summary:\n")
     
@@ -0,0 +1,483 @@
+"""
+Pluggable data sources for the portfolio run.
+
+A run reads six things: target accounts, bills, AMI intervals, rate
+history, charge configuration and the tax table. Each source serves all six
+from one backend:
+
+- ``SQLServerSource``: UTIL-PROD-DB, the ``Q:`` tax workbook and ``AccConv``,
+  as the production run always has
+- ``FixtureSource``: a directory of Parquet/CSV/JSON files
+- ``SQLiteSource``: one SQLite database
+
+``record_portfolio`` copies a portfolio from any source (typically SQL Server)
+into a fixture directory or SQLite database, and ``write_synthetic_portfolio``
+generates one of any size, so the full ``main.py`` pipeline can be run and
+profiled offline:
+
+    python data_sources.py synthesize fixtures.db --accounts 1000
+    python main.py --data fixtures.db --output out
+
+Fixture directory layout (``.parquet`` is read in place of ``.csv`` when present):
+
+    target_accounts.csv     GetTargetAccs output
+    bills.csv               ELEC_BILLS_SQL rows
+    ami/<AccountID>.csv     StartDate, EndDate, Usage, UsageUnit
+    charge_history.json     {RateAcuityRateId: rate history}
+    charge_config.csv       GetChargeConfigs rows
+    SalesGRTax.csv          the tax table (or SalesGRTax.xlsx)
+
+The SQLite database holds the same tables as ``TargetAccounts``, ``Bills``,
+``AMI`` (with AccountID), ``ChargeHistory`` (RateAcuityRateId, RateHistory
+as JSON text), ``ChargeConfiguration`` and ``SalesGRTax``.
+
+AMI data is read inside the worker processes, so each source hands
+``run_portfolio`` a picklable ``ami_fetcher()`` with the
+``fetch(account_id, unit, since=None)`` signature ``AMICache`` uses.
+"""
+
+import argparse
+import json
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+import sys
+import os
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+from ami_cache import fetch_accconv
+from apply_tax import SQLITE_EXTENSIONS, TAX_TABLE_PATH, load_tax_table
+from bill_calc import DEFAULT_RATE_ID, GetChargeConfigs, GetChargeHistories
+from config import GetElecBillsBulk, get_pool, group_bills
+from rate_cache import RateCache, build_rate_source, schedule_rate_ids
+from result_sink import HAS_PARQUET
+from target_accounts import GetTargetAccs
+
+AMI_COLUMNS = ['StartDate', 'EndDate', 'Usage', 'UsageUnit']
+BILL_DATES = ['DateFrom', 'DateTo']
+# Rows of ChargeConfiguration that GetChargeConfigs leaves out
+EXCLUDED_CHARGES = 'Average Supply Charge'
+SQL_CHUNK_SIZE = 900
+
+
+def _empty_ami():
+    return pd.DataFrame({
+        'StartDate': pd.Series(dtype='datetime64[ns]'),
+        'EndDate': pd.Series(dtype='datetime64[ns]'),
+        'Usage': pd.Series(dtype='float64'),
+        'UsageUnit': pd.Series(dtype='object'),
+    })
+
+
+def _filter_ami(ami, unit, since):
+    ami = ami[ami['UsageUnit'] == unit]
+    if since is not None:
+        ami = ami[ami['EndDate'] > pd.Timestamp(since)]
+    return ami.sort_values('StartDate', kind='stable').reset_index(drop=True)[AMI_COLUMNS]
+
+
+def _filter_charges(charges, rate_ids, charge_types):
+    charges = charges[
+        charges['RateAcuityRateId'].isin(rate_ids)
+        & charges['ChargeTypeId'].isin(charge_types)
+        & ~charges['Description'].str.contains(EXCLUDED_CHARGES, regex=False)
+    ]
+    return {
+        rate_id: charges[charges['RateAcuityRateId'] == rate_id].reset_index(drop=True)
+        for rate_id in rate_ids
+    }
+
+
+def _sort_bills(bills):
+    # ELEC_BILLS_SQL order: by account, newest bill first
+    return bills.sort_values(['AccountID', 'DateTo'], ascending=[True, False], kind='stable').reset_index(drop=True)
+
+
+class _LocalSource:
+    """Shared rate-source and target-account logic of the offline backends."""
+
+    def target_accounts(self, schedules=['Standard']):
+        """Recorded ``GetTargetAccs`` rows of the given comparisons."""
+        targets = self._target_table()
+        return targets[targets['Schedule'].isin(schedules)].reset_index(drop=True)
+
+    def rate_sources(self, schedules, charge_types=[0, 2], rate_ids=None):
+        """Comparison name -> rate source, as ``RateCache.get_schedules`` returns."""
+        resolved = schedule_rate_ids(schedules, rate_ids)
+        unique_ids = list(dict.fromkeys(resolved.values()))
+        histories = self.charge_histories(unique_ids)
+        configs = self.charge_configs(unique_ids, charge_types)
+        missing = [rate_id for rate_id in unique_ids if rate_id not in histories]
+        if missing:
+            raise LookupError(f"No rate history recorded for rates {missing}")
+        return {
+            name: build_rate_source(rate_id, sorted(charge_types), histories[rate_id], configs[rate_id])
+            for name, rate_id in resolved.items()
+        }
+
+    def timings(self):
+        return {}
+
+
+class FixtureAMI:
+    """Picklable AMI fetcher over ``<directory>/ami/<AccountID>.{parquet,csv}``."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self, account_id, unit='KWH', since=None):
+        base = os.path.join(self.directory, 'ami', str(int(account_id)))
+        if os.path.exists(base + '.parquet'):
+            ami = pd.read_parquet(base + '.parquet')
+        elif os.path.exists(base + '.csv'):
+            ami = pd.read_csv(base + '.csv', parse_dates=['StartDate', 'EndDate'])
+        else:
+            return _empty_ami()
+        return _filter_ami(ami, unit, since)
+
+
+class FixtureSource(_LocalSource):
+    """
+    Portfolio served from a fixture directory (see the module docstring).
+
+    Parameters:
+    - directory (str): Fixture directory
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, name, extensions=('.parquet', '.csv')):
+        for extension in extensions:
+            path = os.path.join(self.directory, name + extension)
+            if os.path.exists(path):
+                return path
+        raise FileNotFoundError(f"No {name} fixture in {self.directory}")
+
+    def _read(self, name, parse_dates=()):
+        path = self._path(name)
+        if path.endswith('.parquet'):
+            return pd.read_parquet(path)
+        return pd.read_csv(path, parse_dates=list(parse_dates))
+
+    @property
+    def tax_table_path(self):
+        return self._path('SalesGRTax', ('.parquet', '.csv', '.xlsx'))
+
+    def _target_table(self):
+        return self._read('target_accounts', parse_dates=['LatestEndDate'])
+
+    def bills(self, account_ids):
+        """AccountID -> bills, as ``GetElecBillsBulk`` returns."""
+        account_ids = [int(a) for a in account_ids]
+        bills = self._read('bills', parse_dates=BILL_DATES)
+        return group_bills(_sort_bills(bills[bills['AccountID'].isin(account_ids)]), account_ids)
+
+    def charge_histories(self, rate_ids):
+        with open(os.path.join(self.directory, 'charge_history.json'), 'r') as f:
+            histories = {int(rate_id): history for rate_id, history in json.load(f).items()}
+        return {int(rate_id): histories[int(rate_id)] for rate_id in rate_ids if int(rate_id) in histories}
+
+    def charge_configs(self, rate_ids, charge_types=[0, 2]):
+        charges = pd.read_csv(os.path.join(self.directory, 'charge_config.csv'))
+        return _filter_charges(charges, [int(r) for r in rate_ids], charge_types)
+
+    def ami_fetcher(self):
+        return FixtureAMI(self.directory)
+
+
+class SQLiteAMI:
+    """Picklable AMI fetcher over the ``AMI`` table of a SQLite database."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, account_id, unit='KWH', since=None):
+        sql = 'SELECT StartDate, EndDate, Usage, UsageUnit FROM AMI WHERE AccountID = ? AND UsageUnit = ?'
+        params = [int(account_id), unit]
+        if since is not None:
+            sql += ' AND EndDate > ?'
+            params.append(str(pd.Timestamp(since)))
+        with closing(sqlite3.connect(self.path)) as conn:
+            ami = pd.read_sql(sql + ' ORDER BY StartDate', conn, params=params,
+                              parse_dates=['StartDate', 'EndDate'])
+        return ami if len(ami) else _empty_ami()
+
+
+class SQLiteSource(_LocalSource):
+    """
+    Portfolio served from one SQLite database (see the module docstring).
+
+    Parameters:
+    - path (str): Database file
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.tax_table_path = path
+
+    def _query(self, sql, params=None, parse_dates=None):
+        with closing(sqlite3.connect(self.path)) as conn:
+            return pd.read_sql(sql, conn, params=params, parse_dates=parse_dates)
+
+    def _target_table(self):
+        return self._query('SELECT * FROM TargetAccounts', parse_dates=['LatestEndDate'])
+
+    def bills(self, account_ids):
+        """AccountID -> bills, as ``GetElecBillsBulk`` returns."""
+        account_ids = [int(a) for a in account_ids]
+        chunks = [
+            self._query(f"SELECT * FROM Bills WHERE AccountID IN ({','.join('?' * len(chunk))})", chunk,
+                        parse_dates=BILL_DATES)
+            for chunk in (account_ids[i:i + SQL_CHUNK_SIZE] for i in range(0, len(account_ids), SQL_CHUNK_SIZE))
+        ]
+        bills = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+        return group_bills(_sort_bills(bills) if len(bills) else bills, account_ids)
+
+    def charge_histories(self, rate_ids):
+        rows = self._query('SELECT RateAcuityRateId, RateHistory FROM ChargeHistory')
+        histories = {int(r): json.loads(h) for r, h in zip(rows['RateAcuityRateId'], rows['RateHistory'])}
+        return {int(rate_id): histories[int(rate_id)] for rate_id in rate_ids if int(rate_id) in histories}
+
+    def charge_configs(self, rate_ids, charge_types=[0, 2]):
+        return _filter_charges(self._query('SELECT * FROM ChargeConfiguration'), [int(r) for r in rate_ids],
+                               charge_types)
+
+    def ami_fetcher(self):
+        return SQLiteAMI(self.path)
+
+
+class SQLServerSource:
+    """
+    The production backend: UTIL-PROD-DB through ``conn``, the ``Q:`` tax
+    workbook and ``AccConv`` for AMI data.
+
+    Parameters:
+    - conn: DB connection or ``ConnectionPool``
+    - rate_cache_dir (str, optional): ``RateCache`` directory
+    """
+
+    tax_table_path = TAX_TABLE_PATH
+
+    def __init__(self, conn, rate_cache_dir=None):
+        self.conn = conn
+        self.rate_cache_dir = rate_cache_dir
+
+    def target_accounts(self, schedules=['Standard']):
+        return GetTargetAccs(self.conn, schedules=schedules)
+
+    def bills(self, account_ids):
+        return GetElecBillsBulk(account_ids, self.conn)
+
+    def rate_sources(self, schedules, charge_types=[0, 2], rate_ids=None):
+        return RateCache(self.conn, cache_dir=self.rate_cache_dir).get_schedules(
+            schedules, charge_types=charge_types, rate_ids=rate_ids
+        )
+
+    def charge_histories(self, rate_ids):
+        return GetChargeHistories(self.conn, rate_ids)
+
+    def charge_configs(self, rate_ids, charge_types=[0, 2]):
+        return GetChargeConfigs(self.conn, rate_ids, charge_types)
+
+    def ami_fetcher(self):
+        return fetch_accconv
+
+    def timings(self):
+        return self.conn.timings() if hasattr(self.conn, 'timings') else {}
+
+
+def open_source(path=None, conn=None, rate_cache_dir=None):
+    """
+    The data source for ``path``: a SQLite file, a fixture directory, or with
+    no path SQL Server through ``conn`` (the shared pool by default).
+    """
+    if path is None:
+        return SQLServerSource(conn if conn is not None else get_pool(), rate_cache_dir)
+    if os.path.splitext(path)[1].lower() in SQLITE_EXTENSIONS:
+        return SQLiteSource(path)
+    return FixtureSource(path)
+
+
+def write_fixtures(path, target_accounts, bills, ami, charge_histories, charge_configs, tax_table, fmt='csv'):
+    """
+    Write a portfolio as a SQLite database (``path`` ending in ``.db``,
+    ``.sqlite`` or ``.sqlite3``) or a fixture directory.
+
+    Parameters:
+    - target_accounts (pd.DataFrame): ``GetTargetAccs`` rows
+    - bills (pd.DataFrame or dict): ELEC_BILLS_SQL rows, or AccountID -> bills
+    - ami (dict or iterable): AccountID -> intervals, or ``(AccountID,
+      intervals)`` pairs; an iterable is written one account at a time
+    - charge_histories (dict): RateAcuityRateId -> rate history
+    - charge_configs (pd.DataFrame or dict): ChargeConfiguration rows, or
+      RateAcuityRateId -> rows
+    - tax_table (pd.DataFrame): ``SalesGRTax`` rows
+    - fmt (str, optional): ``'csv'`` or ``'parquet'`` for a fixture directory
+    """
+    if isinstance(bills, dict):
+        bills = pd.concat(list(bills.values()), ignore_index=True)
+    bills = bills.drop(columns=['Days', 'Load Factor'], errors='ignore')
+    if isinstance(charge_configs, dict):
+        charge_configs = pd.concat(list(charge_configs.values()), ignore_index=True)
+    if isinstance(ami, dict):
+        ami = ami.items()
+    if fmt == 'parquet' and not HAS_PARQUET:
+        raise ImportError("Parquet fixtures require pyarrow")
+
+    if os.path.splitext(path)[1].lower() in SQLITE_EXTENSIONS:
+        with closing(sqlite3.connect(path)) as conn:
+            target_accounts.to_sql('TargetAccounts', conn, index=False, if_exists='replace')
+            bills.to_sql('Bills', conn, index=False, if_exists='replace')
+            pd.DataFrame({
+                'RateAcuityRateId': [int(r) for r in charge_histories],
+                'RateHistory': [json.dumps(h) for h in charge_histories.values()],
+            }).to_sql('ChargeHistory', conn, index=False, if_exists='replace')
+            charge_configs.to_sql('ChargeConfiguration', conn, index=False, if_exists='replace')
+            tax_table.to_sql('SalesGRTax', conn, index=False, if_exists='replace')
+            conn.execute('DROP TABLE IF EXISTS AMI')
+            for account_id, intervals in ami:
+                intervals[AMI_COLUMNS].assign(AccountID=int(account_id)).to_sql('AMI', conn, index=False,
+                                                                                 if_exists='append')
+            conn.execute('CREATE INDEX IF NOT EXISTS AMI_Account ON AMI (AccountID, UsageUnit, EndDate)')
+            conn.commit()
+        return
+
+    def write(frame, name):
+        if fmt == 'parquet':
+            frame.to_parquet(os.path.join(path, name + '.parquet'), index=False)
+        else:
+            frame.to_csv(os.path.join(path, name + '.csv'), index=False)
+
+    os.makedirs(os.path.join(path, 'ami'), exist_ok=True)
+    write(target_accounts, 'target_accounts')
+    write(bills, 'bills')
+    write(tax_table, 'SalesGRTax')
+    charge_configs.to_csv(os.path.join(path, 'charge_config.csv'), index=False)
+    with open(os.path.join(path, 'charge_history.json'), 'w') as f:
+        json.dump({str(int(r)): h for r, h in charge_histories.items()}, f)
+    for account_id, intervals in ami:
+        write(intervals[AMI_COLUMNS], os.path.join('ami', str(int(account_id))))
+
+
+def record_portfolio(source, path, schedules=['Standard'], charge_types=[0, 2], rate_ids=None, fmt='csv'):
+    """
+    Copy the portfolio ``source`` serves (e.g. ``SQLServerSource``) to a
+    fixture directory or SQLite database, one account's AMI data at a time.
+    """
+    targets = source.target_accounts(schedules)
+    account_ids = [int(a) for a in targets['AccountID']]
+    resolved = list(dict.fromkeys(schedule_rate_ids(schedules, rate_ids).values()))
+    tax_table = load_tax_table(source.tax_table_path)
+    fetch = source.ami_fetcher()
+    write_fixtures(
+        path, targets, source.bills(account_ids),
+        ((account_id, fetch(account_id, 'KWH')) for account_id in account_ids),
+        source.charge_histories(resolved), source.charge_configs(resolved, charge_types),
+        tax_table[tax_table['AccountID'].isin(account_ids)], fmt=fmt,
+    )
+
+
+# --- Synthetic portfolios ---
+
+def synthetic_intervals(start, end, seed=0):
+    """5-minute KWH intervals in ``[start, end)`` with a daytime load shape."""
+    rng = np.random.default_rng(seed)
+    starts = pd.date_range(start, end, freq='5min', inclusive='left')
+    shape = 20 + 15 * np.sin(np.pi * (starts.hour.to_numpy() - 6) / 16).clip(0)
+    return pd.DataFrame({
+        'StartDate': starts,
+        'EndDate': starts + pd.Timedelta(minutes=5),
+        'Usage': shape * rng.uniform(0.8, 1.2, len(starts)),
+        'UsageUnit': 'KWH',
+    })
+
+
+def synthetic_bills(account_ids, first_read='2024-01-16', months=12, routes=20, seed=0):
+    """
+    Monthly bills shaped like ``GetElecBills`` output, one frame per account.
+
+    Accounts are spread over ``routes`` meter-read cycles a day apart, so
+    billing periods repeat across accounts as they do in the portfolio.
+    """
+    rng = np.random.default_rng(seed)
+    bills_by_account = {}
+    for position, account_id in enumerate(account_ids):
+        reads = pd.date_range(pd.Timestamp(first_read) + pd.Timedelta(days=position % routes),
+                              periods=months + 1, freq='30D')
+        bills_by_account[account_id] = pd.DataFrame({
+            'AccountID': account_id,
+            'DateFrom': reads[:-1],
+            'DateTo': reads[1:],
+            'Usage': rng.uniform(80000, 160000, months).round(),
+            'Demand': rng.uniform(300, 500, months).round(),
+            'BillAmount': rng.uniform(15000, 25000, months).round(2),
+        })
+    return bills_by_account
+
+
+def synthetic_tax_table(bills_by_account, seed=0):
+    """``SalesGRTax.xlsx``-shaped rows for every bill."""
+    rng = np.random.default_rng(seed)
+    keys = pd.concat([bills[['AccountID', 'DateFrom', 'DateTo']] for bills in bills_by_account.values()],
+                     ignore_index=True)
+    return keys.assign(SalesTaxRate=rng.choice([0.0, 4.5, 8.875], len(keys)),
+                       GRTRate=rng.choice([0.0, 0.0257, 0.0409], len(keys)))
+
+
+def write_synthetic_portfolio(path, accounts=100, months=12, fmt='csv', seed=0):
+    """
+    Write a synthetic Standard-comparison portfolio of ``accounts`` accounts
+    with ``months`` bills each, priced against the bundled
+    ``charge_history.json`` / ``charge_config.csv`` as rate ``DEFAULT_RATE_ID``.
+    """
+    bills = synthetic_bills(range(1, accounts + 1), months=months, seed=seed)
+    targets = pd.DataFrame({
+        'AccountID': list(bills),
+        'Load Zone': 'J',
+        'Full Service': False,
+        'Schedule': 'Standard',
+        'LatestEndDate': [frame['DateTo'].max() for frame in bills.values()],
+        'LatestImportId': months,
+    })
+    with open(os.path.join(BASE_DIR, 'charge_history.json'), 'r') as f:
+        history = json.load(f)
+    charges = pd.read_csv(os.path.join(BASE_DIR, 'charge_config.csv')).drop(columns='Unnamed: 0', errors='ignore')
+    charges['RateAcuityRateId'] = DEFAULT_RATE_ID
+    ami = (
+        (account_id, synthetic_intervals(frame['DateFrom'].min(), frame['DateTo'].max(), seed=seed + account_id))
+        for account_id, frame in bills.items()
+    )
+    write_fixtures(path, targets, bills, ami, {DEFAULT_RATE_ID: history}, charges,
+                   synthetic_tax_table(bills, seed=seed), fmt=fmt)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write offline portfolios for main.py --data.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    synthesize = commands.add_parser('synthesize', help='Generate a synthetic portfolio')
+    synthesize.add_argument('path', help='Fixture directory, or a .db/.sqlite file')
+    synthesize.add_argument('--accounts', type=int, default=100)
+    synthesize.add_argument('--months', type=int, default=12)
+    synthesize.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+
+    record = commands.add_parser('record', help='Copy the target portfolio from UTIL-PROD-DB')
+    record.add_argument('path', help='Fixture directory, or a .db/.sqlite file')
+    record.add_argument('--schedules', nargs='+', default=['Standard'])
+    record.add_argument('--large-rate-id', type=int, default=None)
+    record.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+
+    args = parser.parse_args()
+    if args.command == 'synthesize':
+        write_synthetic_portfolio(args.path, accounts=args.accounts, months=args.months, fmt=args.format)
+    else:
+        record_portfolio(open_source(), args.path, schedules=args.schedules,
+                         rate_ids={'Large': args.large_rate_id}, fmt=args.format)
+    print(f'Wrote {args.path}')
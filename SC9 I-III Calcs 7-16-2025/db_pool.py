@@ -0,0 +1,181 @@
+"""
+Connection pool for the SQL helpers.
+
+``ConnectionPool`` hands out at most ``size`` connections from a factory
+(``config.connect`` for UTIL-PROD-DB, or e.g. ``sqlite3.connect`` in tests).
+A connection that sat idle longer than ``check_after`` seconds is checked
+with ``SELECT 1`` before reuse and replaced if it no longer answers. A query
+that fails on a dead connection is retried once on a fresh one. Every query
+is timed under a label.
+
+The ``GetX`` helpers call ``read_sql(conn1, ...)`` and ``fetch_all`` /
+``run_concurrently``, which accept either a plain DB-API connection or a
+pool; with a pool, independent queries run side by side on a thread pool.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd
+
+DEFAULT_POOL_SIZE = 4
+HEALTH_CHECK_SQL = 'SELECT 1'
+
+
+class ConnectionPool:
+    """
+    Bounded, health-checked pool of DB connections.
+
+    Parameters:
+    - factory (callable): Opens a new connection
+    - size (int, optional): Most connections open at once
+    - check_after (float, optional): Idle seconds after which a connection is
+      health-checked before reuse; 0 checks every time
+    - acquire_timeout (float, optional): Seconds to wait for a free
+      connection before raising ``TimeoutError``; None waits indefinitely
+    """
+
+    def __init__(self, factory, size=DEFAULT_POOL_SIZE, check_after=30.0, acquire_timeout=None):
+        self.factory = factory
+        self.size = size
+        self.check_after = check_after
+        self.acquire_timeout = acquire_timeout
+        self.opened = 0
+        self.reconnects = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._timings = {}
+
+    def _healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(HEALTH_CHECK_SQL)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _open(self):
+        conn = self.factory()
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self):
+        '''Take a live connection, opening or replacing one as needed.'''
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError(f"No free connection within {self.acquire_timeout} s (pool size {self.size})")
+        try:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+
+            if time.monotonic() - last_used >= self.check_after and not self._healthy(conn):
+                self._discard(conn)
+                with self._lock:
+                    self.reconnects += 1
+                return self._open()
+            return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        '''Return a connection to the pool, or close it when ``broken``.'''
+        if broken:
+            self._discard(conn)
+        else:
+            self._idle.put((conn, time.monotonic()))
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, broken=not self._healthy(conn))
+            raise
+        self.release(conn)
+
+    def _record(self, label, seconds):
+        with self._lock:
+            entry = self._timings.setdefault(label, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            entry['calls'] += 1
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+
+    def read_sql(self, sql, params=None, label=None):
+        '''``pd.read_sql`` on a pooled connection, timed under ``label``, retried once if the connection died.'''
+        label = label or ' '.join(sql.split())[:60]
+        for attempt in range(2):
+            conn = self.acquire()
+            start = time.perf_counter()
+            try:
+                frame = pd.read_sql(sql, conn, params=params)
+            except Exception:
+                broken = not self._healthy(conn)
+                self.release(conn, broken=broken)
+                if broken and attempt == 0:
+                    with self._lock:
+                        self.reconnects += 1
+                    continue
+                raise
+            self.release(conn)
+            self._record(label, time.perf_counter() - start)
+            return frame
+
+    def timings(self):
+        '''Per-label query timings: calls, total seconds and slowest call.'''
+        with self._lock:
+            return {label: dict(entry) for label, entry in self._timings.items()}
+
+    def close(self):
+        '''Close every idle connection.'''
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+
+def read_sql(conn, sql, params=None, label=None):
+    '''``pd.read_sql`` against a plain connection or a ``ConnectionPool``.'''
+    if isinstance(conn, ConnectionPool):
+        return conn.read_sql(sql, params=params, label=label)
+    return pd.read_sql(sql, conn, params=params)
+
+
+def run_concurrently(conn, tasks):
+    '''
+    Run zero-argument callables that query ``conn``, returning their results
+    in order. With a pool they overlap on up to ``conn.size`` threads;
+    a plain connection cannot be shared across threads, so they run in turn.
+    '''
+    tasks = list(tasks)
+    if not isinstance(conn, ConnectionPool) or len(tasks) < 2:
+        return [task() for task in tasks]
+    with ThreadPoolExecutor(max_workers=min(conn.size, len(tasks))) as executor:
+        futures = [executor.submit(task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def fetch_all(conn, queries, label=None):
+    '''Run ``(sql, params)`` queries, overlapping them when ``conn`` is a pool.'''
+    return run_concurrently(conn, [
+        (lambda sql=sql, params=params: read_sql(conn, sql, params, label))
+        for sql, params in queries
+    ])
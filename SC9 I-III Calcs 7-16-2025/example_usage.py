@@ -4,11 +4,15 @@ Example usage of the updated bill calculator with different charge type combinat
 This demonstrates how to calculate bills using:
 - Charge types [0, 2]: Transmission + Delivery charges (current default)
 - Charge types [0, 1]: Transmission + Supply charges
+
+The rates for every combination are resolved in one pass with
+``extract_scenario_rates``; only the kWh surcharge differs between them.
 """
 
 import pandas as pd
 import json
-from bill_calc import calculate_bill, extract_rate_data
+from bill_calc import calculate_bill, extract_scenario_rates, rate_data_from_matrix
+from charge_type_helper import charge_scenarios
 
 def load_sample_data():
     """Load the charge configuration and history data from CSV and JSON files."""
@@ -54,37 +58,26 @@ def calculate_bill_comparison():
     print(f"Contract Demand: {contract_demand_kW} kW")
     print("="*60)
     
+    # Rates for both charge type combinations, resolved once
+    scenarios = charge_scenarios(['transmission_delivery', 'transmission_supply'])
+    scenario_rates = extract_scenario_rates(rates, charges_df, [(start_date, end_date)], scenarios)
+    rate_data = {name: rate_data_from_matrix(matrix, 0) for name, matrix in scenario_rates.items()}
+    bills = {
+        name: calculate_bill(billing_df, usage_kwh, start_date, end_date, scenario_rate_data, contract_demand_kW)
+        for name, scenario_rate_data in rate_data.items()
+    }
+    bill_02 = bills['transmission_delivery']
+    bill_01 = bills['transmission_supply']
+
     # Scenario 1: Transmission + Delivery charges (types 0 + 2)
     print("\n1. TRANSMISSION + DELIVERY CHARGES (Types 0 + 2)")
     print("-" * 50)
-    
-    rate_data_02 = extract_rate_data(
-        rates, charges_df, start_date, end_date, 
-        charge_types=[0, 2]
-    )
-    
-    bill_02 = calculate_bill(
-        billing_df, usage_kwh, start_date, end_date, 
-        rate_data_02, contract_demand_kW, charge_types=[0, 2]
-    )
-    
-    print_bill_summary(bill_02, rate_data_02)
+    print_bill_summary(bill_02, rate_data['transmission_delivery'])
     
     # Scenario 2: Transmission + Supply charges (types 0 + 1)
     print("\n2. TRANSMISSION + SUPPLY CHARGES (Types 0 + 1)")
     print("-" * 50)
-    
-    rate_data_01 = extract_rate_data(
-        rates, charges_df, start_date, end_date, 
-        charge_types=[0, 1]
-    )
-    
-    bill_01 = calculate_bill(
-        billing_df, usage_kwh, start_date, end_date, 
-        rate_data_01, contract_demand_kW, charge_types=[0, 1]
-    )
-    
-    print_bill_summary(bill_01, rate_data_01)
+    print_bill_summary(bill_01, rate_data['transmission_supply'])
     
     # Comparison
     print("\n3. COMPARISON")
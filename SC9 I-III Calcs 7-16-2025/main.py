@@ -1,93 +1,114 @@
-import pandas as pd 
-import numpy as np 
-import pyodbc
-import ast
-from datetime import datetime
-import json
-import re
-import random
+import argparse
 
 import sys
 import os
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, BASE_DIR)
-import AccConv as ac
 
-from bill_calc import *
-from config import * 
-from as_used_daily_demand import *
-from target_accounts import GetTargetAccs
-from apply_tax import apply_grt_salestax
-
-tax_df = pd.read_excel(r"Q:\AUDITORS\EGOS Shared Folder\Development\Nick's pythons\SC9 IV Calcs 5-20-2025\SalesGRTax.xlsx")
-bill_list = []
-
-params = GetTargetAccs(conn1)
-#print(params.loc[0])
-print(f'Length of params: {len(params)}')
-#params = random.sample(params, 1)
-
-for i in params.index:
-    Anumber = int(params['AccountID'][i])
-    load_zone = params['Load Zone'][i]
-    try:
-        bills = GetElecBills(Anumber, conn1).sort_values(by='DateTo')
-
-        bills['Contract Demand'] = bills['Demand'].rolling(24, min_periods=1).max()
-        bills = bills.dropna(subset='Contract Demand')
-
-        if len(bills) == 0:
-            print('No Bills')
+from config import get_pool
+from db_pool import run_concurrently
+from data_sources import SQLServerSource, open_source
+from portfolio_runner import run_portfolio
+from pipeline import DEFAULT_IO_THREADS, DEFAULT_PREFETCH, StageTimer
+from result_sink import ResultSink
+from bill_calc import RATE_SCHEDULES
+
+OUTPUT_ROOT = r"Q:\AUDITORS\EGOS Shared Folder\Development\Nick's pythons\SC9 IV Calcs 5-20-2025\Output"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Price SC9 target accounts under the Standard and/or Large comparison.')
+    parser.add_argument('--schedules', nargs='+', default=['Standard'], choices=sorted(RATE_SCHEDULES),
+                        help='Comparisons to price in this pass (default: Standard)')
+    parser.add_argument('--large-rate-id', type=int, default=None,
+                        help='RateAcuityRateId of SC9 Rate V, for the Large comparison')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes (default: 1)')
+    parser.add_argument('--db-connections', type=int, default=4,
+                        help='Size of the DB connection pool used for the bulk fetches (default: 4)')
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH,
+                        help='Accounts whose bills and AMI data are fetched ahead of pricing; 0 fetches inside '
+                             f'each task (default: {DEFAULT_PREFETCH})')
+    parser.add_argument('--io-threads', type=int, default=DEFAULT_IO_THREADS,
+                        help=f'Concurrent bill/AMI fetches when prefetching (default: {DEFAULT_IO_THREADS})')
+    parser.add_argument('--data', default=None,
+                        help='Run offline from a fixture directory or SQLite file (see data_sources.py) '
+                             'instead of UTIL-PROD-DB')
+    parser.add_argument('--output', default=OUTPUT_ROOT, help='Output directory (default: the Q: drive folder)')
+    parser.add_argument('--resume', action='store_true', help='Continue the run already in the output directory')
+    parser.add_argument('--no-ami-cache', action='store_true',
+                        help='Pull AMI data live for every account instead of through the local AMI cache')
+    parser.add_argument('--refresh', action='store_true',
+                        help='With --resume, also recheck finished accounts and reprice those whose inputs changed')
+    args = parser.parse_args()
+    conn1 = None if args.data else get_pool(size=args.db_connections)
+    source = open_source(args.data, conn=conn1, rate_cache_dir=os.path.join(args.output, 'rate_cache'))
+
+    # Target accounts (AMI headers) and rate sources do not depend on each other
+    params, rate_sources = run_concurrently(conn1, [
+        lambda: source.target_accounts(args.schedules),
+        lambda: source.rate_sources(args.schedules, charge_types=[0, 2], rate_ids={'Large': args.large_rate_id}),
+    ])
+    #print(params.loc[0])
+    print(f'Length of params: {len(params)}')
+    #params = random.sample(params, 1)
+
+    run_name = '-'.join(args.schedules)
+    sink = ResultSink(os.path.join(args.output, run_name, f'{run_name} Calcs'), resume=args.resume)
+    manifest = sink.manifest()
+    if args.refresh:
+        account_ids = [int(a) for a in params['AccountID']]
+        # Only priced accounts are skipped; 'No Bills' / 'No AMI Data' are always retried
+        known_fingerprints = {a: entry.get('fingerprint') for a, entry in manifest.items()
+                              if entry.get('status') == 'ok'}
+    else:
+        account_ids = [int(a) for a in params['AccountID'] if int(a) not in manifest]
+        known_fingerprints = {}
+    if manifest:
+        print(f'Resuming: {len(manifest)} accounts already priced')
+
+    account_schedules = {int(a): s for a, s in zip(params['AccountID'], params['Schedule'])}
+
+    bills_by_account = source.bills(account_ids)
+    for label, timing in source.timings().items():
+        print(f"{label}: {timing['calls']} queries, {timing['seconds']:.2f} s (slowest {timing['max_seconds']:.2f} s)")
+
+    timer = StageTimer()
+    results = run_portfolio(
+        account_ids, source.tax_table_path, rate_sources, account_schedules=account_schedules,
+        workers=args.workers, known_fingerprints=known_fingerprints, bills_by_account=bills_by_account,
+        ami_cache_dir=None if args.no_ami_cache else os.path.join(args.output, 'ami_cache'),
+        ami_latest={int(a): (latest, import_id) for a, latest, import_id
+                    in zip(params['AccountID'], params['LatestEndDate'], params['LatestImportId'])},
+        prefetch=args.prefetch, io_threads=args.io_threads, timer=timer,
+        ami_fetch=None if isinstance(source, SQLServerSource) else source.ami_fetcher()
+    )
+    rate_lookups = {'hits': 0, 'misses': 0}
+    for progress, result in enumerate(results, start=1):
+        for key in rate_lookups:
+            rate_lookups[key] += result['rate_lookups'][key]
+        if result['error'] is not None:
+            print(f"Account {result['AccountID']} failed:\n{result['error']}")
             continue
-
-        else:
-            ami = ac.AMIData(Anumber, 'KWH')
-
-            # ami = ami[(ami['StartDate'] >= bills['DateFrom'].iloc[0]) & 
-            #         (ami['EndDate'] <= bills['DateTo'].iloc[-1])]
-            
-            if len(ami) == 0:
-                print('No AMI Data')
-                continue
-            else:
-                daily_demand_df = CalcStandByDemand(bills, ami)
-
-                history = GetChargeHistory(conn1)
-                charges = GetChargeConfig(conn1)
-
-                for idx in bills.index:
-                    account_id = bills['AccountID'][idx]
-                    start_date = bills['DateFrom'][idx].strftime('%m-%d-%Y')
-                    end_date = bills['DateTo'][idx].strftime('%m-%d-%Y')
-
-                    bill_amount = bills['BillAmount'][idx]
-
-                    usage = bills['Usage'][idx]
-                    contract_demand = bills['Contract Demand'][idx]
-                    rates = extract_rate_data(history, charges, start_date, end_date, city="New York City")
-                    bill = calculate_bill(
-                        daily_demand_df,
-                        usage,
-                        start_date, end_date,
-                        rates,
-                        contract_demand_kW=contract_demand
-                    )
-                    bill['AccountID'] = account_id
-                    bill['DateFrom'] = start_date 
-                    bill['DateTo'] = end_date
-                    bill['AsBilled'] = bill_amount
-
-                    bill = apply_grt_salestax(bill, tax_df)
-                    print(bill)
-
-                    bill_list.append(bill)
-                    #print_bill_summary(bill)
-
-        progress = params['AccountID'].tolist().index(Anumber) + 1
-
-        print(f'{progress}/{len(params)}')
-
-        final_df = pd.DataFrame(bill_list)
-        final_df.to_excel(rf"Q:\AUDITORS\EGOS Shared Folder\Development\Nick's pythons\SC9 IV Calcs 5-20-2025\Output\Standard\Standard Calcs{progress}.xlsx", index=False)
-    except Exception as e:
-        print(e)
\ No newline at end of file
+        if result['status'] == 'unchanged':
+            continue
+        if result['status'] != 'ok':
+            print(result['status'])
+
+        with timer.measure('write'):
+            sink.append(
+                result['AccountID'], result['bills'], replace=True,
+                status=result['status'], fingerprint=result['fingerprint'], schedule=result['schedule']
+            )
+        print(f'{progress}/{len(account_ids)}')
+    with timer.measure('write'):
+        sink.close()
+
+    for stage, timing in timer.summary().items():
+        print(f"{stage}: {timing['calls']} calls, {timing['seconds']:.2f} s")
+    print(f"Rate periods: {rate_lookups['misses']} resolved, {rate_lookups['hits']} reused")
+
+    rows = sink.read()
+    for schedule in args.schedules:
+        output_dir = os.path.join(args.output, schedule)
+        os.makedirs(output_dir, exist_ok=True)
+        schedule_rows = rows[rows['Schedule'] == schedule] if 'Schedule' in rows else rows.iloc[0:0]
+        schedule_rows.to_excel(os.path.join(output_dir, f"{schedule} Calcs.xlsx"), index=False)
@@ -0,0 +1,116 @@
+"""
+Producer/consumer pipeline that overlaps I/O with computation.
+
+``prefetch_pipeline`` fetches upcoming items on a small thread pool (the I/O
+stage: bill queries, AMI pulls) while the caller's loop computes the current
+ones, either in this thread or on a process pool. At most ``prefetch`` fetched
+items wait to be computed, so a slow compute stage holds the fetches back
+instead of filling memory with interval data. Results come back in item order.
+
+``StageTimer`` adds up seconds per stage so a run can report where its
+wall-clock time went: ``wait_io`` is time the compute side sat idle waiting
+for a fetch, ``wait_compute`` time spent waiting on the process pool.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+DEFAULT_PREFETCH = 8
+DEFAULT_IO_THREADS = 2
+
+
+class StageTimer:
+    """Thread-safe running totals of seconds and calls per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, stage, seconds, calls=1):
+        with self._lock:
+            entry = self._stages.setdefault(stage, {'calls': 0, 'seconds': 0.0})
+            entry['calls'] += calls
+            entry['seconds'] += seconds
+
+    def merge(self, seconds_by_stage):
+        '''Add a ``{stage: seconds}`` dict, e.g. the timings a task measured in a worker.'''
+        for stage, seconds in (seconds_by_stage or {}).items():
+            self.add(stage, seconds)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def summary(self):
+        '''Per-stage calls and total seconds, slowest stage first.'''
+        with self._lock:
+            stages = {stage: dict(entry) for stage, entry in self._stages.items()}
+        return dict(sorted(stages.items(), key=lambda item: -item[1]['seconds']))
+
+
+def prefetch_pipeline(items, fetch, compute, prefetch=DEFAULT_PREFETCH, io_threads=DEFAULT_IO_THREADS,
+                      compute_pool=None, compute_slots=None, timer=None):
+    """
+    Yield ``compute(fetch(item))`` for every item, in item order, fetching ahead.
+
+    Parameters:
+    - items (iterable): Work items, consumed lazily
+    - fetch (callable): I/O stage, run on ``io_threads`` threads
+    - compute (callable): Compute stage, run on ``compute_pool`` when given
+      (it must then be picklable), otherwise in the calling thread
+    - prefetch (int, optional): Most fetched items waiting to be computed
+    - io_threads (int, optional): Fetches running at once
+    - compute_pool (Executor, optional): e.g. a ``ProcessPoolExecutor``
+    - compute_slots (int, optional): Most items submitted to ``compute_pool``
+      and not yet yielded; defaults to ``prefetch``
+    - timer (StageTimer, optional): Receives ``wait_io``, ``compute`` and
+      ``wait_compute`` timings
+
+    An exception from either stage is raised from the generator at that item.
+    """
+    if prefetch < 1:
+        raise ValueError("prefetch must be at least 1")
+    timer = timer or StageTimer()
+    compute_slots = compute_slots or prefetch
+    items = iter(items)
+
+    with ThreadPoolExecutor(max_workers=io_threads) as io:
+        fetched = deque()
+
+        def fill():
+            while len(fetched) < prefetch:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                fetched.append(io.submit(fetch, item))
+
+        def next_fetched():
+            with timer.measure('wait_io'):
+                inputs = fetched.popleft().result()
+            fill()
+            return inputs
+
+        fill()
+        if compute_pool is None:
+            while fetched:
+                inputs = next_fetched()
+                with timer.measure('compute'):
+                    result = compute(inputs)
+                yield result
+            return
+
+        computing = deque()
+        while fetched or computing:
+            while fetched and len(computing) < compute_slots:
+                computing.append(compute_pool.submit(compute, next_fetched()))
+            with timer.measure('wait_compute'):
+                result = computing.popleft().result()
+            yield result
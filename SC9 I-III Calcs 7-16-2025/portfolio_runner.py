@@ -0,0 +1,369 @@
+"""
+Account-level pricing for the SC9 portfolio run, serially or on a process pool.
+
+Each worker process uses its own connection pool and indexes the tax table
+once in its initializer; the rate sources (history, compiled index and charge
+configuration, one per comparison schedule) are resolved once by the caller
+and shipped to every worker, and each account is priced against the source of
+its own schedule. Results come back in the order the accounts were given,
+one result dict per account, so a pooled run merges to the same output as a
+serial one.
+
+Bills can be fetched up front for the whole portfolio with
+``GetElecBillsBulk`` and handed to ``run_portfolio``; each task then carries
+its own account's bills and makes no billing query of its own.
+
+With an AMI cache directory, interval data is read through ``AMICache``
+(refreshed incrementally from ``AccConv``) instead of pulled in full. An
+``ami_fetch`` from a local data source (``data_sources``) replaces ``AccConv``.
+
+Every result carries an input fingerprint (bill rows plus the rate source
+version). Given the fingerprints from a previous run's manifest, an
+account whose inputs are unchanged is reported as ``'unchanged'`` before its
+AMI data is pulled.
+
+With ``prefetch``, the bill and AMI fetches move to an I/O stage that runs
+ahead of pricing (``pipeline.prefetch_pipeline``), and a ``StageTimer``
+collects the seconds spent in each stage.
+"""
+
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import sys
+import os
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+from bill_calc import DailyDemandIndex, calculate_bill, extract_rate_data
+from config import get_pool, GetElecBills
+from as_used_daily_demand import CalcStandByDemand
+from apply_tax import apply_grt_salestax, load_tax_index
+from result_sink import bills_fingerprint
+from ami_cache import AMICache, fetch_accconv
+from rate_cache import RateDataMemo
+from pipeline import DEFAULT_IO_THREADS, StageTimer, prefetch_pipeline
+
+# Per-process state set up by _init_worker
+_worker = {}
+
+
+def fetch_account(account_id, conn, rate_source, known_fingerprint=None, bills=None, ami_source=None):
+    """
+    I/O half of ``price_account``: the account's bills and AMI data.
+
+    Returns:
+    - dict: ``account_id``, ``status`` (None when the account needs pricing,
+      otherwise ``'unchanged'``, ``'No Bills'`` or ``'No AMI Data'``),
+      ``bills``, ``ami``, ``fingerprint`` and ``timings`` (seconds spent in
+      ``fetch_bills`` and ``fetch_ami``). The fingerprint is None for an
+      account with no bills or AMI data: it does not cover AMI data, so it
+      must not mark such an account unchanged once the data arrives.
+    """
+    timings = {}
+    start = time.perf_counter()
+    if bills is None:
+        bills = GetElecBills(account_id, conn)
+    timings['fetch_bills'] = time.perf_counter() - start
+    bills = bills.sort_values(by='DateTo')
+    fingerprint = {'bills': bills_fingerprint(bills), **rate_source['version']}
+    inputs = {'account_id': account_id, 'status': None, 'bills': bills, 'ami': None,
+              'fingerprint': fingerprint, 'timings': timings}
+
+    if known_fingerprint is not None and fingerprint == known_fingerprint:
+        inputs['status'] = 'unchanged'
+        return inputs
+
+    bills['Contract Demand'] = bills['Demand'].rolling(24, min_periods=1).max()
+    bills = bills.dropna(subset='Contract Demand')
+    inputs['bills'] = bills
+
+    if len(bills) == 0:
+        inputs['status'] = 'No Bills'
+        inputs['fingerprint'] = None
+        return inputs
+
+    if ami_source is None:
+        import AccConv as ac
+        ami_source = ac.AMIData
+    start = time.perf_counter()
+    ami = ami_source(account_id, 'KWH')
+    timings['fetch_ami'] = time.perf_counter() - start
+    if len(ami) == 0:
+        inputs['status'] = 'No AMI Data'
+        inputs['fingerprint'] = None
+        return inputs
+
+    inputs['ami'] = ami
+    return inputs
+
+
+def price_inputs(inputs, tax_df, rate_source, schedule=None, rate_memo=None):
+    """
+    Compute half of ``price_account``: demand, bills and tax from ``fetch_account``'s inputs.
+
+    Adds ``demand`` and ``pricing`` seconds to ``inputs['timings']``. With a
+    ``RateDataMemo``, each billing period's rates are resolved once and shared
+    with every other account on the same read cycle; the account's memo hits
+    and misses are left in ``inputs['rate_lookups']``.
+
+    Returns:
+    - tuple: ``(status, bills, fingerprint)`` as for ``price_account``
+    """
+    if inputs['status'] is not None:
+        return inputs['status'], [], inputs['fingerprint']
+
+    bills = inputs['bills']
+    timings = inputs['timings']
+
+    start = time.perf_counter()
+    daily_demand_df = CalcStandByDemand(bills, inputs['ami'])
+    demand_index = DailyDemandIndex(daily_demand_df)
+    timings['demand'] = time.perf_counter() - start
+
+    history = rate_source['index']
+    charges = rate_source['charges']
+
+    start = time.perf_counter()
+    if rate_memo is not None:
+        hits, misses = rate_memo.hits, rate_memo.misses
+    priced = []
+    for idx in bills.index:
+        start_date = bills['DateFrom'][idx].strftime('%m-%d-%Y')
+        end_date = bills['DateTo'][idx].strftime('%m-%d-%Y')
+
+        if rate_memo is not None:
+            rates = rate_memo.for_source(rate_source, start_date, end_date, city="New York City")
+        else:
+            rates = extract_rate_data(history, charges, start_date, end_date, city="New York City")
+        bill = calculate_bill(
+            demand_index,
+            bills['Usage'][idx],
+            start_date, end_date,
+            rates,
+            contract_demand_kW=bills['Contract Demand'][idx]
+        )
+        bill['AccountID'] = bills['AccountID'][idx]
+        bill['DateFrom'] = start_date
+        bill['DateTo'] = end_date
+        bill['AsBilled'] = bills['BillAmount'][idx]
+        if schedule is not None:
+            bill['Schedule'] = schedule
+
+        priced.append(apply_grt_salestax(bill, tax_df))
+    timings['pricing'] = time.perf_counter() - start
+    if rate_memo is not None:
+        inputs['rate_lookups'] = {'hits': rate_memo.hits - hits, 'misses': rate_memo.misses - misses}
+
+    return 'ok', priced, inputs['fingerprint']
+
+
+def price_account(account_id, conn, tax_df, rate_source, known_fingerprint=None, schedule=None, bills=None,
+                  ami_source=None, rate_memo=None):
+    """
+    Price every bill of one account against a ``RateCache`` rate source.
+
+    ``schedule`` (the comparison name, e.g. ``'Standard'``) is stamped on every
+    priced bill when given. ``bills`` is the account's prefetched bill frame;
+    without it the bills are queried here. ``ami_source(account_id, unit)``
+    supplies interval data and defaults to ``AccConv.AMIData``. ``rate_memo``
+    (a ``RateDataMemo``) shares resolved rates across accounts.
+
+    Returns:
+    - tuple: ``(status, bills, fingerprint)`` where status is ``'ok'``,
+      ``'No Bills'``, ``'No AMI Data'`` or ``'unchanged'`` (inputs match
+      ``known_fingerprint``), bills is a list of itemized bill dicts and
+      fingerprint is the account's bills hash plus the rate source version
+    """
+    inputs = fetch_account(account_id, conn, rate_source, known_fingerprint, bills=bills, ami_source=ami_source)
+    return price_inputs(inputs, tax_df, rate_source, schedule=schedule, rate_memo=rate_memo)
+
+
+def _init_worker(tax_table_path, rate_sources, ami_cache_dir=None, ami_fetch=None):
+    _worker['conn'] = get_pool()
+    _worker['tax_df'] = load_tax_index(tax_table_path)
+    _worker['rate_sources'] = rate_sources
+    _worker['rate_memo'] = RateDataMemo()
+    _worker['ami_source'] = ami_fetch
+    _worker['ami_cached'] = ami_cache_dir is not None
+    if ami_cache_dir is not None:
+        _worker['ami_source'] = AMICache(ami_cache_dir, fetch=ami_fetch or fetch_accconv).AMIData
+
+
+def _result(account_id, schedule, status, bills, fingerprint, inputs, error=None):
+    return {'AccountID': account_id, 'schedule': schedule, 'status': status, 'bills': bills,
+            'fingerprint': fingerprint, 'timings': inputs.get('timings', {}),
+            'rate_lookups': inputs.get('rate_lookups', {'hits': 0, 'misses': 0}), 'error': error}
+
+
+def _ami_source(ami_latest):
+    ami_source = _worker['ami_source']
+    # Only the cache compares against the server's latest interval and import
+    if _worker['ami_cached'] and ami_latest is not None:
+        latest, import_id = ami_latest
+        ami_source = partial(ami_source, latest=latest, import_id=import_id)
+    return ami_source
+
+
+def _price_account_task(account_id, schedule, known_fingerprint=None, bills=None, ami_latest=None):
+    try:
+        inputs = fetch_account(
+            account_id, _worker['conn'], _worker['rate_sources'][schedule], known_fingerprint,
+            bills=bills, ami_source=_ami_source(ami_latest)
+        )
+        status, bills, fingerprint = price_inputs(
+            inputs, _worker['tax_df'], _worker['rate_sources'][schedule], schedule=schedule,
+            rate_memo=_worker['rate_memo']
+        )
+        return _result(account_id, schedule, status, bills, fingerprint, inputs)
+    except Exception:
+        return _result(account_id, schedule, 'error', [], None, {}, traceback.format_exc())
+
+
+def _fetch_task(task):
+    # I/O stage of the prefetch pipeline, run on a thread of the parent process
+    account_id, schedule, known_fingerprint, bills, ami_latest = task
+    try:
+        inputs = fetch_account(
+            account_id, _worker['conn'], _worker['rate_sources'][schedule], known_fingerprint,
+            bills=bills, ami_source=_ami_source(ami_latest)
+        )
+        return {**inputs, 'schedule': schedule, 'error': None}
+    except Exception:
+        return {'account_id': account_id, 'schedule': schedule, 'timings': {}, 'error': traceback.format_exc()}
+
+
+def _compute_task(inputs):
+    # Compute stage of the prefetch pipeline, run in this process or a pool worker
+    account_id, schedule = inputs['account_id'], inputs['schedule']
+    if inputs['error'] is not None:
+        return _result(account_id, schedule, 'error', [], None, inputs, inputs['error'])
+    try:
+        status, bills, fingerprint = price_inputs(
+            inputs, _worker['tax_df'], _worker['rate_sources'][schedule], schedule=schedule,
+            rate_memo=_worker['rate_memo']
+        )
+        return _result(account_id, schedule, status, bills, fingerprint, inputs)
+    except Exception:
+        return _result(account_id, schedule, 'error', [], None, inputs, traceback.format_exc())
+
+
+def _schedule_of(account_id, account_schedules, rate_sources):
+    if account_schedules is not None:
+        return account_schedules[account_id]
+    if len(rate_sources) != 1:
+        raise ValueError("account_schedules is required when pricing more than one schedule")
+    return next(iter(rate_sources))
+
+
+def run_portfolio(account_ids, tax_table_path, rate_sources, account_schedules=None, workers=1,
+                  known_fingerprints=None, bills_by_account=None, ami_cache_dir=None, ami_latest=None,
+                  prefetch=0, io_threads=DEFAULT_IO_THREADS, timer=None, ami_fetch=None):
+    """
+    Price a list of accounts, yielding one result dict per account in input order.
+
+    Parameters:
+    - account_ids (list): AccountIDs to price
+    - tax_table_path (str): Path of the ``SalesGRTax.xlsx`` tax table
+    - rate_sources (dict): Comparison name -> rate source, from ``RateCache.get_schedules``
+    - account_schedules (dict, optional): AccountID -> comparison name; may be
+      omitted when only one schedule is priced
+    - workers (int, optional): Process pool size; 1 runs in this process
+    - known_fingerprints (dict, optional): AccountID -> fingerprint from a
+      previous run's priced (``'ok'``) accounts; accounts whose inputs still
+      match are not repriced
+    - bills_by_account (dict, optional): AccountID -> bills, from
+      ``GetElecBillsBulk``; accounts missing from it are queried one by one
+    - ami_cache_dir (str, optional): ``AMICache`` directory; without it every
+      account's AMI data is pulled live
+    - ami_latest (dict, optional): AccountID -> (LatestEndDate,
+      LatestImportId) on the server, from ``GetTargetAccs``; cached accounts
+      already reaching it under the same import are not refreshed
+    - prefetch (int, optional): With 1 or more, bills and AMI data for up to
+      this many upcoming accounts are fetched on ``io_threads`` threads of
+      this process while the current accounts are priced (in this process,
+      or on ``workers`` processes). With 0 each task fetches its own inputs.
+    - io_threads (int, optional): Concurrent fetches when prefetching
+    - timer (StageTimer, optional): Receives per-stage seconds
+      (``fetch_bills``, ``fetch_ami``, ``demand``, ``pricing`` and the
+      pipeline's ``wait_io`` / ``compute`` / ``wait_compute``)
+    - ami_fetch (callable, optional): Picklable ``fetch(account_id, unit,
+      since=None)`` returning AMI intervals, e.g. a local data source's
+      ``ami_fetcher()``; defaults to ``AccConv``
+
+    Each result has ``AccountID``, ``schedule``, ``status``, ``bills``,
+    ``fingerprint``, ``timings`` (that account's seconds per stage),
+    ``rate_lookups`` (its rate memo hits and misses; each process keeps its
+    own memo, so a period is resolved once per worker) and ``error`` (the
+    formatted traceback when pricing raised, otherwise None). A failing
+    account does not stop the run.
+    """
+    timer = timer or StageTimer()
+    known_fingerprints = known_fingerprints or {}
+    bills_by_account = bills_by_account or {}
+    ami_latest = ami_latest or {}
+    tasks = [
+        (account_id, _schedule_of(account_id, account_schedules, rate_sources),
+         known_fingerprints.get(account_id), bills_by_account.get(account_id), ami_latest.get(account_id))
+        for account_id in account_ids
+    ]
+
+    if prefetch > 0:
+        yield from _run_pipeline(tasks, tax_table_path, rate_sources, workers, ami_cache_dir, ami_fetch,
+                                 prefetch, io_threads, timer)
+        return
+
+    if workers <= 1:
+        _init_worker(tax_table_path, rate_sources, ami_cache_dir, ami_fetch)
+        for task in tasks:
+            result = _price_account_task(*task)
+            timer.merge(result['timings'])
+            yield result
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(tax_table_path, rate_sources, ami_cache_dir, ami_fetch),
+    ) as pool:
+        futures = [pool.submit(_price_account_task, *task) for task in tasks]
+        for future in futures:
+            result = future.result()
+            timer.merge(result['timings'])
+            yield result
+
+
+def _run_pipeline(tasks, tax_table_path, rate_sources, workers, ami_cache_dir, ami_fetch, prefetch, io_threads,
+                  timer):
+    # Fetches run on threads of this process, so it needs the connection pool and AMI source too
+    _init_worker(tax_table_path, rate_sources, ami_cache_dir, ami_fetch)
+
+    if workers <= 1:
+        results = prefetch_pipeline(tasks, _fetch_task, _compute_task, prefetch=prefetch,
+                                    io_threads=io_threads, timer=timer)
+        for result in results:
+            timer.merge(result['timings'])
+            yield result
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(tax_table_path, rate_sources),
+    ) as pool:
+        results = prefetch_pipeline(tasks, _fetch_task, _compute_task, prefetch=prefetch,
+                                    io_threads=io_threads, compute_pool=pool,
+                                    compute_slots=max(prefetch, 2 * workers), timer=timer)
+        for result in results:
+            timer.merge(result['timings'])
+            yield result
+
+
+def merge_results(results):
+    """Flatten per-account results into one bill list, in account order."""
+    bill_list = []
+    for result in results:
+        bill_list.extend(result['bills'])
+    return bill_list
@@ -0,0 +1,268 @@
+"""
+Shared cache of rate sources (rate history + charge configuration).
+
+The rate schedule does not change during a portfolio run, so the history is
+fetched, parsed and compiled once per process instead of once per account.
+With a ``cache_dir`` the raw sources are also kept on disk and reused across
+runs until ``ModifiedDate`` on either table moves past the cached stamp.
+
+``RateDataMemo`` sits in front of ``extract_rate_data``: accounts on the same
+meter-read cycle share billing periods, so each distinct period is resolved
+once per rate source version and charge types.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from bill_calc import (DEFAULT_RATE_ID, RATE_SCHEDULES, GetChargeConfigs, GetChargeHistories,
+                       compile_rate_index, extract_rate_data)
+from db_pool import read_sql, run_concurrently
+from result_sink import charge_config_version, rate_history_version
+
+
+def GetRateSourcesModified(conn1, rate_ids):
+    '''
+    Latest ModifiedDate across the rate history and charge configuration of
+    several rates, in one query.
+
+    Returns:
+    - dict: RateAcuityRateId -> ``'<history stamp>|<config stamp>'``
+    '''
+    rate_ids = [int(r) for r in rate_ids]
+    placeholders = ','.join('?' * len(rate_ids))
+    sql1 = f"""
+    SELECT [RateAcuityRateId], MAX([ModifiedDate]) AS Modified, 'History' AS Source
+    FROM [ExternalData].[dbo].[RateAcuityRateHistory]
+    WHERE RateAcuityRateId IN ({placeholders})
+    GROUP BY [RateAcuityRateId]
+    UNION ALL
+    SELECT [RateAcuityRateId], MAX([ModifiedDate]) AS Modified, 'Config' AS Source
+    FROM [ExternalData].[dbo].[ChargeConfiguration]
+    WHERE RateAcuityRateId IN ({placeholders})
+    GROUP BY [RateAcuityRateId]
+    """
+    stamps = read_sql(conn1, sql1, rate_ids + rate_ids, label='GetRateSourcesModified')
+    lookup = {(int(r), s): m for r, s, m in zip(stamps['RateAcuityRateId'], stamps['Source'], stamps['Modified'])}
+    return {
+        rate_id: f"{lookup.get((rate_id, 'History'))}|{lookup.get((rate_id, 'Config'))}"
+        for rate_id in rate_ids
+    }
+
+
+def GetRateSourceModified(conn1, rate_id=DEFAULT_RATE_ID):
+    '''Latest ModifiedDate across the rate history and charge configuration of one rate.'''
+    return GetRateSourcesModified(conn1, [rate_id])[int(rate_id)]
+
+
+def _frame_to_records(df):
+    return json.loads(df.to_json(orient='split', index=False, date_format='iso'))
+
+
+def _frame_from_records(records):
+    return pd.DataFrame(records['data'], columns=records['columns'])
+
+
+class RateCache:
+    """
+    Rate sources keyed by ``(RateAcuityRateId, charge_types)``, one compiled
+    source per rate schedule.
+
+    Parameters:
+    - conn (optional): DB connection or ``ConnectionPool`` for fetching and
+      staleness checks; a pool fetches history and charges side by side.
+      Without one, sources are served from ``cache_dir`` only.
+    - cache_dir (str, optional): Directory for the on-disk copies
+
+    ``get`` returns a dict with ``rate_id``, ``charge_types``, ``history`` (raw
+    dict), ``index`` (compiled ``RateIndex``), ``charges`` (DataFrame),
+    ``version`` (content hashes used in run fingerprints) and ``modified``.
+    The dict pickles cleanly, so the parent process can resolve it once and
+    hand it to every worker.
+    """
+
+    def __init__(self, conn=None, cache_dir=None):
+        self.conn = conn
+        self.cache_dir = cache_dir
+        self._sources = {}
+
+    def get(self, rate_id=DEFAULT_RATE_ID, charge_types=[0, 2]):
+        return self.get_many([rate_id], charge_types)[int(rate_id)]
+
+    def get_many(self, rate_ids, charge_types=[0, 2]):
+        """
+        Rate sources of several rates. Whatever is not already in memory is
+        checked and fetched with one query per table rather than one per rate.
+
+        Returns:
+        - dict: RateAcuityRateId -> rate source
+        """
+        types = tuple(sorted(charge_types))
+        rate_ids = [int(r) for r in rate_ids]
+        missing = [r for r in dict.fromkeys(rate_ids) if (r, types) not in self._sources]
+        if missing:
+            self._sources.update({(r, types): source for r, source in self._load(missing, types).items()})
+        return {r: self._sources[(r, types)] for r in rate_ids}
+
+    def get_schedules(self, schedules, charge_types=[0, 2], rate_ids=None):
+        """
+        Rate sources keyed by comparison name (see ``RATE_SCHEDULES``).
+
+        Parameters:
+        - schedules (list): Comparison names, e.g. ``['Standard', 'Large']``
+        - charge_types (list, optional): ChargeTypeIds to load
+        - rate_ids (dict, optional): Comparison -> RateAcuityRateId overrides
+
+        Returns:
+        - dict: comparison name -> rate source
+        """
+        resolved = schedule_rate_ids(schedules, rate_ids)
+        sources = self.get_many(list(resolved.values()), charge_types)
+        return {name: sources[rate_id] for name, rate_id in resolved.items()}
+
+    def _path(self, rate_id, charge_types):
+        types = '-'.join(str(t) for t in charge_types)
+        return os.path.join(self.cache_dir, f'rate_{rate_id}_types_{types}.json')
+
+    def _read_file(self, rate_id, charge_types):
+        if self.cache_dir is None:
+            return None
+        path = self._path(rate_id, charge_types)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _write_file(self, rate_id, charge_types, cached):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(rate_id, charge_types)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(cached, f)
+        os.replace(path + '.tmp', path)
+
+    def _load(self, rate_ids, charge_types):
+        modified = GetRateSourcesModified(self.conn, rate_ids) if self.conn is not None else {}
+        cached = {rate_id: self._read_file(rate_id, charge_types) for rate_id in rate_ids}
+
+        stale = [
+            rate_id for rate_id in rate_ids
+            if cached[rate_id] is None
+            or (modified.get(rate_id) is not None and cached[rate_id]['modified'] != modified[rate_id])
+        ]
+        if stale:
+            if self.conn is None:
+                raise LookupError(f"No cached rates for rates {stale} {list(charge_types)} and no connection")
+            histories, charges = run_concurrently(self.conn, [
+                lambda: GetChargeHistories(self.conn, stale),
+                lambda: GetChargeConfigs(self.conn, stale, list(charge_types)),
+            ])
+            for rate_id in stale:
+                cached[rate_id] = {
+                    'modified': modified[rate_id],
+                    'history': histories[rate_id],
+                    'charges': _frame_to_records(charges[rate_id]),
+                }
+                self._write_file(rate_id, charge_types, cached[rate_id])
+
+        return {rate_id: self._source(rate_id, charge_types, cached[rate_id]) for rate_id in rate_ids}
+
+    def _source(self, rate_id, charge_types, cached):
+        return build_rate_source(rate_id, charge_types, cached['history'], cached['charges'], cached['modified'])
+
+
+def schedule_rate_ids(schedules, rate_ids=None):
+    """Comparison name -> RateAcuityRateId, from ``RATE_SCHEDULES`` and ``rate_ids`` overrides."""
+    resolved = {}
+    for name in schedules:
+        rate_id = (rate_ids or {}).get(name) or RATE_SCHEDULES[name]['rate_id']
+        if rate_id is None:
+            raise LookupError(f"No RateAcuityRateId configured for the {name} comparison")
+        resolved[name] = int(rate_id)
+    return resolved
+
+
+def build_rate_source(rate_id, charge_types, history, charges, modified=None):
+    """
+    The rate source dict ``RateCache.get`` returns, from a raw history and
+    charge configuration (a DataFrame or its ``to_json(orient='split')`` records).
+    """
+    # Charges always go through the same JSON form, so their version hash
+    # does not depend on where they were read from.
+    if isinstance(charges, pd.DataFrame):
+        charges = _frame_to_records(charges)
+    charges = _frame_from_records(charges)
+    return {
+        'rate_id': rate_id,
+        'charge_types': list(charge_types),
+        'history': history,
+        'index': compile_rate_index(history),
+        'charges': charges,
+        'version': {
+            'rates': rate_history_version(history),
+            'charges': charge_config_version(charges),
+        },
+        'modified': modified,
+    }
+
+
+class RateDataMemo:
+    """
+    Bounded, thread-safe LRU of ``extract_rate_data`` results.
+
+    Entries are keyed on (rate version, start, end, charge types, city), so
+    a changed rate source never serves a stale entry. The rate dicts handed
+    out are shared between callers and must not be modified.
+
+    Parameters:
+    - maxsize (int, optional): Most periods kept
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rate_data(self, rates, charges_df, start_date, end_date, charge_types=(0, 2), city="New York City",
+                  version=None):
+        """``extract_rate_data(rates, charges_df, ...)``, resolved once per distinct key."""
+        start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        key = (version, start_date, end_date, tuple(sorted(charge_types)), city)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Resolved outside the lock; two threads missing on the same key both compute it
+        rate_data = extract_rate_data(rates, charges_df, start_date, end_date, city=city,
+                                      charge_types=list(charge_types))
+        with self._lock:
+            self._entries[key] = rate_data
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return rate_data
+
+    def for_source(self, rate_source, start_date, end_date, charge_types=(0, 2), city="New York City"):
+        """``rate_data`` against a ``RateCache`` rate source, keyed on its version."""
+        version = tuple(sorted(rate_source['version'].items()))
+        return self.rate_data(rate_source['index'], rate_source['charges'], start_date, end_date,
+                              charge_types=charge_types, city=city, version=version)
+
+    def stats(self):
+        """Hits, misses and entries currently held."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
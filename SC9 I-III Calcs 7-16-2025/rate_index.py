@@ -0,0 +1,208 @@
+"""
+Compiled rate-timeline index over the Rate Acuity history tables.
+
+``extract_rate_data`` used to rebuild a DataFrame from the raw history dict for
+every charge of every bill.  ``compile_rate_index`` parses the rate tables once
+and keeps each description's effective dates and values as pre-sorted NumPy
+arrays, so "the rate in effect on date X" becomes a binary search.
+
+``parse_rate_history`` reads the ``RateHistory`` column payload, trying JSON
+before falling back to a Python literal, and ``compile_rate_history`` goes
+straight from that payload to a ``RateIndex``.
+"""
+
+import ast
+import json
+
+import numpy as np
+import pandas as pd
+
+RATE_TABLES = [
+    'Energy_Table',
+    'Demand_Table',
+    'DemandTime_Table',
+    'ServiceCharge_Table',
+    'OtherCharges_Table',
+]
+
+EFFECTIVE_DATE_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+
+class RateHistoryParseError(ValueError):
+    """The ``RateHistory`` payload is not a usable list of rate schedules."""
+
+
+def parse_rate_history(text):
+    """
+    Parse a ``RateHistory`` payload into its list of rate schedule dicts.
+
+    JSON is tried first since it parses far faster than building a Python AST;
+    payloads stored as Python literals (single quotes, ``None``) fall back to
+    ``ast.literal_eval``. Raises ``RateHistoryParseError`` when neither works
+    or the result is not a non-empty list of dicts.
+    """
+    if not isinstance(text, (str, bytes)):
+        raise RateHistoryParseError(f"RateHistory must be a string, got {type(text).__name__}")
+
+    try:
+        result = json.loads(text)
+    except ValueError as json_error:
+        try:
+            result = ast.literal_eval(text if isinstance(text, str) else text.decode('utf-8'))
+        except (ValueError, SyntaxError, MemoryError, RecursionError) as literal_error:
+            raise RateHistoryParseError(
+                f"RateHistory is neither JSON ({json_error}) nor a Python literal ({literal_error})"
+            ) from literal_error
+
+    if not isinstance(result, list):
+        raise RateHistoryParseError(f"RateHistory must be a list of rate schedules, got {type(result).__name__}")
+    if not result:
+        raise RateHistoryParseError("RateHistory is an empty list")
+    if not all(isinstance(schedule, dict) for schedule in result):
+        raise RateHistoryParseError("RateHistory entries must be dicts of rate tables")
+    return result
+
+
+def _parse_effective_dates(values):
+    """Parse Rate Acuity ``EffectiveDate`` strings to day-resolution datetime64."""
+    try:
+        parsed = pd.to_datetime(values, format=EFFECTIVE_DATE_FORMAT)
+    except (ValueError, TypeError):
+        parsed = pd.to_datetime(values)
+    return np.asarray(parsed.values, dtype='datetime64[D]')
+
+
+def _to_day(date):
+    return np.datetime64(pd.Timestamp(date), 'D')
+
+
+def _to_days(dates):
+    dates = np.asarray(dates)
+    if dates.dtype.kind != 'M':
+        dates = pd.to_datetime(dates.ravel()).values
+    return dates.astype('datetime64[D]')
+
+
+class RateIndex:
+    """
+    Per-table effective-date timelines built once from a rate history dict.
+
+    Lookups mirror the semantics of the original DataFrame-based helpers in
+    ``extract_rate_data``: entries are matched by case-insensitive substring on
+    ``Description``, sorted by ``EffectiveDate`` (ties keep their order in the
+    history, so the later row wins), and only entries effective on or before
+    the billing end date are considered.
+    """
+
+    def __init__(self, rates, tables=RATE_TABLES):
+        self.tables = {}
+        for table_key in tables:
+            entries = rates.get(table_key, []) or []
+            dates = _parse_effective_dates([e['EffectiveDate'] for e in entries])
+            self.tables[table_key] = {
+                'entries': entries,
+                'descriptions': [str(e.get('Description', '')).lower() for e in entries],
+                'dates': dates,
+            }
+        self._series = {}
+
+    def series(self, table_key, field, desc_match='', **filters):
+        """
+        Return ``(dates, values)`` for the matching entries, sorted by date.
+
+        ``filters`` are exact matches on other columns, compared after
+        ``strip().lower()`` (e.g. ``Season='june-sept'``).
+        """
+        cache_key = (table_key, field, desc_match.lower(), tuple(sorted(filters.items())))
+        if cache_key in self._series:
+            return self._series[cache_key]
+
+        table = self.tables.get(table_key)
+        if table is None:
+            result = (np.array([], dtype='datetime64[D]'), np.array([], dtype=float))
+            self._series[cache_key] = result
+            return result
+
+        match = desc_match.lower()
+        wanted = {k: str(v).strip().lower() for k, v in filters.items()}
+        positions = [
+            i for i, (entry, desc) in enumerate(zip(table['entries'], table['descriptions']))
+            if match in desc
+            and all(str(entry.get(k, '')).strip().lower() == v for k, v in wanted.items())
+        ]
+
+        dates = table['dates'][positions]
+        values = pd.to_numeric(
+            pd.Series([table['entries'][i].get(field) for i in positions], dtype=object),
+            errors='coerce',
+        ).to_numpy(dtype=float)
+
+        order = np.argsort(dates, kind='stable')
+        result = (dates[order], values[order])
+        self._series[cache_key] = result
+        return result
+
+    def effective_rate(self, table_key, field, desc_match, on_date, **filters):
+        """Rate of the latest entry effective on or before ``on_date`` (0.0 if none)."""
+        return float(self.effective_rates(table_key, field, desc_match, [_to_day(on_date)], **filters)[0])
+
+    def effective_rates(self, table_key, field, desc_match, on_dates, **filters):
+        """Vectorized ``effective_rate`` for an array of dates."""
+        dates, values = self.series(table_key, field, desc_match, **filters)
+        on_dates = _to_days(on_dates)
+        if len(dates) == 0:
+            return np.zeros(len(on_dates))
+
+        pos = np.searchsorted(dates, on_dates, side='right') - 1
+        return np.where(pos >= 0, values[np.maximum(pos, 0)], 0.0)
+
+    def weighted_average(self, table_key, field, desc_match, start_date, end_date):
+        """
+        Day-weighted average rate over ``[start_date, end_date)``.
+
+        Entries in effect before ``start_date`` carry into the period; if the
+        first entry starts inside the period only the covered days count.
+        """
+        return float(self.weighted_averages(
+            table_key, field, desc_match, [_to_day(start_date)], [_to_day(end_date)]
+        )[0])
+
+    def weighted_averages(self, table_key, field, desc_match, start_dates, end_dates):
+        """
+        Vectorized ``weighted_average`` for arrays of period bounds.
+
+        The rate history is a step function; its running day-integral is
+        evaluated at both ends of every period, so each average is a
+        difference of two cumulative values divided by the covered days.
+        """
+        dates, values = self.series(table_key, field, desc_match)
+        starts = _to_days(start_dates)
+        ends = _to_days(end_dates)
+        if len(dates) == 0:
+            return np.zeros(len(starts))
+
+        day_nums = dates.astype(np.int64)
+        cumulative = np.concatenate(([0.0], np.cumsum(values[:-1] * np.diff(day_nums))))
+
+        def integral(at):
+            pos = np.maximum(np.searchsorted(day_nums, at, side='right') - 1, 0)
+            return cumulative[pos] + values[pos] * (at - day_nums[pos])
+
+        lo = np.maximum(starts.astype(np.int64), day_nums[0])
+        hi = ends.astype(np.int64)
+        covered = hi - lo
+
+        result = np.zeros(len(starts))
+        ok = covered > 0
+        result[ok] = (integral(hi[ok]) - integral(lo[ok])) / covered[ok]
+        return result
+
+
+def compile_rate_index(rates):
+    """Build a ``RateIndex`` from a ``GetChargeHistory``/``charge_history.json`` dict."""
+    return RateIndex(rates)
+
+
+def compile_rate_history(text):
+    """Parse a ``RateHistory`` payload and compile its first schedule."""
+    return RateIndex(parse_rate_history(text)[0])
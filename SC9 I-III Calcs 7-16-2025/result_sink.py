@@ -0,0 +1,286 @@
+"""
+Append-only output for portfolio runs.
+
+``main.py`` used to rebuild a DataFrame of every bill priced so far and write
+a new workbook after each account. ``ResultSink`` instead appends each
+account's bills once, as a CSV chunk or a Parquet part file, and records what
+has been committed so an interrupted run can resume. The Excel export
+happens once, at the end.
+
+Each append commits by adding one JSON line to ``sink_index.jsonl``;
+``sink_index.json`` is a snapshot the log is folded into when the sink is
+reopened or closed, so committing an account costs the same however many
+came before it.
+
+The index doubles as the run manifest: each committed account keeps its row
+offsets plus whatever metadata the runner stores with it (status, input
+fingerprints). Repricing an account supersedes its earlier rows rather than
+rewriting the output.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+INDEX_FILE = 'sink_index.json'
+LOG_FILE = 'sink_index.jsonl'
+CSV_FILE = 'bills.csv'
+
+BILL_FINGERPRINT_COLUMNS = ['AccountID', 'DateFrom', 'DateTo', 'Usage', 'Demand', 'BillAmount']
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def rate_history_version(history):
+    """Content hash of a raw rate history dict."""
+    return _digest(json.dumps(history, sort_keys=True, default=str))
+
+
+def charge_config_version(charges):
+    """Content hash of a charge configuration frame."""
+    return _digest(charges.to_csv(index=False))
+
+
+def bills_fingerprint(bills):
+    """Content hash of an account's bill rows."""
+    columns = [c for c in BILL_FINGERPRINT_COLUMNS if c in bills.columns]
+    return _digest(bills[columns].to_csv(index=False))
+
+
+def input_fingerprint(bills, history, charges):
+    """
+    Fingerprint of everything an account's bills are priced from.
+
+    Returns:
+    - dict: ``bills`` (hash of the bill rows), ``rates`` (rate history
+      version) and ``charges`` (charge configuration hash)
+    """
+    return {
+        'bills': bills_fingerprint(bills),
+        'rates': rate_history_version(history),
+        'charges': charge_config_version(charges),
+    }
+
+
+def flatten_bill(bill):
+    """
+    One output row from an itemized bill dict, in the column format the
+    per-account workbooks always had (``pd.DataFrame(bill_list)``): each
+    charge dict is kept whole as its string form, which the results
+    notebooks read back with ``ast.literal_eval``. ``total`` is a float.
+    """
+    row = {key: str(value) if isinstance(value, dict) else value for key, value in bill.items()}
+    if 'total' in row:
+        row['total'] = float(row['total'])
+    return row
+
+
+class ResultSink:
+    """
+    Append-only store for priced bills in ``directory``.
+
+    Parameters:
+    - directory (str): Output directory, created if missing
+    - fmt (str, optional): ``'parquet'`` or ``'csv'``; defaults to Parquet
+      when pyarrow is installed
+    - resume (bool, optional): Reopen an existing sink, dropping anything
+      written after the last committed account. Without it an existing sink
+      in ``directory`` raises ``FileExistsError``.
+
+    Call ``close()`` when done to fold the commit log into the snapshot.
+    """
+
+    def __init__(self, directory, fmt=None, resume=False):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.log_path = os.path.join(directory, LOG_FILE)
+        os.makedirs(directory, exist_ok=True)
+
+        if os.path.exists(self.index_path):
+            if not resume:
+                raise FileExistsError(f"{directory} already holds results; pass resume=True to continue it")
+            with open(self.index_path, 'r') as f:
+                self.index = json.load(f)
+            self.index.setdefault('superseded', [])
+            self.index.setdefault('seq', 0)
+            self._replay_log()
+            self._discard_uncommitted()
+            self.close()
+        else:
+            fmt = fmt or ('parquet' if HAS_PARQUET else 'csv')
+            if fmt == 'parquet' and not HAS_PARQUET:
+                raise ImportError("Parquet output requires pyarrow")
+            self.index = {'format': fmt, 'columns': None, 'rows': 0, 'bytes': 0, 'accounts': {}, 'superseded': [],
+                          'seq': 0}
+            self.close()
+
+    @property
+    def format(self):
+        return self.index['format']
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _apply(self, record):
+        # Records carry a sequence number, so one already in the snapshot is skipped
+        if record['seq'] <= self.index['seq']:
+            return
+        for field in ('columns', 'rows', 'bytes'):
+            if field in record:
+                self.index[field] = record[field]
+        if 'account' in record:
+            key = record['account']
+            if key in self.index['accounts']:
+                self.index['superseded'].append(self.index['accounts'].pop(key))
+            self.index['accounts'][key] = record['entry']
+        self.index['seq'] = record['seq']
+
+    def _commit(self, **fields):
+        """Commit one change by appending it to the log."""
+        record = {'seq': self.index['seq'] + 1, **fields}
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        self._apply(record)
+
+    def _replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break   # a crash mid-write: that append never committed
+                self._apply(record)
+
+    def close(self):
+        """Fold the commit log into ``sink_index.json``. The sink stays usable."""
+        self._save_index()
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+
+    def _part_path(self, part):
+        return os.path.join(self.directory, f'part-{part:05d}.parquet')
+
+    def _discard_uncommitted(self):
+        """Drop output written after the last commit (e.g. a crash mid-append)."""
+        if self.format == 'csv':
+            csv_path = os.path.join(self.directory, CSV_FILE)
+            tmp_path = csv_path + '.tmp'
+            if os.path.exists(tmp_path):
+                # A header rewrite is committed once the index has its columns
+                if list(pd.read_csv(tmp_path, nrows=0).columns) == self.index['columns']:
+                    os.replace(tmp_path, csv_path)
+                else:
+                    os.remove(tmp_path)
+            if os.path.exists(csv_path):
+                with open(csv_path, 'r+b') as f:
+                    f.truncate(self.index['bytes'])
+        else:
+            committed = {entry['part'] for entry in self._entries() if entry.get('part') is not None}
+            for name in os.listdir(self.directory):
+                if name.startswith('part-') and name.endswith('.parquet'):
+                    if int(name[5:10]) not in committed:
+                        os.remove(os.path.join(self.directory, name))
+
+    def _entries(self):
+        return list(self.index['accounts'].values()) + self.index['superseded']
+
+    def completed(self):
+        """AccountIDs already committed to the sink."""
+        return {int(account_id) for account_id in self.index['accounts']}
+
+    def manifest(self):
+        """Current index entry (offsets and metadata) per committed AccountID."""
+        return {int(account_id): entry for account_id, entry in self.index['accounts'].items()}
+
+    def append(self, account_id, bills, replace=False, **metadata):
+        """
+        Commit one account's bills.
+
+        ``bills`` is a list of itemized bill dicts (or a DataFrame of flat
+        rows). Extra keyword ``metadata`` is stored with the account's index
+        entry. Re-appending a committed account raises ``ValueError`` unless
+        ``replace`` is set, in which case its earlier rows are superseded.
+        In CSV mode, columns first seen in a later account widen the schema;
+        earlier rows read back empty in them.
+        """
+        key = str(int(account_id))
+        if key in self.index['accounts'] and not replace:
+            raise ValueError(f"Account {account_id} is already in the sink")
+
+        if isinstance(bills, pd.DataFrame):
+            chunk = bills.reset_index(drop=True)
+        else:
+            chunk = pd.DataFrame([flatten_bill(bill) for bill in bills])
+
+        entry = {'row_start': self.index['rows'], 'row_end': self.index['rows'] + len(chunk), 'part': None}
+        entry.update(metadata)
+        size = self.index['bytes']
+
+        if len(chunk) > 0:
+            if self.format == 'csv':
+                columns = self.index['columns'] or []
+                new_columns = [c for c in chunk.columns if c not in columns]
+                if new_columns:
+                    self._extend_columns(columns + new_columns)
+                chunk = chunk.reindex(columns=self.index['columns'])
+                csv_path = os.path.join(self.directory, CSV_FILE)
+                with open(csv_path, 'ab') as f:
+                    chunk.to_csv(f, header=self.index['bytes'] == 0, index=False)
+                    size = f.tell()
+            else:
+                part = len([a for a in self._entries() if a.get('part') is not None])
+                chunk.to_parquet(self._part_path(part), index=False)
+                entry['part'] = part
+
+        self._commit(account=key, entry=entry, rows=entry['row_end'], bytes=size)
+
+    def _extend_columns(self, columns):
+        """
+        Widen the CSV schema to ``columns``: the committed rows are rewritten
+        under the new header (as text, so values are unchanged) to a temporary
+        file, committed in the index, then swapped in.
+        """
+        csv_path = os.path.join(self.directory, CSV_FILE)
+        if self.index['bytes'] > 0:
+            tmp_path = csv_path + '.tmp'
+            rows = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+            rows.reindex(columns=columns, fill_value='').to_csv(tmp_path, index=False)
+            self._commit(columns=columns, bytes=os.path.getsize(tmp_path))
+            os.replace(tmp_path, csv_path)
+        else:
+            self._commit(columns=columns)
+
+    def read(self):
+        """All committed rows, in append order."""
+        if self.format == 'csv':
+            csv_path = os.path.join(self.directory, CSV_FILE)
+            if self.index['bytes'] == 0:
+                return pd.DataFrame(columns=self.index['columns'] or [])
+            rows = pd.read_csv(csv_path)
+            for entry in self.index['superseded']:
+                rows = rows.drop(index=range(entry['row_start'], entry['row_end']))
+            return rows.reset_index(drop=True)
+
+        parts = sorted(entry['part'] for entry in self.index['accounts'].values() if entry.get('part') is not None)
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat([pd.read_parquet(self._part_path(p)) for p in parts], ignore_index=True)
+
+    def export_excel(self, path):
+        """Write every committed row to one workbook."""
+        self.read().to_excel(path, index=False)
@@ -1,22 +1,83 @@
-from config import conn1 
-import pyodbc 
+from functools import lru_cache
+
 import pandas as pd 
 
-def GetTargetAccs(conn1):
-    params = pd.read_csv(r"Q:\AUDITORS\EGOS Shared Folder\Development\Nick's Pythons' Food\BillCalcParameters.csv")
+from bill_calc import schedule_for_subrate
+from db_pool import fetch_all
+
+PARAMETERS_PATH = r"Q:\AUDITORS\EGOS Shared Folder\Development\Nick's Pythons' Food\BillCalcParameters.csv"
+
+@lru_cache(maxsize=None)
+def load_parameters(path=PARAMETERS_PATH):
+    '''``BillCalcParameters.csv``, read on first use and cached per path.'''
+    return pd.read_csv(path)
+
+AMI_HEADERS_SQL = """
+SELECT head.[AccountId] AS AccountID
+    ,MAX(ami.[EndDate]) AS LatestEndDate
+    ,MAX(ami.[Id]) AS LatestImportId
+FROM (VALUES {accounts}) AS candidates(AccountID)
+JOIN [IntervalData].[dbo].[AMIImportHeader] head ON head.[AccountId] = candidates.AccountID
+LEFT JOIN [IntervalData].[dbo].[AMIImport] ami ON ami.[AMIImportHeaderId] = head.[Id]
+GROUP BY head.[AccountId]
+"""
+
+# SQL Server allows 2100 parameters per statement
+ACCOUNTS_CHUNK_SIZE = 1000
+
+def GetAMIHeaders(conn1, account_ids, chunk_size=ACCOUNTS_CHUNK_SIZE):
+    '''
+    AMI header metadata for the candidate accounts that have any. The IDs go
+    to the server as an inline VALUES table, in chunks of ``chunk_size``, so
+    only matching accounts come back.
+
+    Returns:
+    - DataFrame: AccountID, LatestEndDate (the furthest EndDate of the
+      account's AMI import periods) and LatestImportId (Id of its newest
+      import, which moves when a period is re-imported or topped up without
+      LatestEndDate changing); NaT / NaN when the header has no imports yet
+    '''
+    account_ids = list(dict.fromkeys(int(a) for a in account_ids))
+    queries = []
+    for i in range(0, len(account_ids), chunk_size):
+        chunk = account_ids[i:i + chunk_size]
+        queries.append((AMI_HEADERS_SQL.format(accounts=','.join(['(?)'] * len(chunk))), chunk))
+
+    headers = fetch_all(conn1, queries, label='GetAMIHeaders')
+    if not headers:
+        return pd.DataFrame({'AccountID': pd.Series(dtype='int64'), 'LatestEndDate': pd.Series(dtype='datetime64[ns]'),
+                             'LatestImportId': pd.Series(dtype='float64')})
+    headers = pd.concat(headers, ignore_index=True)
+    headers['LatestEndDate'] = pd.to_datetime(headers['LatestEndDate'])
+    return headers
+
+def GetTargetAccs(conn1, schedules=['Standard']):
+    '''
+    SC9 accounts with AMI data, routed to the comparison their subrate is priced
+    under (see ``RATE_SCHEDULES``).
+
+    Parameters:
+    - conn1: DB connection or ``ConnectionPool``
+    - schedules (list, optional): Comparisons to include; the default keeps
+      the Standard (9-I/III) accounts only
 
-    params = params[(params['ServiceClass'] == 9) & (params['Subrate'] != 'II')].drop_duplicates(subset='AccountID')
+    Returns:
+    - DataFrame: AccountID, Load Zone, Full Service, Schedule,
+      LatestEndDate and LatestImportId (see ``GetAMIHeaders``)
+    '''
+    params = load_parameters()
 
-    ami_head_sql = """
-    SELECT DISTINCT AccountID
-    FROM [IntervalData].[dbo].[AMIImportHeader]
-    """
+    params = params[params['ServiceClass'] == 9].drop_duplicates(subset='AccountID').copy()
+    params['Schedule'] = params['Subrate'].map(schedule_for_subrate)
+    params = params[params['Schedule'].isin(schedules)]
 
-    ami_head = pd.read_sql(ami_head_sql, conn1)
+    ami_head = GetAMIHeaders(conn1, params['AccountID'])
 
-    params = params[params['AccountID'].isin(ami_head['AccountID'].tolist())]
-    params = params[['AccountID','Load Zone','Full Service']]
+    params = params.merge(ami_head, on='AccountID', how='inner')
+    params = params[['AccountID','Load Zone','Full Service','Schedule','LatestEndDate','LatestImportId']]
 
     return params
 
-print(GetTargetAccs(conn1))
\ No newline at end of file
+if __name__ == '__main__':
+    from config import get_connection
+    print(GetTargetAccs(get_connection()))
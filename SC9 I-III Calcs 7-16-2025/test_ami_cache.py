@@ -0,0 +1,125 @@
+"""
+Checks for the monthly AMI cache: incremental refresh, offline reads and date slicing.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from ami_cache import AMICache, frame_fetcher
+from calc_demand import CalcCoinDemand
+
+
+def fixture_ami(start, end, account_id=7):
+    starts = pd.date_range(start, end, freq='5min', inclusive='left')
+    return pd.DataFrame({
+        'AccountID': account_id,
+        'StartDate': starts,
+        'EndDate': starts + pd.Timedelta(minutes=5),
+        'Usage': np.arange(len(starts), dtype=float) % 97,
+        'UsageUnit': 'KWH',
+    })
+
+
+def recording(fetch, calls):
+    def wrapped(account_id, unit, since=None):
+        calls.append(since)
+        return fetch(account_id, unit, since)
+    return wrapped
+
+
+def test_refresh_pulls_only_newer_intervals(tmp_path):
+    cache_dir = str(tmp_path / 'ami')
+    first = fixture_ami('2025-02-20', '2025-04-10')
+    calls = []
+
+    cache = AMICache(cache_dir, fetch=recording(frame_fetcher(first), calls))
+    assert cache.refresh(7) == len(first)
+    assert sorted(os.listdir(os.path.join(cache_dir, '7', 'KWH'))) == ['2025-02.npy', '2025-03.npy', '2025-04.npy', 'meta.json']
+
+    everything = pd.concat([first, fixture_ami('2025-04-10', '2025-05-03')], ignore_index=True)
+    cache.fetch = recording(frame_fetcher(everything), calls)
+    assert cache.refresh(7) == len(everything) - len(first)
+    assert calls == [None, '2025-04-10 00:00:00']
+    assert cache.refresh(7) == 0
+
+    # Offline: no fetcher, served from disk
+    offline = AMICache(cache_dir)
+    ami = offline.AMIData(7)
+    pd.testing.assert_frame_equal(ami, everything.drop(columns='AccountID'), check_dtype=False)
+    assert len(offline.AMIData(8)) == 0
+    with pytest.raises(LookupError):
+        offline.refresh(7)
+
+
+def test_slices_are_memory_mapped_views(tmp_path):
+    cache = AMICache(str(tmp_path / 'ami'), fetch=frame_fetcher(fixture_ami('2025-02-20', '2025-04-10')))
+    cache.refresh(7)
+
+    parts = list(cache.slices(7, start='2025-03-30', end='2025-04-02'))
+    assert [len(p) for p in parts] == [2 * 288, 1 * 288]
+    assert all(isinstance(p, np.memmap) for p in parts)
+    assert parts[0]['StartDate'][0] == np.datetime64('2025-03-30T00:00', 'ns')
+
+    bills = pd.DataFrame({'DateFrom': pd.to_datetime(['2025-02-27', '2025-03-14']),
+                          'DateTo': pd.to_datetime(['2025-03-14', '2025-04-08'])})
+    streamed = CalcCoinDemand(bills.copy(), cache.chunks(7))
+    whole = CalcCoinDemand(bills.copy(), cache.read(7))
+    np.testing.assert_allclose(streamed['AMI Usage'], whole['AMI Usage'])
+    np.testing.assert_allclose(streamed['AMI Demand'], whole['AMI Demand'])
+
+
+def test_refresh_recovers_from_uncommitted_month_write(tmp_path):
+    cache_dir = str(tmp_path / 'ami')
+    first = fixture_ami('2025-03-01', '2025-03-20')
+    everything = pd.concat([first, fixture_ami('2025-03-20', '2025-03-25')], ignore_index=True)
+
+    cache = AMICache(cache_dir, fetch=frame_fetcher(first))
+    cache.refresh(7)
+
+    # A crash after the month file was rewritten but before meta.json was
+    month_path = os.path.join(cache_dir, '7', 'KWH', '2025-03.npy')
+    partial = AMICache(str(tmp_path / 'scratch'), fetch=frame_fetcher(everything.head(len(first) + 10)))
+    partial.refresh(7)
+    os.replace(os.path.join(str(tmp_path / 'scratch'), '7', 'KWH', '2025-03.npy'), month_path)
+
+    cache.fetch = frame_fetcher(everything)
+    cache.refresh(7)
+    assert len(cache.read(7)) == len(everything)
+    assert cache.read(7)['StartDate'].is_unique
+
+
+def test_refresh_skips_fetch_when_server_has_nothing_newer(tmp_path):
+    calls = []
+    cache = AMICache(str(tmp_path / 'ami'), fetch=recording(frame_fetcher(fixture_ami('2025-03-01', '2025-03-05')), calls))
+    cache.refresh(7)
+
+    assert cache.refresh(7, latest=pd.Timestamp('2025-03-05')) == 0
+    assert cache.AMIData(7, latest=pd.Timestamp('2025-03-04'))['EndDate'].max() == pd.Timestamp('2025-03-05')
+    assert calls == [None]
+
+    cache.refresh(7, latest=pd.Timestamp('2025-03-06'))
+    cache.refresh(7, latest=pd.NaT)
+    assert calls == [None, '2025-03-05 00:00:00', '2025-03-05 00:00:00']
+
+
+def test_newer_import_inside_cached_range_rebuilds_account(tmp_path):
+    calls = []
+    ami = fixture_ami('2025-03-01', '2025-03-05')
+    cache = AMICache(str(tmp_path / 'ami'), fetch=recording(frame_fetcher(ami), calls))
+    latest = ami['EndDate'].max()
+    cache.refresh(7, latest=latest, import_id=11)
+    assert cache.refresh(7, latest=latest, import_id=11) == 0
+
+    # Import 12 re-imports March with corrected usage; LatestEndDate stays put
+    cache.fetch = recording(frame_fetcher(ami.assign(Usage=ami['Usage'] + 1)), calls)
+    cache.refresh(7, latest=latest, import_id=12)
+    assert calls == [None, None]
+    assert (cache.read(7)['Usage'].to_numpy() == ami['Usage'].to_numpy() + 1).all()
+    assert cache.refresh(7, latest=latest, import_id=12.0) == 0 and calls == [None, None]
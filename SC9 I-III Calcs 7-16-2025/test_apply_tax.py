@@ -0,0 +1,66 @@
+"""
+Checks for the indexed GRT/sales tax lookup against the SalesGRTax.xlsx copy in this directory.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from apply_tax import TaxIndex, apply_grt_salestax, apply_taxes, load_tax_index, load_tax_table
+
+TAX_TABLE = os.path.join(HERE, 'SalesGRTax.xlsx')
+
+
+def sample_rows():
+    tax_df = load_tax_table(TAX_TABLE)
+    duplicated = tax_df[tax_df.duplicated(subset=['AccountID', 'DateFrom', 'DateTo'], keep=False)]
+    return pd.concat([tax_df.sample(40, random_state=0), duplicated.head(10)])
+
+
+def expected_total(tax_df, row, total):
+    """First matching row, rates that are not positive count as 0."""
+    match = tax_df[(tax_df['AccountID'] == row['AccountID']) &
+                   (tax_df['DateFrom'] == row['DateFrom']) &
+                   (tax_df['DateTo'] == row['DateTo'])].iloc[0]
+    sales = match['SalesTaxRate'] / 100 if match['SalesTaxRate'] / 100 > 0 else 0
+    grt = match['GRTRate'] if match['GRTRate'] > 0 else 0
+    return total * (1 + grt) * (1 + sales)
+
+
+def test_index_matches_scan_with_string_dates():
+    tax_df = load_tax_table(TAX_TABLE)
+    index = load_tax_index(TAX_TABLE)
+    assert load_tax_index(TAX_TABLE) is index
+
+    for _, row in sample_rows().iterrows():
+        bill = {'AccountID': row['AccountID'], 'DateFrom': row['DateFrom'].strftime('%m-%d-%Y'),
+                'DateTo': row['DateTo'].strftime('%m-%d-%Y'), 'total': 1000.0}
+        expected = expected_total(tax_df, row, 1000.0)
+        assert apply_grt_salestax(dict(bill), index)['total'] == pytest.approx(expected)
+        assert apply_grt_salestax(dict(bill), tax_df)['total'] == pytest.approx(expected)
+
+    untaxed = {'AccountID': 1, 'DateFrom': '04-16-2025', 'DateTo': '05-15-2025', 'total': 17230.93}
+    assert apply_grt_salestax(dict(untaxed), index)['total'] == 17230.93
+
+
+def test_apply_taxes_frame():
+    tax_df = load_tax_table(TAX_TABLE)
+    rows = sample_rows()
+    results = pd.DataFrame({
+        'AccountID': list(rows['AccountID']) + [1],
+        'DateFrom': list(rows['DateFrom'].dt.strftime('%m-%d-%Y')) + ['04-16-2025'],
+        'DateTo': list(rows['DateTo']) + [pd.Timestamp('2025-05-15')],
+        'total': 1000.0,
+    })
+
+    taxed = apply_taxes(results, TaxIndex(tax_df))
+    expected = [expected_total(tax_df, row, 1000.0) for _, row in rows.iterrows()] + [1000.0]
+    np.testing.assert_allclose(taxed['total'], expected)
+    assert taxed['total'].dtype == float
+    assert (results['total'] == 1000.0).all()
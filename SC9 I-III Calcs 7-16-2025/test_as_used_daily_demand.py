@@ -0,0 +1,106 @@
+"""
+Checks for the daily as-used demand builder and that calculate_bill prices its output.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.abspath(os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+from as_used_daily_demand import CalcStandByDemand
+from bill_calc import DailyDemandIndex, calculate_bill, extract_rate_data
+from calc_demand import CalcCoinDemand
+
+
+def flat_ami(start, end, usage=1.0):
+    starts = pd.date_range(start, end, freq='5min', inclusive='left')
+    return pd.DataFrame({
+        'StartDate': starts,
+        'EndDate': starts + pd.Timedelta(minutes=5),
+        'Usage': usage,
+        'UsageUnit': 'KWH',
+    })
+
+
+def test_window_maxima_per_weekday():
+    # Friday 2025-07-04 through Monday 2025-07-07, two meters
+    ami = pd.concat([flat_ami('2025-07-04', '2025-07-08')] * 2, ignore_index=True)
+    ami.loc[ami['StartDate'] == '2025-07-04 07:55', 'Usage'] = 100   # before the windows
+    ami.loc[ami['StartDate'] == '2025-07-04 09:10', 'Usage'] = 10    # mid-peak
+    ami.loc[ami['StartDate'] == '2025-07-04 21:55', 'Usage'] = 20    # peak only
+    ami.loc[ami['StartDate'] == '2025-07-04 22:00', 'Usage'] = 100   # after the windows
+    ami.loc[ami['StartDate'] == '2025-07-05 12:00', 'Usage'] = 100   # Saturday
+
+    daily = CalcStandByDemand(None, ami)
+
+    assert list(daily['Date']) == list(pd.to_datetime(['2025-07-04', '2025-07-07']))
+    # A half-hour is 6 intervals on each of 2 meters; kW = kWh x 2
+    assert daily['MidPeakDemand_kW'].tolist() == [(10 + 5) * 2 * 2, 6 * 2 * 2]
+    assert daily['PeakDemand_kW'].tolist() == [(20 + 5) * 2 * 2, 6 * 2 * 2]
+
+
+def test_bills_limit_the_days_and_price():
+    ami = flat_ami('2025-05-01', '2025-07-01', usage=2.0)
+    bills = pd.DataFrame({'DateFrom': pd.to_datetime(['2025-05-15']), 'DateTo': pd.to_datetime(['2025-06-16'])})
+
+    daily = CalcStandByDemand(bills, ami)
+    assert daily['Date'].min() == pd.Timestamp('2025-05-15')
+    assert daily['Date'].max() == pd.Timestamp('2025-06-16')
+    assert (daily['PeakDemand_kW'] == 24.0).all() and (daily['MidPeakDemand_kW'] == 24.0).all()
+
+    charges_df = pd.read_csv(os.path.join(BASE_DIR, 'charge_config.csv'))
+    with open(os.path.join(BASE_DIR, 'charge_history.json'), 'r') as f:
+        rates = json.load(f)
+    rate_data = extract_rate_data(rates, charges_df, '2025-05-15', '2025-06-16')
+
+    # The bill covers the days between the 5/15 and 6/16 reads
+    billed_days = daily[(daily['Date'] > '2025-05-15') & (daily['Date'] < '2025-06-16')]
+    by_frame = calculate_bill(billed_days, 50000, '2025-05-15', '2025-06-16', rate_data)
+    by_index = calculate_bill(DailyDemandIndex(daily), 50000, '2025-05-15', '2025-06-16', rate_data)
+    assert by_index == by_frame
+    summer_days = np.busday_count('2025-06-01', '2025-06-16')
+    nonsummer_days = np.busday_count('2025-05-16', '2025-06-01')
+    assert by_index['demand_charge_summer']['midpeak_kWh_sum'] == pytest.approx(24.0 * summer_days)
+    assert by_index['demand_charge_nonsummer']['sum_daily_max_kW'] == pytest.approx(24.0 * nonsummer_days)
+
+
+def test_windows_match_the_demand_rates():
+    # An evening spike on a summer weekday lies only in the DemandTime
+    # 800-2159 window, so it is priced at peak_rate_summer
+    ami = flat_ami('2025-07-07', '2025-07-08')
+    ami.loc[ami['StartDate'] == '2025-07-07 12:00', 'Usage'] = 4    # 800-1759 and 800-2159
+    ami.loc[ami['StartDate'] == '2025-07-07 19:00', 'Usage'] = 9    # 800-2159 only
+    daily = CalcStandByDemand(None, ami)
+
+    charges_df = pd.read_csv(os.path.join(BASE_DIR, 'charge_config.csv'))
+    with open(os.path.join(BASE_DIR, 'charge_history.json'), 'r') as f:
+        rates = json.load(f)
+    rate_data = extract_rate_data(rates, charges_df, '2025-07-07', '2025-07-08')
+    # The summer DemandTime rates in effect for 2025, by window
+    demand_rate = {f"{row['StartTime']}-{row['EndTime']}": float(row['RatekW']) for row in rates['DemandTime_Table']
+                   if row['Season'].strip() == 'June-Sept' and row['EffectiveDate'].startswith('1/1/2025')}
+
+    bill = calculate_bill(daily, 1000, '2025-07-07', '2025-07-08', rate_data)['demand_charge_summer']
+    assert bill['midpeak_kWh_sum'] == (4 + 5) * 2 and bill['midpeak_rate'] == demand_rate['800-1759']
+    assert bill['peak_kWh_sum'] == (9 + 5) * 2 and bill['peak_rate'] == demand_rate['800-2159']
+    assert bill['peak_rate'] > bill['midpeak_rate']
+
+
+def test_demand_days_match_coincident_demand():
+    # Monday 7/7 to Friday 7/11: AMI on one day at a time shows which days each side counts
+    bill = pd.DataFrame({'DateFrom': [pd.Timestamp('2025-07-07')], 'DateTo': [pd.Timestamp('2025-07-11')]})
+    coincident, as_used = [], []
+    for day in pd.date_range('2025-07-07', '2025-07-11'):
+        ami = flat_ami(day, day + pd.Timedelta(days=1))
+        if pd.notna(CalcCoinDemand(bill.copy(), ami)['AMI Usage'].iloc[0]):
+            coincident.append(day)
+        if sum(DailyDemandIndex(CalcStandByDemand(None, ami)).determinants('2025-07-07', '2025-07-11')) > 0:
+            as_used.append(day)
+    assert as_used == coincident == list(pd.date_range('2025-07-08', '2025-07-10'))
@@ -0,0 +1,33 @@
+"""
+Smoke checks for the benchmark harness: generators, a one-account end-to-end run and baseline comparison.
+"""
+
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from benchmarks import bench_end_to_end, compare_to_baseline, synthetic_bills
+
+
+def test_synthetic_bills_share_read_cycles():
+    bills = synthetic_bills(range(30), months=2, routes=10)
+    assert len(bills) == 30 and all(len(frame) == 2 for frame in bills.values())
+    assert bills[0]['DateFrom'].tolist() == bills[10]['DateFrom'].tolist()
+    assert bills[0]['DateFrom'].tolist() != bills[1]['DateFrom'].tolist()
+
+
+def test_end_to_end_runs_offline():
+    timings = bench_end_to_end(accounts=(1,), months=2)
+    assert timings['1_accounts'] > 0 and timings['1_accounts_mb'] > 0
+    assert {'1_accounts.demand', '1_accounts.pricing', '1_accounts.write', '1_accounts.export'} <= set(timings)
+
+
+def test_compare_flags_only_slowdowns():
+    baseline = {'Hot paths': {'bills': 12, 'calculate_bill': 0.010, 'calculate_bill_per_s': 1200.0,
+                              'calculate_bill_mb': 1.0}}
+    current = {'Hot paths': {'bills': 12, 'calculate_bill': 0.020, 'calculate_bill_per_s': 600.0,
+                             'calculate_bill_mb': 1.1},
+               'New benchmark': {'anything': 1.0}}
+    assert compare_to_baseline(current, baseline) == [('Hot paths', 'calculate_bill', 0.010, 0.020)]
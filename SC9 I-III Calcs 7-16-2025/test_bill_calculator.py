@@ -0,0 +1,68 @@
+"""
+Checks for BillCalculator: one load, memoized rate lookups and batch pricing.
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bill_calc import calculate_bill, extract_rate_data, extract_scenario_rates
+from charge_type_helper import BillCalculator
+from test_bill_engine import sample_portfolio
+
+
+def test_calculate_memoizes_rate_data():
+    calculator = BillCalculator(cache_size=2)
+    bills_df, demand_df = sample_portfolio()
+    bill = bills_df.iloc[0]
+    days = demand_df[(demand_df['AccountID'] == bill['AccountID']) &
+                     (demand_df['Date'] > bill['DateFrom']) & (demand_df['Date'] < bill['DateTo'])]
+
+    first = calculator.calculate(days, bill['Usage'], bill['DateFrom'], bill['DateTo'], bill['Contract Demand'],
+                                 charge_combination='transmission_supply')
+    again = calculator.calculate(days, bill['Usage'], bill['DateFrom'], bill['DateTo'], bill['Contract Demand'],
+                                 charge_combination=[0, 1])
+    assert (calculator.misses, calculator.hits) == (1, 1)
+    assert again['rate_data'] is first['rate_data']
+
+    rate_data = extract_rate_data(calculator.index, calculator.charges_df, bill['DateFrom'], bill['DateTo'],
+                                  charge_types=[0, 1])
+    expected = calculate_bill(days, bill['Usage'], bill['DateFrom'], bill['DateTo'], rate_data, bill['Contract Demand'])
+    assert first['total'] == expected['total']
+    assert first['charge_types'] == [0, 1]
+
+    # Bounded: the oldest period is evicted
+    for _, other in bills_df.iloc[1:3].iterrows():
+        calculator.rate_data(other['DateFrom'], other['DateTo'], 'transmission_supply')
+    calculator.rate_data(bill['DateFrom'], bill['DateTo'], 'transmission_supply')
+    assert calculator.misses == 4
+
+    with pytest.raises(ValueError):
+        calculator.calculate(days, 1000, bill['DateFrom'], bill['DateTo'], charge_combination='everything')
+
+
+def test_calculate_many_matches_calculate():
+    calculator = BillCalculator()
+    bills_df, demand_df = sample_portfolio()
+
+    results = calculator.calculate_many(bills_df, demand_df, ['transmission_delivery', 'supply_only'])
+    single = calculator.calculate_many(bills_df, demand_df, 'supply_only')
+    pd.testing.assert_frame_equal(results['supply_only'], single)
+
+    # Charge types pick kWh surcharges only: the single-period and batch paths agree
+    first = bills_df.iloc[0]
+    supply = calculator.rate_data(first['DateFrom'], first['DateTo'], 'supply_only')
+    matrix = extract_scenario_rates(calculator.index, calculator.charges_df, bills_df, {'supply_only': [1]})
+    assert supply['customer_charge'] == matrix['supply_only'].iloc[0]['customer_charge'] > 0
+    assert supply['surcharge_rate'] == pytest.approx(matrix['supply_only'].iloc[0]['surcharge_rate'])
+
+    for i, bill in bills_df.iterrows():
+        days = demand_df[(demand_df['AccountID'] == bill['AccountID']) &
+                         (demand_df['Date'] > bill['DateFrom']) & (demand_df['Date'] < bill['DateTo'])]
+        expected = calculator.calculate(days, bill['Usage'], bill['DateFrom'], bill['DateTo'], bill['Contract Demand'])
+        assert results['transmission_delivery'].loc[i, 'total'] == pytest.approx(expected['total'], abs=0.011)
@@ -0,0 +1,132 @@
+"""
+Checks that the columnar bill engine matches calculate_bill bill by bill.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.abspath(os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+from bill_calc import (
+    DailyDemandIndex,
+    calculate_bill,
+    calculate_bills,
+    calculate_scenarios,
+    compile_rate_index,
+    extract_rate_data,
+    extract_rate_matrix,
+    extract_scenario_rates,
+    itemize_bill,
+)
+
+
+def load_rates():
+    charges_df = pd.read_csv(os.path.join(BASE_DIR, 'charge_config.csv'))
+    with open(os.path.join(BASE_DIR, 'charge_history.json'), 'r') as f:
+        rates = json.load(f)
+    return charges_df, compile_rate_index(rates)
+
+
+def sample_portfolio():
+    """Two accounts with weekday demand across a summer boundary."""
+    rng = np.random.default_rng(7)
+    bills, demand = [], []
+    for account_id, first_read in ((101, '2024-04-15'), (202, '2024-04-20')):
+        days = pd.date_range(first_read, periods=150, freq='D')
+        days = days[days.weekday < 5]
+        frame = pd.DataFrame({
+            'AccountID': account_id,
+            'Date': days,
+            'MidPeakDemand_kW': rng.uniform(200, 400, len(days)),
+            'PeakDemand_kW': rng.uniform(250, 450, len(days)),
+        })
+        frame.loc[::11, 'PeakDemand_kW'] = np.nan
+        demand.append(frame)
+
+        reads = pd.date_range(first_read, periods=5, freq='30D')
+        for date_from, date_to in zip(reads[:-1], reads[1:]):
+            bills.append({
+                'AccountID': account_id,
+                'DateFrom': date_from,
+                'DateTo': date_to,
+                'Usage': float(rng.integers(80000, 160000)),
+                'Contract Demand': float(rng.integers(300, 500)),
+            })
+    return pd.DataFrame(bills), pd.concat(demand, ignore_index=True)
+
+
+def test_calculate_bills_matches_calculate_bill():
+    charges_df, index = load_rates()
+    bills_df, demand_df = sample_portfolio()
+
+    rate_matrix = extract_rate_matrix(index, charges_df, bills_df)
+    results = calculate_bills(bills_df, demand_df, rate_matrix)
+    assert list(results.index) == list(bills_df.index)
+
+    for i, bill in bills_df.iterrows():
+        period_days = demand_df[
+            (demand_df['AccountID'] == bill['AccountID']) &
+            (demand_df['Date'] > bill['DateFrom']) &
+            (demand_df['Date'] < bill['DateTo'])
+        ].copy()
+        rate_data = extract_rate_data(index, charges_df, bill['DateFrom'], bill['DateTo'])
+        expected = calculate_bill(
+            period_days, bill['Usage'], bill['DateFrom'], bill['DateTo'],
+            rate_data, contract_demand_kW=bill['Contract Demand']
+        )
+
+        assert results.loc[i, 'total'] == pytest.approx(expected['total'], abs=0.011)
+        itemized = itemize_bill(results, rate_matrix, i)
+        for key, details in expected.items():
+            if key == 'total':
+                continue
+            assert results.loc[i, key] == pytest.approx(details['amount'], abs=0.011)
+            assert itemized[key]['amount'] == pytest.approx(details['amount'], abs=0.011)
+
+
+def test_demand_index_prices_each_period_without_mutating_input():
+    charges_df, index = load_rates()
+    bills_df, demand_df = sample_portfolio()
+    account_days = demand_df[demand_df['AccountID'] == 101].reset_index(drop=True)
+    untouched = account_days.copy()
+
+    demand_index = DailyDemandIndex(account_days)
+    for _, bill in bills_df[bills_df['AccountID'] == 101].iterrows():
+        start_date = bill['DateFrom'].strftime('%m-%d-%Y')
+        end_date = bill['DateTo'].strftime('%m-%d-%Y')
+        rate_data = extract_rate_data(index, charges_df, start_date, end_date)
+
+        period_days = account_days[
+            (account_days['Date'] > bill['DateFrom']) & (account_days['Date'] < bill['DateTo'])
+        ]
+        expected = calculate_bill(period_days, bill['Usage'], start_date, end_date, rate_data, bill['Contract Demand'])
+        actual = calculate_bill(demand_index, bill['Usage'], start_date, end_date, rate_data, bill['Contract Demand'])
+        assert actual['total'] == pytest.approx(expected['total'], abs=1e-6)
+
+    calculate_bill(account_days, 100000, '2024-04-15', '2024-09-12', rate_data, 400)
+    pd.testing.assert_frame_equal(account_days, untouched)
+
+
+def test_scenarios_match_separate_passes():
+    charges_df, index = load_rates()
+    bills_df, demand_df = sample_portfolio()
+    scenarios = {'transmission_delivery': [0, 2], 'transmission_supply': [0, 1], 'transmission_only': [0],
+                 'supply_only': [1], 'delivery_only': [2]}
+
+    scenario_rates = extract_scenario_rates(index, charges_df, bills_df, scenarios)
+    results = calculate_scenarios(bills_df, demand_df, scenario_rates)
+    assert list(results) == list(scenarios)
+
+    for name, charge_types in scenarios.items():
+        rate_matrix = extract_rate_matrix(index, charges_df, bills_df, charge_types=charge_types)
+        assert list(scenario_rates[name].columns) == list(rate_matrix.columns)
+        np.testing.assert_allclose(scenario_rates[name].to_numpy(), rate_matrix.to_numpy(), rtol=1e-12, atol=1e-15)
+        expected = calculate_bills(bills_df, demand_df, rate_matrix)
+        np.testing.assert_allclose(results[name]['total'], expected['total'], atol=0.011)
@@ -0,0 +1,84 @@
+"""
+Checks that the searchsorted CalcCoinDemand matches the per-bill filtering it replaced.
+"""
+
+import os
+import sys
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from calc_demand import CalcCoinDemand
+
+
+def reference_coin_demand(bills, ami):
+    """The original loop: re-filter the AMI frame for every bill."""
+    demand, usage = [], []
+    ami = ami[(ami['EndDate'] - ami['StartDate']).dt.total_seconds() / 60 == 5]
+    ami = ami[(ami['UsageUnit'] == 'KWH')]
+    for i in bills.index:
+        rel_ami = ami[(ami['StartDate'] >= bills['DateFrom'][i] + timedelta(days=1)) &
+                      (ami['EndDate'] <= bills['DateTo'][i])]
+        if rel_ami.shape[0] > 0:
+            rel_ami = pd.DataFrame(rel_ami.groupby(['StartDate', 'EndDate'])['Usage'].sum()).reset_index()
+            demand.append(rel_ami['Usage'].rolling(6).sum().max() * 2)
+            usage.append(rel_ami['Usage'].sum())
+        else:
+            demand.append(np.nan)
+            usage.append(np.nan)
+    return np.array(demand), np.array(usage)
+
+
+def sample_ami():
+    """Two meters of 5-minute data with a gap, plus rows that must be ignored."""
+    rng = np.random.default_rng(3)
+    starts = pd.date_range('2025-01-01', '2025-04-10', freq='5min')
+    starts = starts[(starts < '2025-02-10') | (starts >= '2025-02-12 06:00')]
+    meters = [
+        pd.DataFrame({'StartDate': starts, 'EndDate': starts + pd.Timedelta(minutes=5),
+                      'Usage': rng.random(len(starts)) * 40, 'UsageUnit': 'KWH'})
+        for _ in range(2)
+    ]
+    noise = pd.DataFrame({
+        'StartDate': starts[:50], 'EndDate': starts[:50] + pd.Timedelta(minutes=15),
+        'Usage': 1000.0, 'UsageUnit': 'KWH',
+    })
+    kvarh = meters[0].head(50).assign(UsageUnit='KVARH', Usage=1000.0)
+    ami = pd.concat(meters + [noise, kvarh], ignore_index=True)
+    return ami.sample(frac=1, random_state=1).reset_index(drop=True)
+
+
+def sample_bills():
+    return pd.DataFrame({
+        'DateFrom': pd.to_datetime(['2024-11-01', '2024-12-15', '2025-01-14', '2025-02-11', '2025-03-13', '2025-04-09']),
+        'DateTo': pd.to_datetime(['2024-12-01', '2025-01-14', '2025-02-12', '2025-03-13', '2025-04-12', '2025-04-10']),
+    })
+
+
+def test_coin_demand_matches_per_bill_filtering():
+    ami = sample_ami()
+    expected_demand, expected_usage = reference_coin_demand(sample_bills(), ami)
+
+    bills = CalcCoinDemand(sample_bills(), ami)
+    np.testing.assert_allclose(bills['AMI Demand'], expected_demand, rtol=1e-9)
+    np.testing.assert_allclose(bills['AMI Usage'], expected_usage, rtol=1e-9)
+    assert np.isnan(bills['AMI Usage'][0])
+
+
+def test_coin_demand_streams_date_chunks():
+    ami = sample_ami()
+    whole = CalcCoinDemand(sample_bills(), ami)
+
+    month = pd.to_datetime(ami['StartDate']).dt.to_period('M')
+    chunks = (ami[month == m] for m in sorted(month.unique()))
+    streamed = CalcCoinDemand(sample_bills(), chunks)
+    np.testing.assert_allclose(streamed['AMI Demand'], whole['AMI Demand'], rtol=1e-9)
+    np.testing.assert_allclose(streamed['AMI Usage'], whole['AMI Usage'], rtol=1e-9)
+
+    with pytest.raises(ValueError):
+        CalcCoinDemand(sample_bills(), [ami[month == month.max()], ami[month == month.min()]])
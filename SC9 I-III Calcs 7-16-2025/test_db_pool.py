@@ -0,0 +1,92 @@
+"""
+Checks for the connection pool against a local SQLite database.
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from db_pool import ConnectionPool, fetch_all, read_sql, run_concurrently
+
+
+def sqlite_factory(path, opened):
+    def factory():
+        conn = sqlite3.connect(path, check_same_thread=False)
+        opened.append(conn)
+        return conn
+    return factory
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'bills.db')
+    conn = sqlite3.connect(path)
+    pd.DataFrame({'AccountID': [1, 1, 2, 3], 'Usage': [10, 20, 30, 40]}).to_sql('Bills', conn, index=False)
+    conn.close()
+    return path
+
+
+def test_queries_overlap_within_pool_size(db_path):
+    pool = ConnectionPool(sqlite_factory(db_path, []), size=2)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def query(account_id):
+        def task():
+            with pool.connection() as conn:
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.05)
+                frame = pd.read_sql('SELECT Usage FROM Bills WHERE AccountID = ?', conn, params=[account_id])
+                with lock:
+                    active[0] -= 1
+            return frame['Usage'].sum()
+        return task
+
+    assert run_concurrently(pool, [query(a) for a in (1, 2, 3, 1, 2, 3)]) == [30, 30, 40, 30, 30, 40]
+    assert peak[0] == 2
+    assert pool.opened == 2
+
+    frames = fetch_all(pool, [('SELECT * FROM Bills WHERE AccountID = ?', [a]) for a in (1, 2)], label='bills')
+    assert [len(f) for f in frames] == [2, 1]
+    assert pool.timings()['bills']['calls'] == 2
+
+
+def test_dead_connection_is_replaced(db_path):
+    opened = []
+    pool = ConnectionPool(sqlite_factory(db_path, opened), size=1, check_after=3600)
+    assert len(pool.read_sql('SELECT * FROM Bills')) == 4
+
+    # Dropped while idle and not yet due a health check: the query fails, is retried on a new connection
+    opened[0].close()
+    assert len(pool.read_sql('SELECT * FROM Bills', label='all')) == 4
+    assert pool.reconnects == 1 and pool.opened == 2
+
+    # Due a health check: replaced before use
+    pool.check_after = 0
+    opened[1].close()
+    assert len(read_sql(pool, 'SELECT * FROM Bills')) == 4
+    assert pool.reconnects == 2 and pool.opened == 3
+
+    # A bad query on a live connection is not retried
+    with pytest.raises(Exception):
+        pool.read_sql('SELECT * FROM Missing')
+    assert pool.opened == 3
+
+
+def test_acquire_times_out_when_exhausted(db_path):
+    pool = ConnectionPool(sqlite_factory(db_path, []), size=1, acquire_timeout=0.05)
+    with pool.connection():
+        with pytest.raises(TimeoutError):
+            pool.acquire()
+    pool.release(pool.acquire())
+    pool.close()
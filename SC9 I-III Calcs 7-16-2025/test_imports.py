@@ -0,0 +1,25 @@
+"""
+Checks that the pipeline modules import offline: no DB driver, AMI client or Q: drive needed.
+"""
+
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPT = """
+import sys
+sys.path.insert(0, {here!r})
+import apply_tax, bill_calc, config, target_accounts, portfolio_runner
+print(','.join(name for name in ('pyodbc', 'AccConv') if name in sys.modules))
+"""
+
+
+def test_imports_have_no_side_effects():
+    result = subprocess.run(
+        [sys.executable, '-c', SCRIPT.format(here=HERE)],
+        capture_output=True, text=True, cwd=HERE,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
@@ -0,0 +1,151 @@
+"""
+Checks for the prefetch pipeline: ordering, backpressure, overlap and the
+prefetched portfolio run matching the plain one.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.abspath(os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+from ami_cache import AMICache, frame_fetcher
+from bill_calc import compile_rate_index
+from pipeline import StageTimer, prefetch_pipeline
+from portfolio_runner import run_portfolio
+from result_sink import charge_config_version, rate_history_version
+
+
+def test_results_in_order_with_bounded_prefetch():
+    lock = threading.Lock()
+    fetched, computed = [], []
+
+    def fetch(item):
+        time.sleep(0.001 * (item % 3))
+        with lock:
+            fetched.append(item)
+        return item
+
+    def compute(item):
+        computed.append(item)
+        # Never more than ``prefetch`` items fetched ahead of the one being computed
+        assert len(fetched) - len(computed) <= 3
+        return item * 10
+
+    timer = StageTimer()
+    assert list(prefetch_pipeline(range(20), fetch, compute, prefetch=3, timer=timer)) == [i * 10 for i in range(20)]
+    assert timer.summary()['compute']['calls'] == 20
+
+
+def test_io_overlaps_compute():
+    def fetch(item):
+        time.sleep(0.02)
+        return item
+
+    def compute(item):
+        time.sleep(0.02)
+        return item
+
+    start = time.perf_counter()
+    assert list(prefetch_pipeline(range(10), fetch, compute, prefetch=4, io_threads=2)) == list(range(10))
+    # Serially this is 0.4 s; fetching ahead hides nearly all of the I/O
+    assert time.perf_counter() - start < 0.32
+
+
+def test_stage_errors_surface_at_their_item():
+    def fetch(item):
+        if item == 2:
+            raise RuntimeError('fetch failed')
+        return item
+
+    results = prefetch_pipeline(range(5), fetch, lambda item: item)
+    assert next(results) == 0 and next(results) == 1
+    with pytest.raises(RuntimeError):
+        next(results)
+
+
+def portfolio_inputs(tmp_path):
+    charges_df = pd.read_csv(os.path.join(BASE_DIR, 'charge_config.csv'))
+    with open(os.path.join(BASE_DIR, 'charge_history.json'), 'r') as f:
+        history = json.load(f)
+    rate_source = {
+        'index': compile_rate_index(history),
+        'charges': charges_df,
+        'version': {'rates': rate_history_version(history), 'charges': charge_config_version(charges_df)},
+    }
+
+    rng = np.random.default_rng(3)
+    bills_by_account, tax_rows = {}, []
+    ami_cache = AMICache(str(tmp_path / 'ami'))
+    for account_id in (11, 12, 13):
+        reads = pd.date_range('2024-05-03', periods=4, freq='30D')
+        bills = pd.DataFrame({
+            'AccountID': account_id,
+            'DateFrom': reads[:-1],
+            'DateTo': reads[1:],
+            'Usage': rng.uniform(80000, 160000, 3),
+            'Demand': rng.uniform(300, 500, 3),
+            'BillAmount': rng.uniform(20000, 40000, 3),
+        })
+        bills_by_account[account_id] = bills
+        tax_rows.append(bills[['AccountID', 'DateFrom', 'DateTo']].assign(SalesTaxRate=4.5, GRTRate=0.0257))
+
+        starts = pd.date_range(reads[0], reads[-1], freq='5min', inclusive='left')
+        ami = pd.DataFrame({'StartDate': starts, 'EndDate': starts + pd.Timedelta(minutes=5),
+                            'Usage': rng.uniform(10, 40, len(starts)), 'UsageUnit': 'KWH'})
+        ami_cache.fetch = frame_fetcher(ami)
+        ami_cache.refresh(account_id)
+
+    tax_path = str(tmp_path / 'SalesGRTax.xlsx')
+    pd.concat(tax_rows, ignore_index=True).to_excel(tax_path, index=False)
+    return tax_path, {'Standard': rate_source}, bills_by_account
+
+
+def test_prefetched_portfolio_matches_plain_run(tmp_path):
+    tax_path, rate_sources, bills_by_account = portfolio_inputs(tmp_path)
+    account_ids = list(bills_by_account)
+    # Cached AMI already reaches the server's latest interval, so nothing is fetched
+    ami_latest = {a: (pd.Timestamp('2024-01-01'), None) for a in account_ids}
+
+    def run(**kwargs):
+        return list(run_portfolio(account_ids, tax_path, rate_sources, bills_by_account=bills_by_account,
+                                  ami_cache_dir=str(tmp_path / 'ami'), ami_latest=ami_latest, **kwargs))
+
+    plain = run()
+    timer = StageTimer()
+    prefetched = run(prefetch=2, timer=timer)
+
+    assert [r['status'] for r in prefetched] == ['ok'] * 3
+    assert [r['AccountID'] for r in prefetched] == account_ids
+    for a, b in zip(plain, prefetched):
+        assert a['fingerprint'] == b['fingerprint']
+        assert [bill['total'] for bill in a['bills']] == [bill['total'] for bill in b['bills']]
+    assert {'fetch_bills', 'fetch_ami', 'demand', 'pricing', 'wait_io', 'compute'} <= set(timer.summary())
+
+    # All three accounts share one read cycle: each period's rates are resolved once
+    assert [r['rate_lookups'] for r in prefetched] == [{'hits': 0, 'misses': 3}] + [{'hits': 3, 'misses': 0}] * 2
+
+
+def test_accounts_without_ami_are_retried(tmp_path):
+    tax_path, rate_sources, bills_by_account = portfolio_inputs(tmp_path)
+    cache = AMICache(str(tmp_path / 'ami'))
+
+    def run(ami_fetch, known_fingerprints=None):
+        return list(run_portfolio([11], tax_path, rate_sources, bills_by_account=bills_by_account,
+                                  known_fingerprints=known_fingerprints, ami_fetch=ami_fetch))
+
+    missing = run(lambda account_id, unit, since=None: cache.AMIData(account_id, unit)[0:0])
+    assert missing[0]['status'] == 'No AMI Data' and missing[0]['fingerprint'] is None
+
+    # The bills are unchanged, but the AMI data has arrived since
+    arrived = run(cache.AMIData, known_fingerprints={11: missing[0]['fingerprint']})
+    assert arrived[0]['status'] == 'ok'
+    assert run(cache.AMIData, known_fingerprints={11: arrived[0]['fingerprint']})[0]['status'] == 'unchanged'
@@ -0,0 +1,194 @@
+"""
+Checks for the compiled rate index and rate cache against the bundled rate history.
+"""
+
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.abspath(os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+from bill_calc import extract_rate_data, extract_rate_matrix, rate_data_from_matrix, schedule_for_subrate
+from rate_cache import RateCache, RateDataMemo, _frame_to_records
+from rate_index import RateHistoryParseError, compile_rate_history, compile_rate_index, parse_rate_history
+
+
+def load_data():
+    charges_df = pd.read_csv(os.path.join(BASE_DIR, 'charge_config.csv'))
+    with open(os.path.join(BASE_DIR, 'charge_history.json'), 'r') as f:
+        rates = json.load(f)
+    return charges_df, rates
+
+
+def test_effective_rate_lookup():
+    _, rates = load_data()
+    index = compile_rate_index(rates)
+
+    assert index.effective_rate('ServiceCharge_Table', 'Rate', 'Customer Charge', '2024-12-31') == 66.0
+    assert index.effective_rate('ServiceCharge_Table', 'Rate', 'Customer Charge', '2025-01-01') == 71.0
+    assert index.effective_rate('ServiceCharge_Table', 'Rate', 'Customer Charge', '2023-12-31') == 0.0
+
+    # Ties on EffectiveDate resolve to the later row, as the DataFrame sort did
+    assert index.effective_rate(
+        'DemandTime_Table', 'RatekW', 'As-used Daily Demand Delivery Charge', '2025-05-15'
+    ) == pytest.approx(1.1744)
+    assert index.effective_rate(
+        'DemandTime_Table', 'RatekW', '', '2025-07-01',
+        StartTime='800', EndTime='2159', Season='june-sept'
+    ) == pytest.approx(2.2761)
+
+
+def test_weighted_average_spans_rate_change():
+    _, rates = load_data()
+    index = compile_rate_index(rates)
+
+    # 15 days at $66 followed by 15 days at $71
+    rate = index.weighted_average('ServiceCharge_Table', 'Rate', 'Customer Charge', '2024-12-17', '2025-01-16')
+    assert rate == pytest.approx(68.5)
+
+
+def test_extract_rate_data_accepts_index():
+    charges_df, rates = load_data()
+    index = compile_rate_index(rates)
+
+    for charge_types in ([0, 2], [0, 1]):
+        from_dict = extract_rate_data(rates, charges_df, '2025-04-16', '2025-05-15', charge_types=charge_types)
+        from_index = extract_rate_data(index, charges_df, '2025-04-16', '2025-05-15', charge_types=charge_types)
+        assert from_dict == from_index
+
+    rate_data = extract_rate_data(index, charges_df, '2025-04-16', '2025-05-15')
+    assert rate_data['customer_charge'] == pytest.approx(71.0 * 29 / 30)
+    assert rate_data['as_used_rate_nonsummer'] == pytest.approx(1.1744)
+
+
+def test_rate_matrix_matches_extract_rate_data():
+    charges_df, rates = load_data()
+    index = compile_rate_index(rates)
+    periods = [
+        ('2024-02-14', '2024-03-15'),
+        ('2024-06-13', '2024-07-13'),
+        ('2024-12-11', '2025-01-10'),
+        ('2025-04-16', '2025-05-15'),
+        ('2025-05-15', '2025-05-15'),
+    ]
+
+    for charge_types in ([0, 2], [0, 1]):
+        matrix = extract_rate_matrix(index, charges_df, periods, charge_types=charge_types)
+        assert len(matrix) == len(periods)
+
+        for i, (start_date, end_date) in enumerate(periods):
+            expected = extract_rate_data(index, charges_df, start_date, end_date, charge_types=charge_types)
+            actual = rate_data_from_matrix(matrix, i)
+
+            assert list(actual['kwh_charge_breakdown']) == list(expected['kwh_charge_breakdown'])
+            for key, rate in expected['kwh_charge_breakdown'].items():
+                assert actual['kwh_charge_breakdown'][key] == pytest.approx(rate, abs=1e-10)
+            for key, rate in expected.items():
+                if key != 'kwh_charge_breakdown':
+                    assert actual[key] == pytest.approx(rate, abs=1e-10)
+
+
+def test_rate_cache_serves_disk_copy_offline(tmp_path):
+    charges_df, rates = load_data()
+    cache_dir = str(tmp_path / 'rate_cache')
+
+    with pytest.raises(LookupError):
+        RateCache(cache_dir=cache_dir).get(22, [0, 2])
+
+    RateCache(cache_dir=cache_dir)._write_file(22, (0, 2), {
+        'modified': '2025-06-24 16:24:24.827|2025-06-24 16:24:40.510',
+        'history': rates,
+        'charges': _frame_to_records(charges_df),
+    })
+
+    cache = RateCache(cache_dir=cache_dir)
+    source = cache.get(22, [2, 0])
+    assert cache.get(22, [0, 2]) is source
+    assert len(source['charges']) == len(charges_df)
+
+    expected = extract_rate_data(rates, charges_df, '2025-04-16', '2025-05-15')
+    assert extract_rate_data(source['index'], source['charges'], '2025-04-16', '2025-05-15') == expected
+
+    # The version is stable across processes reading the same disk copy
+    assert RateCache(cache_dir=cache_dir).get(22, [0, 2])['version'] == source['version']
+
+
+def test_rate_cache_multiple_schedules(tmp_path):
+    charges_df, rates = load_data()
+    cache_dir = str(tmp_path / 'rate_cache')
+
+    # A second schedule with a different customer charge stands in for Rate V
+    large_rates = json.loads(json.dumps(rates))
+    large_rates['ServiceCharge_Table'][-1]['Rate'] = '95.00000'
+    for rate_id, history in [(22, rates), (99, large_rates)]:
+        RateCache(cache_dir=cache_dir)._write_file(rate_id, (0, 2), {
+            'modified': None,
+            'history': history,
+            'charges': _frame_to_records(charges_df),
+        })
+
+    cache = RateCache(cache_dir=cache_dir)
+    with pytest.raises(LookupError):
+        cache.get_schedules(['Standard', 'Large'])
+
+    sources = cache.get_schedules(['Standard', 'Large'], rate_ids={'Large': 99})
+    assert sources['Standard'] is cache.get(22)
+    assert sources['Large'] is cache.get(99)
+    assert sources['Standard']['version']['rates'] != sources['Large']['version']['rates']
+
+    def customer_charge(source):
+        return extract_rate_data(source['index'], source['charges'], '2025-04-16', '2025-05-15')['customer_charge']
+    assert customer_charge(sources['Large']) > customer_charge(sources['Standard'])
+
+    assert schedule_for_subrate('II') == 'Large'
+    assert schedule_for_subrate('III') == 'Standard'
+    assert schedule_for_subrate(float('nan')) == 'Standard'
+
+
+def test_parse_rate_history_json_and_literal():
+    charges_df, rates = load_data()
+
+    from_json = parse_rate_history(json.dumps([rates]))
+    from_literal = parse_rate_history(repr([rates]))
+    assert from_json == from_literal == [rates]
+
+    index = compile_rate_history(json.dumps([rates]))
+    assert extract_rate_data(index, charges_df, '2025-04-16', '2025-05-15') == \
+        extract_rate_data(rates, charges_df, '2025-04-16', '2025-05-15')
+
+    for bad in ('', '{"Energy_Table": []}', '[]', "[{'Energy_Table': [}", None):
+        with pytest.raises(RateHistoryParseError):
+            parse_rate_history(bad)
+
+
+def test_rate_memo_resolves_each_period_once():
+    charges_df, rates = load_data()
+    source = {'index': compile_rate_index(rates), 'charges': charges_df, 'version': {'rates': 'a', 'charges': 'b'}}
+    memo = RateDataMemo(maxsize=8)
+
+    # 40 accounts on two read cycles, priced from 4 threads
+    periods = [('04-16-2025', '05-15-2025'), ('04-22-2025', '05-21-2025')] * 20
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda period: memo.for_source(source, *period), periods[:2]))
+        results = list(pool.map(lambda period: memo.for_source(source, *period), periods))
+    assert memo.stats() == {'hits': 40, 'misses': 2, 'size': 2}
+    assert results[0] is results[2]
+    assert results[0] == extract_rate_data(source['index'], charges_df, '04-16-2025', '05-15-2025')
+
+    # Same period as Timestamps, or types in another order: still a hit
+    memo.for_source(source, pd.Timestamp('2025-04-16'), pd.Timestamp('2025-05-15'), charge_types=[2, 0])
+    assert memo.hits == 41
+
+    # A new rate source version never sees the old entries
+    memo.for_source(dict(source, version={'rates': 'c', 'charges': 'b'}), *periods[0])
+    assert memo.misses == 3
+
+    for day in range(1, 10):
+        memo.for_source(source, f'06-{day:02d}-2025', '07-01-2025')
+    assert memo.stats()['size'] == 8
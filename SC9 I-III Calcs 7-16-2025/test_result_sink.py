@@ -0,0 +1,165 @@
+"""
+Checks for the append-only result sink, its resume behaviour and the run manifest.
+"""
+
+import ast
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from result_sink import CSV_FILE, INDEX_FILE, LOG_FILE, ResultSink, flatten_bill, input_fingerprint
+
+
+def sample_bill(account_id, total):
+    return {
+        'customer_charge': {'amount': 68.63, 'description': 'Fixed monthly customer service charge'},
+        'energy_surcharge': {
+            'amount': 850.48,
+            'rate_per_kWh': 0.0066,
+            'usage_kWh': 128627,
+            'breakdown': {'monthly_adjustment_clause': {'rate_per_kWh': 0.0084, 'charge': 1080.47}},
+            'description': 'Total of all $/kWh delivery surcharges',
+        },
+        'total': str(total),
+        'AccountID': account_id,
+        'DateFrom': '04-16-2025',
+        'DateTo': '05-15-2025',
+    }
+
+
+def test_flatten_bill():
+    bill = sample_bill(1, 17230.93)
+    row = flatten_bill(bill)
+    # Same columns as pd.DataFrame([bill]); charges parse back with ast.literal_eval
+    assert list(row) == list(pd.DataFrame([bill]).columns)
+    assert ast.literal_eval(row['energy_surcharge']) == bill['energy_surcharge']
+    assert row['total'] == 17230.93
+
+
+def test_excel_export_keeps_charge_dicts(tmp_path):
+    sink = ResultSink(str(tmp_path / 'run'), fmt='csv')
+    sink.append(1, [sample_bill(1, 100.0)])
+    sink.export_excel(str(tmp_path / 'calcs.xlsx'))
+
+    calcs = pd.read_excel(str(tmp_path / 'calcs.xlsx'))
+    # What the results notebook does with the export
+    assert calcs['customer_charge'].apply(ast.literal_eval).str['amount'].tolist() == [68.63]
+    assert calcs['total'].tolist() == [100.0]
+
+
+def test_append_and_resume_after_crash(tmp_path):
+    directory = str(tmp_path / 'run')
+    sink = ResultSink(directory, fmt='csv')
+    sink.append(1, [sample_bill(1, 100.0), sample_bill(1, 110.0)])
+    sink.append(2, [], status='No AMI Data')
+
+    with pytest.raises(FileExistsError):
+        ResultSink(directory, fmt='csv')
+
+    # A crash after writing rows but before committing the index
+    with open(os.path.join(directory, CSV_FILE), 'a') as f:
+        f.write('partial,row\n')
+
+    resumed = ResultSink(directory, resume=True)
+    assert resumed.completed() == {1, 2}
+    resumed.append(3, [sample_bill(3, 120.0)])
+
+    rows = resumed.read()
+    assert list(rows['AccountID']) == [1, 1, 3]
+    assert list(rows['total']) == [100.0, 110.0, 120.0]
+
+    with pytest.raises(ValueError):
+        resumed.append(3, [sample_bill(3, 120.0)])
+
+
+def test_repriced_account_supersedes_earlier_rows(tmp_path):
+    directory = str(tmp_path / 'run')
+    sink = ResultSink(directory, fmt='csv')
+    sink.append(1, [sample_bill(1, 100.0)], fingerprint={'bills': 'a'})
+    sink.append(2, [sample_bill(2, 200.0)], fingerprint={'bills': 'b'})
+    sink.append(1, [sample_bill(1, 150.0), sample_bill(1, 160.0)], replace=True, fingerprint={'bills': 'c'})
+
+    resumed = ResultSink(directory, resume=True)
+    assert resumed.manifest()[1]['fingerprint'] == {'bills': 'c'}
+    assert resumed.manifest()[1]['row_start'] == 2
+
+    rows = resumed.read()
+    assert list(zip(rows['AccountID'], rows['total'])) == [(2, 200.0), (1, 150.0), (1, 160.0)]
+
+
+def test_appends_commit_to_the_log(tmp_path):
+    directory = str(tmp_path / 'run')
+    sink = ResultSink(directory, fmt='csv')
+    snapshot = os.path.getmtime(os.path.join(directory, INDEX_FILE))
+    for account_id in range(1, 4):
+        sink.append(account_id, [sample_bill(account_id, 100.0)], status='ok')
+    sink.append(2, [sample_bill(2, 150.0)], replace=True, status='ok')
+    # Appends only add log lines; the snapshot is left alone until close()
+    assert os.path.getmtime(os.path.join(directory, INDEX_FILE)) == snapshot
+    with open(os.path.join(directory, LOG_FILE), 'a') as f:
+        f.write('{"seq": 5, "acc')   # a crash mid-commit
+
+    resumed = ResultSink(directory, resume=True)
+    assert resumed.completed() == {1, 2, 3} and resumed.manifest()[2]['row_start'] == 3
+    assert not os.path.exists(os.path.join(directory, LOG_FILE))
+    assert list(resumed.read()['total']) == [100.0, 100.0, 150.0]
+
+    # Folding the log in twice (a crash inside close()) applies nothing twice
+    resumed.append(4, [sample_bill(4, 120.0)])
+    with open(os.path.join(directory, LOG_FILE), 'r') as f:
+        log = f.read()
+    resumed.close()
+    with open(os.path.join(directory, LOG_FILE), 'w') as f:
+        f.write(log)
+    again = ResultSink(directory, resume=True)
+    assert again.manifest() == resumed.manifest() and len(again.index['superseded']) == 1
+
+
+def test_later_columns_extend_the_csv_schema(tmp_path):
+    directory = str(tmp_path / 'run')
+    sink = ResultSink(directory, fmt='csv')
+    sink.append(1, pd.DataFrame({'AccountID': [1], 'a': ['x,"y"']}))
+    sink.append(2, pd.DataFrame({'AccountID': [2], 'b': [2.5]}))
+
+    rows = ResultSink(directory, resume=True).read()
+    assert list(rows.columns) == ['AccountID', 'a', 'b']
+    assert rows['a'].tolist()[0] == 'x,"y"' and rows['b'].tolist()[1] == 2.5
+
+    # A crash after the rewritten file was written but before the index committed it
+    pd.DataFrame({'AccountID': [9], 'c': [1]}).to_csv(os.path.join(directory, CSV_FILE + '.tmp'), index=False)
+    resumed = ResultSink(directory, resume=True)
+    assert not os.path.exists(os.path.join(directory, CSV_FILE + '.tmp'))
+    assert list(resumed.read().columns) == ['AccountID', 'a', 'b']
+
+
+def test_input_fingerprint_tracks_bills_and_rates():
+    base_dir = os.path.abspath(os.path.join(HERE, '..'))
+    charges = pd.read_csv(os.path.join(base_dir, 'charge_config.csv'))
+    with open(os.path.join(base_dir, 'charge_history.json'), 'r') as f:
+        history = json.load(f)
+    bills = pd.DataFrame({
+        'AccountID': [1, 1],
+        'DateFrom': pd.to_datetime(['2025-03-11', '2025-04-16']),
+        'DateTo': pd.to_datetime(['2025-04-16', '2025-05-15']),
+        'Usage': [120000, 128627],
+        'Demand': [400.8, 382.0],
+        'BillAmount': [15396.57, 17230.93],
+    })
+
+    fingerprint = input_fingerprint(bills, history, charges)
+    assert fingerprint == input_fingerprint(bills.copy(), json.loads(json.dumps(history)), charges)
+
+    revised = bills.copy()
+    revised.loc[1, 'Usage'] = 128628
+    assert input_fingerprint(revised, history, charges)['bills'] != fingerprint['bills']
+
+    history['ServiceCharge_Table'][-1]['Rate'] = '72.00000'
+    changed = input_fingerprint(bills, history, charges)
+    assert changed['rates'] != fingerprint['rates']
+    assert changed['bills'] == fingerprint['bills']